@@ -0,0 +1,260 @@
+"""
+In-process stand-in for an MQTT broker and paho-mqtt clients.
+
+FakeBroker.client is a client_factory for TelemetrySubscriber: the clients it
+returns implement the part of paho's Client API the subscriber uses, connect
+as soon as their loop starts, and receive whatever is published to the broker
+on a topic they subscribed to.
+
+Run as a script, it checks the dashboard's MQTT live path end to end without
+a broker: it starts bench/fake_vm.py, loads the dashboard in-process with
+mqtt_live enabled, and verifies connect -> subscribe -> message -> snapshot
+update:
+
+    python bench/fake_mqtt.py
+"""
+
+import argparse
+import json
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import yaml
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+DASHBOARD_DIR = os.path.join(REPO_DIR, 'dashboard')
+
+
+def topic_matches(pattern, topic):
+    """MQTT topic filter matching with + (one level) and # (the rest)"""
+    pattern_levels = pattern.split('/')
+    topic_levels = topic.split('/')
+    for index, level in enumerate(pattern_levels):
+        if level == '#':
+            return True
+        if index >= len(topic_levels) or (level != '+' and level != topic_levels[index]):
+            return False
+    return len(pattern_levels) == len(topic_levels)
+
+
+class FakeMessage:
+    def __init__(self, topic, payload, qos=0):
+        self.topic = topic
+        self.payload = payload
+        self.qos = qos
+
+
+class FakeClient:
+    """The subset of paho.mqtt.client.Client used by TelemetrySubscriber"""
+
+    def __init__(self, broker, client_id):
+        self.broker = broker
+        self.client_id = client_id
+        self.credentials = None
+        self.address = None
+        self.subscriptions = {}
+        self.connected = False
+        self.on_connect = None
+        self.on_disconnect = None
+        self.on_message = None
+
+    def username_pw_set(self, username, password=None):
+        self.credentials = (username, password)
+
+    def reconnect_delay_set(self, min_delay=1, max_delay=120):
+        pass
+
+    def connect_async(self, host, port=1883, keepalive=60):
+        self.address = (host, port)
+
+    def loop_start(self):
+        # paho connects from its network thread; so does the fake
+        threading.Thread(target=self._connect, name=f"fake-mqtt-{self.client_id}", daemon=True).start()
+
+    def _connect(self):
+        rc = self.broker.connect(self)
+        self.connected = rc == 0
+        if self.on_connect:
+            self.on_connect(self, None, {}, rc)
+
+    def loop_stop(self):
+        pass
+
+    def disconnect(self):
+        self.broker.disconnect(self)
+        if self.connected and self.on_disconnect:
+            self.on_disconnect(self, None, 0)
+        self.connected = False
+
+    def subscribe(self, topic, qos=0):
+        self.subscriptions[topic] = qos
+        return 0, len(self.subscriptions)
+
+    def deliver(self, topic, payload):
+        if self.on_message and any(topic_matches(pattern, topic) for pattern in self.subscriptions):
+            self.on_message(self, None, FakeMessage(topic, payload))
+
+
+class FakeBroker:
+    """Routes published messages to connected FakeClients"""
+
+    def __init__(self, refuse=False):
+        self.refuse = refuse
+        self.clients = []
+        self._lock = threading.Lock()
+
+    def client(self, client_id):
+        """client_factory for TelemetrySubscriber"""
+        return FakeClient(self, client_id)
+
+    def connect(self, client):
+        if self.refuse:
+            return 5  # Not authorized
+        with self._lock:
+            self.clients.append(client)
+        return 0
+
+    def disconnect(self, client):
+        with self._lock:
+            if client in self.clients:
+                self.clients.remove(client)
+
+    def publish(self, topic, payload):
+        """Deliver a message to every subscribed client; returns how many got it"""
+        if isinstance(payload, (dict, list)):
+            payload = json.dumps(payload)
+        if isinstance(payload, str):
+            payload = payload.encode('utf-8')
+        with self._lock:
+            clients = list(self.clients)
+        receivers = 0
+        for client in clients:
+            if any(topic_matches(pattern, topic) for pattern in client.subscriptions):
+                client.deliver(topic, payload)
+                receivers += 1
+        return receivers
+
+
+def wait_until(condition, timeout, what):
+    deadline = time.time() + timeout
+    while not condition():
+        if time.time() > deadline:
+            raise SystemExit(f"FAIL: {what}")
+        time.sleep(0.05)
+    print(f"ok   {what}")
+
+
+def expect(condition, what):
+    if not condition:
+        raise SystemExit(f"FAIL: {what}")
+    print(f"ok   {what}")
+
+
+def write_config(workdir, vm_port):
+    with open(os.path.join(REPO_DIR, 'config/config.yml'), 'r') as file:
+        config = yaml.safe_load(file)
+
+    config['victoria_metrics']['port'] = vm_port
+    dashboard = config['dashboard']
+    dashboard['tank_settings_file'] = os.path.join(workdir, 'tank_settings.json')
+    dashboard.setdefault('metrics', {})['directory'] = os.path.join(workdir, 'metrics')
+    dashboard.setdefault('query_scheduler', {})['lock_directory'] = os.path.join(workdir, 'slots')
+    dashboard.setdefault('hot_tier', {})['enabled'] = False
+    dashboard.setdefault('rollups', {}).update(enabled=False, path=os.path.join(workdir, 'rollups.db'))
+    dashboard.setdefault('alerts', {}).update(enabled=False, state_file=os.path.join(workdir, 'alerts.json'))
+    dashboard.setdefault('mqtt_live', {})['enabled'] = True
+
+    path = os.path.join(workdir, 'config.yml')
+    with open(path, 'w') as file:
+        yaml.safe_dump(config, file, sort_keys=False)
+    return path
+
+
+def check(workdir, devices):
+    from run import free_port, wait_for
+
+    vm_port = free_port()
+    log = open(os.path.join(workdir, 'fake_vm.log'), 'w')
+    vm = subprocess.Popen(
+        [sys.executable, os.path.join(BENCH_DIR, 'fake_vm.py'), '--port', str(vm_port), '--devices', str(devices),
+         '--history-days', '1'],
+        stdout=log, stderr=subprocess.STDOUT)
+    try:
+        wait_for(f"http://127.0.0.1:{vm_port}/health", 30, vm)
+
+        os.environ['SYHUB_CONFIG'] = write_config(workdir, vm_port)
+        sys.path.insert(0, DASHBOARD_DIR)
+        import app as dashboard
+        from mqtt_live import TelemetrySubscriber
+
+        # Same subscriber the dashboard builds, connected to the fake broker
+        broker = FakeBroker()
+        subscriber = TelemetrySubscriber(
+            host=dashboard.mqtt_live_config.get('host', 'localhost'),
+            port=dashboard.config['mqtt']['port'],
+            topic=dashboard.config['mqtt']['topic_telemetry'],
+            on_reading=dashboard.on_live_reading,
+            username=dashboard.config['mqtt'].get('username'),
+            password=dashboard.config['mqtt'].get('password'),
+            client_factory=broker.client,
+        )
+        dashboard.mqtt_subscriber = subscriber
+        client = dashboard.app.test_client()
+
+        # The first request starts the per-worker services, MQTT included
+        client.get('/health')
+        wait_until(lambda: subscriber.stats["connected"], 5, "connect")
+        wait_until(lambda: any(subscriber.topic in c.subscriptions for c in broker.clients),
+                   5, f"subscribe to {subscriber.topic}")
+
+        with dashboard.snapshot_poller.subscribe() as subscription:
+            wait_until(lambda: subscription.wait(1) is not None, 30, "initial snapshot from VM")
+
+            device_id = 'plt-001'
+            timestamp = int(time.time()) + 1
+            delivered = broker.publish(subscriber.topic, {
+                "deviceID": device_id, "timestamp": timestamp * 1000, "pH": "4.321", "temperature": "31.5"})
+            expect(delivered == 1 and subscriber.stats["messages"] == 1, "message handled")
+
+            snapshot = subscription.wait(5)
+            device = snapshot["devices"][device_id] if snapshot else {}
+            expect(device.get("pH") == 4.321 and device.get("temperature") == 31.5
+                   and device.get("timestamp") == timestamp, "snapshot update pushed to subscribers")
+
+        latest = client.get(f'/api/latest?device={device_id}').get_json()
+        expect(latest.get("pH") == 4.321, "/api/latest serves the MQTT reading")
+    finally:
+        vm.send_signal(signal.SIGINT)
+        try:
+            vm.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            vm.kill()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the dashboard's MQTT live path against a fake broker")
+    parser.add_argument('--devices', type=int, default=3, help="Devices in the fake VM (default 3)")
+    parser.add_argument('--keep', action='store_true', help="Keep the temporary config and logs")
+    args = parser.parse_args()
+
+    sys.path.insert(0, BENCH_DIR)
+    workdir = tempfile.mkdtemp(prefix='plantomio-mqtt-')
+    try:
+        check(workdir, args.devices)
+        print("MQTT live path OK")
+    finally:
+        if args.keep:
+            print(f"Logs and config kept in {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,409 @@
+"""
+Fake VictoriaMetrics server for the benchmarks.
+
+Serves the parts of the VM HTTP API the dashboard and ingest service use
+(/health, /api/v1/query, /api/v1/query_range, /api/v1/series,
+/api/v1/export and /api/v1/import/prometheus) from synthetic series, so the
+dashboard can be load tested without a VM install or real data. Values are a
+deterministic function of device, metric and timestamp, generated with NumPy
+on request, so series never run out and every run sees the same data. Each
+request can be delayed by a fixed latency plus jitter to mimic a busy Pi.
+
+Supported PromQL is limited to plain selectors such as
+{__name__=~"pH|EC",device="plt-001"}, tlast_over_time(<selector>[Ns]),
+the device registry's min(tfirst_over_time(<selector>[Ns])) by (device) and
+the min/max/avg/sum/count/stddev_over_time(<selector>[Ns]) rollups;
+anything else is answered with 422. Like VM, instant queries return the
+evaluation time with each value, not the sample's time. Devices can be
+taken offline some time before startup to exercise stale readings.
+
+GET /bench/stats returns request counts per path and the number of imported
+samples, which the runner uses to count VM queries per scenario.
+
+    python bench/fake_vm.py --port 18428 --devices 20 --interval 10 --history-days 3
+"""
+
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+
+METRICS = ["temperature", "pH", "EC", "TDS", "distance", "ORP"]
+
+# (base, amplitude) per metric, roughly what a Plantomio tank reports
+METRIC_SHAPES = {
+    "temperature": (22.0, 3.0),
+    "pH": (6.5, 0.4),
+    "EC": (1.8, 0.3),
+    "TDS": (900.0, 150.0),
+    "distance": (1.5, 0.6),  # Metres from the sensor to the water
+    "ORP": (350.0, 60.0),
+}
+
+ROLLUP_FUNCTIONS = {"min": np.min, "max": np.max, "avg": np.mean, "sum": np.sum, "count": len, "stddev": np.std}
+
+# VM's default lookback for instant and range queries
+LOOKBACK = 300
+
+EXPORT_BLOCK = 5000  # Samples per exported JSON line, like VM's export blocks
+
+TLAST = re.compile(r'^\s*tlast_over_time\((.*)\[(\d+)s\]\)\s*(keep_metric_names)?\s*$')
+ROLLUP = re.compile(r'^\s*(min|max|avg|sum|count|stddev)_over_time\((.*)\[(\d+)s\]\)\s*(keep_metric_names)?\s*$')
+# The live snapshot's query: latest values, plus sample times tagged with a label
+WITH_TIMES = re.compile(r'^\s*(.*?)\s+or\s+label_set\(\s*(tlast_over_time\(.*\)\s*keep_metric_names)\s*,\s*"(\w+)"\s*,\s*"(\w*)"\s*\)\s*$')
+TFIRST = re.compile(r'^\s*min\s*\(\s*tfirst_over_time\((.*)\[(\d+)s\]\)\s*\)\s*by\s*\(\s*device\s*\)\s*$')
+SELECTOR = re.compile(r'^\s*([A-Za-z_:][\w:]*)?\s*(?:\{(.*)\})?\s*$')
+MATCHER = re.compile(r'(\w+)\s*(=~|!~|!=|=)\s*"((?:[^"\\]|\\.)*)"')
+STEP = re.compile(r'^(\d+(?:\.\d+)?)([smhd]?)$')
+STEP_UNITS = {"": 1, "s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+def parse_selector(query):
+    """Parse a plain series selector into (label, op, value) matchers; None if unsupported"""
+    match = SELECTOR.match(query)
+    if not match or not (match.group(1) or match.group(2) is not None):
+        return None
+    matchers = [("__name__", "=", match.group(1))] if match.group(1) else []
+    body = match.group(2) or ''
+    for matcher in MATCHER.finditer(body):
+        value = matcher.group(3).replace('\\"', '"').replace('\\\\', '\\')
+        matchers.append((matcher.group(1), matcher.group(2), value))
+    if MATCHER.sub('', body).replace(',', '').strip():
+        return None
+    return matchers
+
+
+def rollup_labels(labels, rollup):
+    """Rollup functions drop the metric name unless keep_metric_names is given"""
+    if rollup.group(4):
+        return labels
+    return {name: label for name, label in labels.items() if name != '__name__'}
+
+
+def parse_step(value, default=300):
+    match = STEP.match(value or '')
+    if not match:
+        return default
+    return max(1, int(float(match.group(1)) * STEP_UNITS[match.group(2)]))
+
+
+def matches(labels, matchers):
+    for name, op, value in matchers:
+        actual = labels.get(name, '')
+        if op == '=' and actual != value:
+            return False
+        if op == '!=' and actual == value:
+            return False
+        if op == '=~' and not re.fullmatch(value, actual):
+            return False
+        if op == '!~' and re.fullmatch(value, actual):
+            return False
+    return True
+
+
+class SyntheticSeries:
+    """
+    Every device reports every metric once per interval from `first` onwards,
+    up to its time in `stopped` for devices that went offline.
+    """
+
+    def __init__(self, devices, interval, first, stopped=None):
+        self.devices = devices
+        self.interval = interval
+        self.first = first - first % interval
+        self.stopped = {device: last - last % interval for device, last in (stopped or {}).items()}
+
+        self._labels = [{"__name__": metric, "device": device} for metric in METRICS for device in devices]
+        rng = np.random.default_rng(42)
+        self._phase = {(labels["__name__"], labels["device"]): rng.uniform(0, 2 * np.pi) for labels in self._labels}
+
+    def select(self, matchers):
+        return [labels for labels in self._labels if matches(labels, matchers)]
+
+    def timestamps(self, start, end, device=None):
+        """Sample timestamps of a device in (start, end]"""
+        first = max(self.first, int(start) - int(start) % self.interval + self.interval)
+        end = min(int(end), self.stopped.get(device, int(end)))
+        return np.arange(first, end + 1, self.interval, dtype=np.int64)
+
+    def values(self, labels, timestamps):
+        base, amplitude = METRIC_SHAPES[labels["__name__"]]
+        phase = self._phase[(labels["__name__"], labels["device"])]
+        t = timestamps.astype(np.float64)
+        # A daily cycle plus deterministic noise
+        noise = np.sin(t * 12.9898 + phase * 78.233) * 43758.5453
+        noise -= np.floor(noise)
+        return np.round(base + amplitude * np.sin(2 * np.pi * t / 86400 + phase) + amplitude * 0.1 * (noise - 0.5), 3)
+
+    def rollup(self, labels, function, window, times):
+        """function_over_time(<series>[window]) at each time, NaN where the window holds no samples"""
+        times = np.asarray(times, dtype=np.int64)
+        if len(times) == 0:
+            return np.empty(0)
+        sample_times = self.timestamps(times[0] - window, times[-1], labels["device"])
+        values = self.values(labels, sample_times)
+        lows = np.searchsorted(sample_times, times - window, side='right')
+        highs = np.searchsorted(sample_times, times, side='right')
+        reduce = ROLLUP_FUNCTIONS[function]
+        return np.array([float(reduce(values[low:high])) if high > low else np.nan for low, high in zip(lows, highs)])
+
+    def last_at(self, times, device=None, lookback=LOOKBACK):
+        """Timestamp of a device's newest sample at or before each time, or -1 past the lookback"""
+        times = np.asarray(times, dtype=np.int64)
+        latest = times - times % self.interval
+        if device in self.stopped:
+            latest = np.minimum(latest, self.stopped[device])
+        return np.where((latest >= self.first) & (times - latest <= lookback), latest, -1)
+
+
+class FakeVM(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, series, latency=0.0, jitter=0.0):
+        super().__init__(address, Handler)
+        self.series = series
+        self.latency = latency
+        self.jitter = jitter
+
+        self.lock = threading.Lock()
+        self.requests = {}
+        self.imported_samples = 0
+
+    def count(self, path):
+        with self.lock:
+            self.requests[path] = self.requests.get(path, 0) + 1
+
+    def delay(self):
+        if self.latency or self.jitter:
+            time.sleep(self.latency + random.uniform(0, self.jitter))
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, code, body=b'', content_type='application/json'):
+        self.send_response(code)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _json(self, data, code=200):
+        self._send(code, json.dumps(data).encode('utf-8'))
+
+    def _bad_query(self, query):
+        self._json({"status": "error", "errorType": "bad_data",
+                    "error": f"fake VM only supports plain selectors, got {query!r}"}, 422)
+
+    def _first_samples(self, tfirst, at):
+        """Oldest sample time per device within the window, as min(tfirst_over_time(...)) by (device)"""
+        matchers = parse_selector(tfirst.group(1))
+        if matchers is None:
+            return self._bad_query(tfirst.group(0))
+        series = self.server.series
+        firsts = {}
+        for labels in series.select(matchers):
+            times = series.timestamps(at - int(tfirst.group(2)), at, labels["device"])
+            if len(times):
+                firsts[labels["device"]] = min(firsts.get(labels["device"], int(times[0])), int(times[0]))
+        result = [{"metric": {"device": device}, "value": [at, repr(float(first))]} for device, first in sorted(firsts.items())]
+        return self._json({"status": "success", "data": {"resultType": "vector", "result": result}})
+
+    def _instant_result(self, query, at):
+        """Result vector of a selector, tlast_over_time or rollup instant query; None if unsupported"""
+        series = self.server.series
+        tlast = TLAST.match(query)
+        rollup = ROLLUP.match(query)
+        matchers = parse_selector(tlast.group(1) if tlast else rollup.group(2) if rollup else query)
+        if matchers is None:
+            return None
+        result = []
+        for labels in series.select(matchers):
+            if rollup:
+                value = float(series.rollup(labels, rollup.group(1), int(rollup.group(3)), [int(at)])[0])
+                if value == value:
+                    result.append({"metric": rollup_labels(labels, rollup), "value": [at, repr(value)]})
+                continue
+            if tlast:
+                timestamp = int(series.last_at([int(at)], labels["device"], int(tlast.group(2)))[0])
+                value = timestamp
+                if not tlast.group(3):
+                    labels = {name: label for name, label in labels.items() if name != '__name__'}
+            else:
+                timestamp = int(series.last_at([int(at)], labels["device"])[0])
+                value = float(series.values(labels, np.array([timestamp]))[0])
+            if timestamp >= 0:
+                # VM stamps instant query results with the evaluation time
+                result.append({"metric": labels, "value": [at, repr(value)]})
+        return result
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self.server.count(url.path)
+        self.server.delay()
+        if url.path == '/api/v1/import/prometheus':
+            samples = sum(1 for line in body.splitlines() if line.strip() and not line.startswith(b'#'))
+            with self.server.lock:
+                self.server.imported_samples += samples
+            return self._send(204)
+        self._json({"error": "not found"}, 404)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = parse_qs(url.query)
+        series = self.server.series
+
+        if url.path == '/bench/stats':
+            with self.server.lock:
+                return self._json({"requests": dict(self.server.requests),
+                                   "imported_samples": self.server.imported_samples})
+
+        self.server.count(url.path)
+        self.server.delay()
+        now = time.time()
+
+        if url.path == '/health':
+            return self._send(200, b'OK', 'text/plain')
+
+        if url.path == '/api/v1/query':
+            query = params.get('query', [''])[0]
+            tfirst = TFIRST.match(query)
+            if tfirst:
+                return self._first_samples(tfirst, float(params.get('time', [now])[0]))
+            at = float(params.get('time', [now])[0])
+            with_times = WITH_TIMES.match(query)
+            if with_times:
+                # The tagged series never match a plain one, so `or` keeps both sides
+                result = self._instant_result(with_times.group(1), at)
+                times = self._instant_result(with_times.group(2), at)
+                if result is not None and times is not None:
+                    result += [{"metric": dict(entry["metric"], **{with_times.group(3): with_times.group(4)}),
+                                "value": entry["value"]} for entry in times]
+            else:
+                result = self._instant_result(query, at)
+            if result is None:
+                return self._bad_query(query)
+            return self._json({"status": "success", "data": {"resultType": "vector", "result": result}})
+
+        if url.path == '/api/v1/query_range':
+            query = params.get('query', [''])[0]
+            rollup = ROLLUP.match(query)
+            matchers = parse_selector(rollup.group(2) if rollup else query)
+            if matchers is None:
+                return self._bad_query(query)
+            start = int(float(params.get('start', [now - 3600])[0]))
+            end = int(float(params.get('end', [now])[0]))
+            step = parse_step(params.get('step', [''])[0])
+            times = np.arange(start, end + 1, step, dtype=np.int64)
+            result = []
+            for labels in series.select(matchers):
+                if rollup:
+                    values = series.rollup(labels, rollup.group(1), int(rollup.group(3)), times)
+                    keep = ~np.isnan(values)
+                    values = values[keep]
+                    if len(values):
+                        result.append({"metric": rollup_labels(labels, rollup),
+                                       "values": [[int(t), repr(float(v))] for t, v in zip(times[keep], values)]})
+                    continue
+                sampled = series.last_at(times, labels["device"])
+                keep = sampled >= 0
+                values = series.values(labels, sampled[keep])
+                if len(values):
+                    result.append({"metric": labels,
+                                   "values": [[int(t), repr(float(v))] for t, v in zip(times[keep], values)]})
+            return self._json({"status": "success", "data": {"resultType": "matrix", "result": result}})
+
+        if url.path == '/api/v1/series':
+            found = []
+            for query in params.get('match[]', []):
+                matchers = parse_selector(query)
+                if matchers is None:
+                    return self._bad_query(query)
+                found.extend(labels for labels in series.select(matchers) if labels not in found)
+            return self._json({"status": "success", "data": found})
+
+        if url.path == '/api/v1/export':
+            start = float(params.get('start', [series.first])[0])
+            end = float(params.get('end', [now])[0])
+            selected = []
+            for query in params.get('match[]', []):
+                matchers = parse_selector(query)
+                if matchers is None:
+                    return self._bad_query(query)
+                selected.extend(labels for labels in series.select(matchers) if labels not in selected)
+
+            # Stream one JSON line per block of samples, chunked like VM
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/stream+json')
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+            try:
+                for labels in selected:
+                    timestamps = series.timestamps(start, end, labels["device"])
+                    values = series.values(labels, timestamps)
+                    for i in range(0, len(timestamps), EXPORT_BLOCK):
+                        line = json.dumps({
+                            "metric": labels,
+                            "values": values[i:i + EXPORT_BLOCK].tolist(),
+                            "timestamps": (timestamps[i:i + EXPORT_BLOCK] * 1000).tolist(),
+                        }).encode('utf-8') + b'\n'
+                        self.wfile.write(b'%x\r\n%s\r\n' % (len(line), line))
+                self.wfile.write(b'0\r\n\r\n')
+            except (BrokenPipeError, ConnectionResetError):
+                # The client stopped reading (e.g. a cancelled export)
+                self.close_connection = True
+            return
+
+        self._json({"error": "not found"}, 404)
+
+
+def serve(port, devices=10, interval=10, history_days=3.0, latency=0.0, jitter=0.0, host='127.0.0.1',
+          offline=0, offline_minutes=15.0):
+    """
+    Create a fake VM with `devices` devices named plt-001... (call
+    serve_forever on it); the last `offline` of them stopped reporting
+    offline_minutes before startup.
+    """
+    names = [f"plt-{i + 1:03d}" for i in range(devices)]
+    now = time.time()
+    stopped = {name: int(now - offline_minutes * 60) for name in names[devices - offline:]} if offline else {}
+    series = SyntheticSeries(names, interval, int(now - history_days * 86400), stopped)
+    return FakeVM((host, port), series, latency, jitter)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake VictoriaMetrics server with synthetic Plantomio series")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=18428)
+    parser.add_argument('--devices', type=int, default=10, help="Number of devices (default 10)")
+    parser.add_argument('--interval', type=int, default=10, help="Seconds between samples (default 10)")
+    parser.add_argument('--history-days', type=float, default=3.0, help="Days of history before startup (default 3)")
+    parser.add_argument('--latency-ms', type=float, default=0.0, help="Delay added to every request")
+    parser.add_argument('--jitter-ms', type=float, default=0.0, help="Random extra delay of up to this much")
+    parser.add_argument('--offline', type=int, default=0, help="Devices (the last ones) that stopped reporting")
+    parser.add_argument('--offline-minutes', type=float, default=15.0, help="How long before startup they stopped (default 15)")
+    args = parser.parse_args()
+
+    server = serve(args.port, args.devices, args.interval, args.history_days,
+                   args.latency_ms / 1000.0, args.jitter_ms / 1000.0, args.host,
+                   args.offline, args.offline_minutes)
+    print(f"Fake VictoriaMetrics on http://{args.host}:{args.port} ({args.devices} devices, "
+          f"{args.interval}s interval, {args.history_days:g} days)", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
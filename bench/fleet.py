@@ -0,0 +1,185 @@
+"""
+Synthetic Plantomio device fleet.
+
+Generates telemetry in the shape the devices publish ({"deviceID",
+"timestamp", "temperature", "pH", ...} with values as strings) for any
+number of devices, and either publishes it to an MQTT broker or pushes it
+through the ingest service's code path in-process:
+
+    # Publish 50 devices, one reading every 10s each, to the local broker
+    python bench/fleet.py publish --devices 50 --interval 10 --duration 300
+
+    # Ingestion throughput against a VictoriaMetrics (or bench/fake_vm.py)
+    python bench/fleet.py ingest --vm-url http://127.0.0.1:18428 --messages 20000
+
+The ingest benchmark feeds pre-encoded payloads to TelemetrySubscriber's
+message handler, which parses them and hands them to an IngestBridge writing
+to the given VM, so everything but the broker hop is measured.
+"""
+
+import argparse
+import json
+import logging
+import os
+import resource
+import sys
+import time
+
+import numpy as np
+import yaml
+
+DASHBOARD_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'dashboard')
+sys.path.insert(0, DASHBOARD_DIR)
+
+from fake_vm import METRICS, METRIC_SHAPES  # noqa: E402
+from ingest import IngestBridge, SampleBuffer  # noqa: E402
+from mqtt_live import TelemetrySubscriber  # noqa: E402
+
+DEFAULT_CONFIG = os.path.join(os.path.dirname(DASHBOARD_DIR), 'config/config.yml')
+
+
+class Fleet:
+    """Devices plt-001... whose readings drift around each metric's typical value"""
+
+    def __init__(self, devices=10, seed=1):
+        self.device_ids = [f"plt-{i + 1:03d}" for i in range(devices)]
+        self._rng = np.random.default_rng(seed)
+        self._values = np.array([[METRIC_SHAPES[metric][0] for metric in METRICS]] * devices)
+        self._steps = np.array([METRIC_SHAPES[metric][1] * 0.02 for metric in METRICS])
+
+    def tick(self, timestamp):
+        """One reading per device at timestamp (seconds), as telemetry dicts"""
+        self._values += self._rng.normal(0, 1, self._values.shape) * self._steps
+        return [
+            dict({"deviceID": device_id, "timestamp": int(timestamp * 1000)},
+                 **{metric: f"{value:.3f}" for metric, value in zip(METRICS, row)})
+            for device_id, row in zip(self.device_ids, self._values)
+        ]
+
+    def payloads(self, count, interval=10, end=None):
+        """count encoded messages, device by device and interval seconds apart, ending at `end`"""
+        end = end or time.time()
+        ticks = -(-count // len(self.device_ids))
+        payloads = []
+        for tick in range(ticks):
+            for message in self.tick(end - (ticks - 1 - tick) * interval):
+                payloads.append(json.dumps(message).encode('utf-8'))
+        return payloads[:count]
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process (ru_maxrss is KiB on Linux, bytes on macOS)"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def run_ingest(vm_url, devices, messages, batch_size=1000, flush_interval=1.0, interval=10):
+    """Push messages through the ingest path and return throughput numbers"""
+    payloads = Fleet(devices).payloads(messages, interval)
+
+    logger = logging.getLogger('bench.ingest')
+    bridge = IngestBridge(vm_url.rstrip('/') + '/api/v1/import/prometheus', SampleBuffer(50000),
+                          batch_size=batch_size, flush_interval=flush_interval, logger=logger)
+    # Never started: messages are handed to it directly instead of coming from a broker
+    subscriber = TelemetrySubscriber('localhost', 1883, 'bench', bridge.on_reading, logger=logger)
+
+    bridge.start()
+    started = time.perf_counter()
+    for payload in payloads:
+        subscriber.handle_message(payload)
+    accepted = time.perf_counter() - started
+    bridge.stop(timeout=120)
+    elapsed = time.perf_counter() - started
+
+    return {
+        "messages": len(payloads),
+        "samples": bridge.stats["samples"],
+        "written": bridge.stats["written"],
+        "batches": bridge.stats["batches"],
+        "errors": subscriber.stats["errors"] + bridge.stats["write_errors"],
+        "dropped": bridge.buffer.dropped,
+        "seconds": round(elapsed, 3),
+        "messages_per_second": round(len(payloads) / accepted, 1) if accepted else None,
+        "samples_per_second": round(bridge.stats["written"] / elapsed, 1) if elapsed else None,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def run_publish(args):
+    """Publish the fleet's readings to a broker in real time"""
+    import paho.mqtt.client as mqtt
+
+    with open(args.config, 'r') as file:
+        mqtt_config = yaml.safe_load(file).get('mqtt') or {}
+
+    if hasattr(mqtt, 'CallbackAPIVersion'):
+        client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION1, client_id=f"bench-fleet-{os.getpid()}")
+    else:
+        client = mqtt.Client(client_id=f"bench-fleet-{os.getpid()}")
+    username = args.username or mqtt_config.get('username')
+    if username:
+        client.username_pw_set(username, args.password or mqtt_config.get('password'))
+    client.connect(args.host, args.port or mqtt_config.get('port', 1883), keepalive=60)
+    client.loop_start()
+
+    topic = args.topic or mqtt_config.get('topic_telemetry', 'v1/devices/me/telemetry')
+    fleet = Fleet(args.devices)
+    published = 0
+    started = time.monotonic()
+    next_tick = started
+    try:
+        while time.monotonic() - started < args.duration:
+            for message in fleet.tick(time.time()):
+                client.publish(topic, json.dumps(message), qos=args.qos)
+                published += 1
+            next_tick += args.interval
+            time.sleep(max(0.0, next_tick - time.monotonic()))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        client.loop_stop()
+        client.disconnect()
+
+    elapsed = time.monotonic() - started
+    print(f"Published {published} messages from {args.devices} devices in {elapsed:.1f}s "
+          f"({published / elapsed:.1f} msg/s) to {topic}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Synthetic Plantomio device fleet")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    publish = commands.add_parser('publish', help="Publish telemetry to an MQTT broker")
+    publish.add_argument('--host', default='localhost')
+    publish.add_argument('--port', type=int, help="Broker port (default: mqtt.port from config.yml)")
+    publish.add_argument('--username', help="Default: mqtt.username from config.yml")
+    publish.add_argument('--password', help="Default: mqtt.password from config.yml")
+    publish.add_argument('--topic', help="Default: mqtt.topic_telemetry from config.yml")
+    publish.add_argument('--qos', type=int, default=0)
+    publish.add_argument('--devices', type=int, default=10)
+    publish.add_argument('--interval', type=float, default=10.0, help="Seconds between readings per device")
+    publish.add_argument('--duration', type=float, default=60.0, help="Seconds to publish for")
+    publish.add_argument('--config', default=os.environ.get('SYHUB_CONFIG') or DEFAULT_CONFIG)
+
+    ingest = commands.add_parser('ingest', help="Measure ingestion throughput into VictoriaMetrics")
+    ingest.add_argument('--vm-url', default='http://127.0.0.1:18428')
+    ingest.add_argument('--devices', type=int, default=10)
+    ingest.add_argument('--messages', type=int, default=20000)
+    ingest.add_argument('--batch-size', type=int, default=1000)
+    ingest.add_argument('--flush-interval', type=float, default=1.0)
+    ingest.add_argument('--json', action='store_true', help="Print the results as JSON")
+
+    args = parser.parse_args()
+    if args.command == 'publish':
+        return run_publish(args)
+
+    results = run_ingest(args.vm_url, args.devices, args.messages, args.batch_size, args.flush_interval)
+    if args.json:
+        print(json.dumps(results))
+    else:
+        for key, value in results.items():
+            print(f"{key:>20}: {value}")
+
+
+if __name__ == '__main__':
+    main()
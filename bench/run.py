@@ -0,0 +1,525 @@
+"""
+Offline benchmark and load test for the dashboard and ingest service.
+
+Starts bench/fake_vm.py, runs the dashboard under gunicorn against it with a
+temporary copy of config.yml, and measures:
+
+    latest      GET /api/latest?device=all
+    trends_1h   GET /api/trends, 1 hour at 1m steps (served from the hot tier)
+    trends_24h  GET /api/trends, 24 hours at 15m steps
+    export      GET /api/export, one metric for all devices over 24 hours as CSV
+    sse         N /api/events?device=all subscribers at once
+    ingest      telemetry through the ingest service's parser and writer (bench/fleet.py)
+
+HTTP scenarios run `--concurrency` clients (`--export-concurrency` for
+exports) in a loop for `--duration` seconds and report p50/p99 latency
+(full response) and requests per second.
+The SSE scenario reports how long subscribers wait for their first snapshot
+and how many VM queries the fan-out costs. Every scenario records the
+dashboard's peak RSS (VmHWM, reset per scenario where the kernel allows it).
+
+Results are written to bench/results/<time>-<git revision>.json and compared
+with the newest earlier result taken with the same parameters, so
+regressions between versions show up in the report:
+
+    python bench/run.py
+    python bench/run.py --devices 50 --vm-latency-ms 20 --scenarios latest,sse --sse-subscribers 200
+    python bench/run.py --compare bench/results/baseline.json --fail-on-regression
+
+Rate limits are switched off in the benchmark config, since every request
+comes from one client.
+"""
+
+import argparse
+import glob
+import json
+import math
+import os
+import platform
+import selectors
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+import requests
+import yaml
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+DASHBOARD_DIR = os.path.join(REPO_DIR, 'dashboard')
+
+SCENARIOS = ("latest", "trends_1h", "trends_24h", "export", "sse", "ingest")
+
+HTTP_SCENARIOS = {
+    "latest": "/api/latest?device=all",
+    "trends_1h": "/api/trends?metrics=temperature,pH,EC&device={device}&minutes=60&step=1m",
+    "trends_24h": "/api/trends?metrics=temperature,pH,EC,TDS,distance,ORP&device={device}&minutes=1440&step=15m",
+    "export": "/api/export?metrics=temperature&minutes=1440&format=csv",
+}
+
+# Result keys compared between runs, and whether higher is better
+COMPARED = {
+    "p50_ms": False,
+    "p99_ms": False,
+    "rps": True,
+    "first_snapshot_p99_ms": False,
+    "samples_per_second": True,
+    "peak_rss_mb": False,
+}
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_for(url, timeout, process=None):
+    """Poll url until it answers; raises if it doesn't within timeout or the process exits"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError(f"{process.args[1] if len(process.args) > 1 else process.args[0]} exited with {process.returncode}")
+        try:
+            requests.get(url, timeout=1)
+            return
+        except requests.exceptions.RequestException:
+            time.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up within {timeout}s")
+
+
+def percentile(values, q):
+    """Nearest-rank percentile of a list, in the list's unit"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q / 100.0 * len(ordered)) - 1)]
+
+
+def git_revision():
+    try:
+        revision = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIR,
+                                  capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=REPO_DIR,
+                               capture_output=True, text=True).stdout.strip()
+        return revision + ('-dirty' if dirty else '')
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+# Process memory (Linux /proc; other systems report None)
+
+def process_tree(pid):
+    """pid and all of its descendants"""
+    children = {}
+    for entry in glob.glob('/proc/[0-9]*/stat'):
+        try:
+            with open(entry, 'r') as file:
+                fields = file.read().rsplit(')', 1)[1].split()
+            children.setdefault(int(fields[1]), []).append(int(entry.split('/')[2]))
+        except (OSError, IndexError, ValueError):
+            continue
+    pids, pending = [], [pid]
+    while pending:
+        current = pending.pop()
+        pids.append(current)
+        pending.extend(children.get(current, []))
+    return pids
+
+
+def peak_rss(pid):
+    """{"peak_rss_mb": largest process, "total_peak_rss_mb": sum} over the process tree, from VmHWM"""
+    peaks = []
+    for member in process_tree(pid):
+        try:
+            with open(f'/proc/{member}/status', 'r') as file:
+                for line in file:
+                    if line.startswith('VmHWM:'):
+                        peaks.append(int(line.split()[1]) / 1024.0)
+        except OSError:
+            continue
+    if not peaks:
+        return {"peak_rss_mb": None, "total_peak_rss_mb": None}
+    return {"peak_rss_mb": round(max(peaks), 1), "total_peak_rss_mb": round(sum(peaks), 1)}
+
+
+def reset_peak_rss(pid):
+    """Reset VmHWM so the next reading covers one scenario (Linux 4.0+)"""
+    for member in process_tree(pid):
+        try:
+            with open(f'/proc/{member}/clear_refs', 'w') as file:
+                file.write('5')
+        except OSError:
+            pass
+
+
+# Services under test
+
+class Services:
+    """Fake VM and a gunicorn dashboard using a temporary config"""
+
+    def __init__(self, args):
+        self.args = args
+        self.workdir = tempfile.mkdtemp(prefix='plantomio-bench-')
+        self.vm_port = free_port()
+        self.dashboard_port = free_port()
+        self.vm_url = f"http://127.0.0.1:{self.vm_port}"
+        self.dashboard_url = f"http://127.0.0.1:{self.dashboard_port}"
+        self.vm = None
+        self.dashboard = None
+
+    def write_config(self):
+        with open(os.path.join(REPO_DIR, 'config/config.yml'), 'r') as file:
+            config = yaml.safe_load(file)
+
+        config['victoria_metrics']['port'] = self.vm_port
+        # Nothing listens there, so the Node-RED and MQTT health probes just report down
+        config['node_red']['port'] = free_port()
+        config['mqtt']['port'] = free_port()
+
+        dashboard = config['dashboard']
+        dashboard['workers'] = self.args.workers
+        dashboard['worker_class'] = self.args.worker_class
+        dashboard['rate_limits'] = {}
+        dashboard['tank_settings_file'] = os.path.join(self.workdir, 'tank_settings.json')
+        dashboard.setdefault('metrics', {})['directory'] = os.path.join(self.workdir, 'metrics')
+        # A short backfill keeps the first rollup run from competing with the scenarios
+        dashboard.setdefault('rollups', {}).update(path=os.path.join(self.workdir, 'rollups.db'), backfill_days=1)
+        dashboard.setdefault('alerts', {}).update(
+            state_file=os.path.join(self.workdir, 'alerts.json'), webhook_url='', mqtt_topic='')
+        dashboard.setdefault('mqtt_live', {})['enabled'] = False
+
+        path = os.path.join(self.workdir, 'config.yml')
+        with open(path, 'w') as file:
+            yaml.safe_dump(config, file, sort_keys=False)
+        return path
+
+    def start(self):
+        log = open(os.path.join(self.workdir, 'fake_vm.log'), 'w')
+        self.vm = subprocess.Popen(
+            [sys.executable, os.path.join(BENCH_DIR, 'fake_vm.py'), '--port', str(self.vm_port),
+             '--devices', str(self.args.devices), '--interval', str(self.args.interval),
+             '--history-days', str(self.args.history_days), '--latency-ms', str(self.args.vm_latency_ms),
+             '--jitter-ms', str(self.args.vm_jitter_ms)],
+            stdout=log, stderr=subprocess.STDOUT)
+        wait_for(self.vm_url + '/health', 30, self.vm)
+
+        environment = dict(os.environ, SYHUB_CONFIG=self.write_config())
+        command = [sys.executable, '-m', 'gunicorn', '--workers', str(self.args.workers),
+                   '--bind', f"127.0.0.1:{self.dashboard_port}", '--log-level', 'warning']
+        if self.args.worker_class != 'sync':
+            command += ['--worker-class', self.args.worker_class, '--worker-connections', '1000']
+        log = open(os.path.join(self.workdir, 'dashboard.log'), 'w')
+        self.dashboard = subprocess.Popen(command + ['app:app'], cwd=DASHBOARD_DIR, env=environment,
+                                          stdout=log, stderr=subprocess.STDOUT)
+        wait_for(self.dashboard_url + '/health', 60, self.dashboard)
+
+    def vm_stats(self):
+        return requests.get(self.vm_url + '/bench/stats', timeout=5).json()
+
+    def stop(self):
+        # SIGINT is gunicorn's quick shutdown; a graceful one waits for streams to time out
+        for process in (self.dashboard, self.vm):
+            if process is not None and process.poll() is None:
+                process.send_signal(signal.SIGINT)
+                try:
+                    process.wait(timeout=30)
+                except subprocess.TimeoutExpired:
+                    process.kill()
+        if self.args.keep:
+            print(f"Logs and config kept in {self.workdir}")
+        else:
+            shutil.rmtree(self.workdir, ignore_errors=True)
+
+
+# Scenarios
+
+def warm_up(services, devices, timeout=120):
+    """Wait until every worker has filled its hot tier, then prime each endpoint"""
+    url = services.dashboard_url
+    ready = set()
+    deadline = time.monotonic() + timeout
+    while len(ready) < services.args.workers and time.monotonic() < deadline:
+        # Any request starts a worker's background services; diagnostics says whose hot tier is ready.
+        # A new connection each time, so the requests spread over the workers
+        diagnostics = requests.get(url + '/api/diagnostics', headers={'Connection': 'close'}, timeout=10).json()
+        if (diagnostics.get('hot_tier') or {}).get('synced_to'):
+            ready.add(diagnostics['pid'])
+        else:
+            time.sleep(0.2)
+    session = requests.Session()
+    for path in HTTP_SCENARIOS.values():
+        session.get(url + path.format(device=devices[0]), timeout=60).content
+
+
+def run_http(url, paths, duration, concurrency):
+    """Request paths round robin from `concurrency` clients for `duration` seconds"""
+    latencies, statuses, sizes = [], {}, []
+    lock = threading.Lock()
+    started = time.perf_counter()
+    deadline = started + duration
+
+    def client(offset):
+        session = requests.Session()
+        count = offset
+        while time.perf_counter() < deadline:
+            path = paths[count % len(paths)]
+            count += 1
+            began = time.perf_counter()
+            try:
+                response = session.get(url + path, timeout=60)
+                status, size = response.status_code, len(response.content)
+            except requests.exceptions.RequestException as e:
+                status, size = type(e).__name__, 0
+            elapsed = time.perf_counter() - began
+            with lock:
+                latencies.append(elapsed * 1000)
+                statuses[str(status)] = statuses.get(str(status), 0) + 1
+                sizes.append(size)
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    ok = sum(count for status, count in statuses.items() if status.startswith('2'))
+    return {
+        "requests": len(latencies),
+        "errors": len(latencies) - ok,
+        "statuses": statuses,
+        "rps": round(ok / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 50), 2) if latencies else None,
+        "p99_ms": round(percentile(latencies, 99), 2) if latencies else None,
+        "max_ms": round(max(latencies), 2) if latencies else None,
+        "mean_bytes": int(sum(sizes) / len(sizes)) if sizes else 0,
+    }
+
+
+def run_sse(services, subscribers, duration):
+    """
+    Hold `subscribers` SSE streams open for `duration` seconds from one
+    selector loop. Reports connects, time to the first fleet snapshot and
+    the VM instant queries made meanwhile, which stay flat as subscribers
+    grow because each worker shares one snapshot poller.
+    """
+    queries_before = services.vm_stats()["requests"].get('/api/v1/query', 0)
+    request = (f"GET /api/events?device=all HTTP/1.0\r\nHost: 127.0.0.1:{services.dashboard_port}\r\n"
+               f"Accept: text/event-stream\r\n\r\n").encode('ascii')
+
+    selector = selectors.DefaultSelector()
+    streams = []
+    started = time.perf_counter()
+    for _ in range(subscribers):
+        stream = {"buffer": b'', "opened": time.perf_counter(), "first_snapshot": None, "messages": 0, "error": None}
+        try:
+            sock = socket.create_connection(('127.0.0.1', services.dashboard_port), timeout=10)
+            sock.sendall(request)
+            sock.setblocking(False)
+            selector.register(sock, selectors.EVENT_READ, stream)
+        except OSError as e:
+            stream["error"] = type(e).__name__
+        streams.append(stream)
+
+    deadline = started + duration
+    while selector.get_map() and time.perf_counter() < deadline:
+        for key, _ in selector.select(timeout=max(0.0, deadline - time.perf_counter())):
+            stream = key.data
+            try:
+                data = key.fileobj.recv(65536)
+            except OSError as e:
+                data, stream["error"] = b'', type(e).__name__
+            if not data:
+                selector.unregister(key.fileobj)
+                key.fileobj.close()
+                stream["error"] = stream["error"] or ("closed" if stream["messages"] else "refused")
+                continue
+            stream["buffer"] += data
+            *events, stream["buffer"] = stream["buffer"].split(b'\n\n')
+            for event in events:
+                if b'data: {"devices"' in event:
+                    stream["messages"] += 1
+                    if stream["first_snapshot"] is None:
+                        stream["first_snapshot"] = time.perf_counter() - stream["opened"]
+    for key in list(selector.get_map().values()):
+        selector.unregister(key.fileobj)
+        key.fileobj.close()
+    elapsed = time.perf_counter() - started
+
+    queries = services.vm_stats()["requests"].get('/api/v1/query', 0) - queries_before
+    first = [stream["first_snapshot"] * 1000 for stream in streams if stream["first_snapshot"] is not None]
+    errors = {}
+    for stream in streams:
+        if stream["error"]:
+            errors[stream["error"]] = errors.get(stream["error"], 0) + 1
+    return {
+        "subscribers": subscribers,
+        "received_snapshot": len(first),
+        "errors": errors,
+        "snapshots": sum(stream["messages"] for stream in streams),
+        "first_snapshot_p50_ms": round(percentile(first, 50), 1) if first else None,
+        "first_snapshot_p99_ms": round(percentile(first, 99), 1) if first else None,
+        "vm_queries": queries,
+        "vm_queries_per_second": round(queries / elapsed, 2),
+    }
+
+
+def run_ingest(services, devices, messages):
+    """Ingestion throughput, measured in its own process so its RSS is its own"""
+    imported_before = services.vm_stats()["imported_samples"]
+    output = subprocess.run(
+        [sys.executable, os.path.join(BENCH_DIR, 'fleet.py'), 'ingest', '--vm-url', services.vm_url,
+         '--devices', str(devices), '--messages', str(messages), '--json'],
+        capture_output=True, text=True, check=True).stdout
+    results = json.loads(output.strip().splitlines()[-1])
+    results["vm_received"] = services.vm_stats()["imported_samples"] - imported_before
+    return results
+
+
+# Reporting
+
+def matching_result(directory, params, exclude):
+    """Newest saved result taken with the same parameters"""
+    for path in sorted(glob.glob(os.path.join(directory, '*.json')), reverse=True):
+        if os.path.abspath(path) == os.path.abspath(exclude):
+            continue
+        try:
+            with open(path, 'r') as file:
+                previous = json.load(file)
+        except (OSError, ValueError):
+            continue
+        if previous.get('params') == params:
+            return path, previous
+    return None, None
+
+
+def compare(current, previous, threshold):
+    """Lines describing changes beyond threshold (a fraction); regressions are marked"""
+    lines, regressions = [], 0
+    for name, results in current["scenarios"].items():
+        before = previous.get("scenarios", {}).get(name) or {}
+        for key, higher_is_better in COMPARED.items():
+            old, new = before.get(key), results.get(key)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            if abs(change) < threshold:
+                continue
+            worse = change < 0 if higher_is_better else change > 0
+            regressions += worse
+            lines.append(f"  {'REGRESSION' if worse else 'improved  '} {name}.{key}: {old} -> {new} ({change:+.0%})")
+    return lines, regressions
+
+
+def print_results(results):
+    for name, scenario in results["scenarios"].items():
+        if "rps" in scenario:
+            print(f"{name:>12}: {scenario['rps']:>8} req/s  p50 {scenario['p50_ms']} ms  p99 {scenario['p99_ms']} ms  "
+                  f"errors {scenario['errors']}  peak RSS {scenario['peak_rss_mb']} MB")
+        elif "subscribers" in scenario:
+            print(f"{name:>12}: {scenario['received_snapshot']}/{scenario['subscribers']} subscribers  "
+                  f"first snapshot p50 {scenario['first_snapshot_p50_ms']} ms  p99 {scenario['first_snapshot_p99_ms']} ms  "
+                  f"VM queries/s {scenario['vm_queries_per_second']}  peak RSS {scenario['peak_rss_mb']} MB")
+        else:
+            print(f"{name:>12}: {scenario['samples_per_second']} samples/s  {scenario['messages_per_second']} msg/s  "
+                  f"errors {scenario['errors']}  peak RSS {scenario['peak_rss_mb']} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline dashboard and ingest benchmarks")
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS), help=f"Comma separated subset of {','.join(SCENARIOS)}")
+    parser.add_argument('--devices', type=int, default=10, help="Devices in the fake VM and the fleet (default 10)")
+    parser.add_argument('--interval', type=int, default=10, help="Seconds between samples (default 10)")
+    parser.add_argument('--history-days', type=float, default=3.0, help="History held by the fake VM (default 3)")
+    parser.add_argument('--vm-latency-ms', type=float, default=0.0, help="Latency added to every fake VM request")
+    parser.add_argument('--vm-jitter-ms', type=float, default=0.0, help="Random extra fake VM latency of up to this much")
+    parser.add_argument('--workers', type=int, default=2, help="Gunicorn workers (default 2)")
+    parser.add_argument('--worker-class', default='gevent', help="Gunicorn worker class (default gevent; sync can't hold many SSE streams)")
+    parser.add_argument('--duration', type=float, default=10.0, help="Seconds per HTTP scenario (default 10)")
+    parser.add_argument('--concurrency', type=int, default=8, help="Concurrent HTTP clients (default 8)")
+    parser.add_argument('--export-concurrency', type=int, default=1,
+                        help="Concurrent export clients (default 1; more mostly measures the export queue's 503s)")
+    parser.add_argument('--sse-subscribers', type=int, default=100, help="SSE subscribers (default 100)")
+    parser.add_argument('--sse-seconds', type=float, default=15.0, help="Seconds the SSE streams are held open (default 15)")
+    parser.add_argument('--ingest-messages', type=int, default=20000, help="Telemetry messages for the ingest scenario")
+    parser.add_argument('--output', default=os.path.join(BENCH_DIR, 'results'), help="Directory for result files")
+    parser.add_argument('--compare', help="Result file to compare with (default: newest in --output with the same parameters)")
+    parser.add_argument('--threshold', type=float, default=20.0, help="Percent change reported as a difference (default 20)")
+    parser.add_argument('--fail-on-regression', action='store_true', help="Exit with status 1 if anything regressed")
+    parser.add_argument('--keep', action='store_true', help="Keep the temporary config and logs")
+    args = parser.parse_args()
+
+    scenarios = [name.strip() for name in args.scenarios.split(',') if name.strip()]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+
+    params = {key: getattr(args, key) for key in (
+        'scenarios', 'devices', 'interval', 'history_days', 'vm_latency_ms', 'vm_jitter_ms', 'workers',
+        'worker_class', 'duration', 'concurrency', 'export_concurrency', 'sse_subscribers', 'sse_seconds', 'ingest_messages')}
+    devices = [f"plt-{i + 1:03d}" for i in range(args.devices)]
+    results = {
+        "revision": git_revision(),
+        "timestamp": datetime.now().isoformat(timespec='seconds'),
+        "host": {"platform": platform.platform(), "python": platform.python_version(), "cpus": os.cpu_count()},
+        "params": params,
+        "scenarios": {},
+    }
+
+    services = Services(args)
+    try:
+        print(f"Starting fake VM ({args.devices} devices) and dashboard ({args.workers} {args.worker_class} workers)...")
+        services.start()
+        warm_up(services, devices)
+        pid = services.dashboard.pid
+
+        for name in scenarios:
+            print(f"Running {name}...")
+            reset_peak_rss(pid)
+            if name in HTTP_SCENARIOS:
+                paths = [HTTP_SCENARIOS[name].format(device=device) for device in devices]
+                concurrency = args.export_concurrency if name == 'export' else args.concurrency
+                scenario = run_http(services.dashboard_url, paths, args.duration, concurrency)
+            elif name == 'sse':
+                scenario = run_sse(services, args.sse_subscribers, args.sse_seconds)
+            else:
+                scenario = run_ingest(services, args.devices, args.ingest_messages)
+            if name != 'ingest':
+                scenario.update(peak_rss(pid))
+            results["scenarios"][name] = scenario
+    finally:
+        services.stop()
+
+    os.makedirs(args.output, exist_ok=True)
+    path = os.path.join(args.output, f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{results['revision']}.json")
+    with open(path, 'w') as file:
+        json.dump(results, file, indent=2)
+
+    print()
+    print_results(results)
+    print(f"\nSaved {path}")
+
+    if args.compare:
+        with open(args.compare, 'r') as file:
+            previous_path, previous = args.compare, json.load(file)
+    else:
+        previous_path, previous = matching_result(args.output, params, path)
+    if previous is None:
+        print("No earlier result with the same parameters to compare with")
+        return 0
+
+    lines, regressions = compare(results, previous, args.threshold / 100.0)
+    print(f"Compared with {os.path.basename(previous_path)} ({previous.get('revision')}):")
+    print('\n'.join(lines) if lines else f"  no changes beyond {args.threshold:g}%")
+    return 1 if regressions and args.fail_on_regression else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
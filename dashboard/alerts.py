@@ -0,0 +1,332 @@
+"""
+Threshold and staleness alerts evaluated in the dashboard service.
+
+Rules come from the dashboard.alerts section of config.yml and are checked
+against every live snapshot as it is published, so alerts fire without an
+open browser tab and without querying history: each (rule, device) pair
+keeps one small state record (ok, pending or firing, since when, last value).
+
+Only one worker evaluates (an flock on <state file>.lock, taken over by
+another worker if the holder dies). It writes states and recent alert events
+atomically to the state file, which every worker reads to stream alerts to
+its SSE clients; the file also carries states across restarts. Firing and
+resolved events are additionally POSTed to a webhook and/or published over
+MQTT.
+"""
+
+import fcntl
+import json
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+try:
+    import paho.mqtt.publish as mqtt_publish
+except ImportError:  # paho-mqtt is optional unless alerts are published over MQTT
+    mqtt_publish = None
+
+MAX_EVENTS = 100
+
+
+class Rule:
+    """
+    One alert rule. Threshold rules fire when a metric leaves [min, max]
+    (either bound optional; a string bound names a tank setting such as
+    alertLevel) and resolve once it is back inside by `hysteresis`. Stale
+    rules fire when a device's newest sample is older than max_age seconds
+    (or it sent nothing at all); a device whose values dropped out of VM's
+    lookback still counts as fresh until then. A condition has to hold for
+    `for` seconds before the rule fires.
+    """
+
+    def __init__(self, options):
+        self.name = options['name']
+        self.type = options.get('type', 'threshold')
+        self.metric = options.get('metric')
+        self.min = options.get('min')
+        self.max = options.get('max')
+        self.hysteresis = options.get('hysteresis', 0)
+        self.for_seconds = options.get('for', 0)
+        self.max_age = options.get('max_age', 300)
+        self.devices = options.get('devices')
+        self.severity = options.get('severity', 'warning')
+
+        if self.type not in ('threshold', 'stale'):
+            raise ValueError(f"Alert rule {self.name}: unknown type {self.type}")
+        if self.type == 'threshold' and (not self.metric or (self.min is None and self.max is None)):
+            raise ValueError(f"Alert rule {self.name}: threshold rules need a metric and min and/or max")
+
+    @staticmethod
+    def _bound(bound, settings):
+        return settings.get(bound) if isinstance(bound, str) else bound
+
+    def check(self, timestamp, values, firing, settings, now):
+        """
+        Return (breached, value, threshold) for one device; breached is None
+        if it can't be judged. timestamp is the device's newest sample time,
+        None if it has none.
+        """
+        if self.type == 'stale':
+            if timestamp is None:
+                return True, None, self.max_age
+            age = now - timestamp
+            return age > (self.max_age if not firing else self.max_age - self.hysteresis), age, self.max_age
+
+        value = values.get(self.metric)
+        if value is None:
+            return None, None, None
+
+        # Firing rules only resolve once the value is back inside the band by the hysteresis margin
+        margin = self.hysteresis if firing else 0
+        low, high = self._bound(self.min, settings), self._bound(self.max, settings)
+        if low is not None and value < low + margin:
+            return True, value, low
+        if high is not None and value > high - margin:
+            return True, value, high
+        return False, value, low if low is not None else high
+
+
+class Notifier:
+    """Delivers alert events to a webhook and/or an MQTT topic in the background"""
+
+    def __init__(self, webhook_url=None, mqtt_topic=None, mqtt_options=None, timeout=5, logger=None):
+        self.webhook_url = webhook_url
+        self.mqtt_topic = mqtt_topic
+        self.mqtt_options = mqtt_options or {}
+        self.timeout = timeout
+        self.logger = logger
+
+        # One delivery at a time so a slow webhook never holds up evaluation
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="alert-notifier")
+
+    def send(self, event):
+        if self.webhook_url or self.mqtt_topic:
+            self._executor.submit(self._deliver, event)
+
+    def _deliver(self, event):
+        payload = json.dumps(event)
+        if self.webhook_url:
+            try:
+                requests.post(self.webhook_url, data=payload, headers={'Content-Type': 'application/json'},
+                              timeout=self.timeout).raise_for_status()
+            except Exception as e:
+                if self.logger:
+                    self.logger.error(f"Error posting alert to webhook: {str(e)}")
+        if self.mqtt_topic:
+            try:
+                if mqtt_publish is None:
+                    raise RuntimeError("paho-mqtt is not installed")
+                options = self.mqtt_options
+                auth = {'username': options['username'], 'password': options.get('password')} if options.get('username') else None
+                mqtt_publish.single(self.mqtt_topic, payload, qos=1, hostname=options.get('host', 'localhost'),
+                                    port=options.get('port', 1883), auth=auth)
+            except Exception as e:
+                if self.logger:
+                    self.logger.error(f"Error publishing alert over MQTT: {str(e)}")
+
+
+class AlertEngine:
+    """Evaluates the rules on one worker and shares the results through the state file"""
+
+    def __init__(self, rules, path, notifier=None, check_interval=30, logger=None):
+        self.rules = [Rule(options) for options in rules]
+        self.path = path
+        self.notifier = notifier
+        self.check_interval = check_interval
+        self.logger = logger
+
+        self._lock = threading.Lock()
+        self._lock_file = None
+        self._thread_pid = None
+        self._states = {}   # "rule|device" -> {"state", "since", "value", "changed_at"}
+        self._events = []
+        self._seq = 0
+        self._mtime = None
+        self._checked_at = 0.0
+
+    # Shared state file
+
+    def _reload(self):
+        """Re-read the state file if another worker changed it (at most once a second)"""
+        now = time.monotonic()
+        if now - self._checked_at < 1.0:
+            return
+        self._checked_at = now
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+            if mtime == self._mtime:
+                return
+            with open(self.path, 'r') as file:
+                data = json.load(file)
+        except (OSError, ValueError):
+            return
+        self._states = data.get('states', {})
+        self._events = data.get('events', [])
+        self._seq = data.get('seq', 0)
+        self._mtime = mtime
+
+    def _write(self):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.alerts.')
+        try:
+            with os.fdopen(fd, 'w') as file:
+                json.dump({"seq": self._seq, "states": self._states, "events": self._events}, file)
+            os.replace(temp_path, self.path)
+        except Exception:
+            os.unlink(temp_path)
+            raise
+        self._mtime = os.stat(self.path).st_mtime_ns
+
+    def sequence(self):
+        """Sequence number of the newest alert event"""
+        with self._lock:
+            self._reload()
+            return self._seq
+
+    def events_since(self, seq):
+        """Alert events newer than seq, oldest first"""
+        with self._lock:
+            self._reload()
+            return [event for event in self._events if event["seq"] > seq]
+
+    def active(self):
+        """The latest firing event of every rule and device that is still firing"""
+        with self._lock:
+            self._reload()
+            firing = {key for key, state in self._states.items() if state["state"] == "firing"}
+            latest = {}
+            for event in self._events:
+                key = f"{event['rule']}|{event['device']}"
+                if key in firing and event["state"] == "firing":
+                    latest[key] = event
+            return sorted(latest.values(), key=lambda event: event["seq"])
+
+    def recent(self):
+        """Recent alert events, newest first"""
+        with self._lock:
+            self._reload()
+            return list(reversed(self._events))
+
+    # Evaluation (leader only)
+
+    def evaluate(self, devices, settings, now=None):
+        """
+        Update the rule states from {device_id: (timestamp, values)} and
+        return the events for rules that fired or resolved. Values may be
+        None (NaN or no data); threshold rules skip those devices.
+        """
+        now = now or time.time()
+        events = []
+        with self._lock:
+            changed = False
+            for rule in self.rules:
+                for device_id, (timestamp, values) in devices.items():
+                    if rule.devices and device_id not in rule.devices:
+                        continue
+                    key = f"{rule.name}|{device_id}"
+                    state = self._states.get(key) or {"state": "ok", "since": None, "value": None, "changed_at": None}
+                    firing = state["state"] == "firing"
+
+                    breached, value, threshold = rule.check(timestamp, values, firing, settings, now)
+                    if breached is None:
+                        continue
+
+                    new_state = state["state"]
+                    if breached and not firing:
+                        if state["state"] != "pending":
+                            new_state, state["since"] = "pending", now
+                        if now - state["since"] >= rule.for_seconds:
+                            new_state = "firing"
+                    elif not breached:
+                        new_state = "ok"
+
+                    state["value"] = value
+                    if new_state != state["state"]:
+                        changed = True
+                        previous, state["state"], state["changed_at"] = state["state"], new_state, now
+                        if new_state == "ok":
+                            state["since"] = None
+                        if new_state == "firing" or (new_state == "ok" and previous == "firing"):
+                            self._seq += 1
+                            events.append({
+                                "seq": self._seq,
+                                "rule": rule.name,
+                                "device": device_id,
+                                "state": "firing" if new_state == "firing" else "resolved",
+                                "severity": rule.severity,
+                                "metric": rule.metric if rule.type == 'threshold' else None,
+                                "value": value,
+                                "threshold": threshold,
+                                "timestamp": int(now)
+                            })
+                    self._states[key] = state
+
+            if events:
+                self._events = (self._events + events)[-MAX_EVENTS:]
+            if changed:
+                try:
+                    self._write()
+                except OSError as e:
+                    if self.logger:
+                        self.logger.error(f"Error writing alert state: {str(e)}")
+
+        for event in events:
+            if self.logger:
+                self.logger.warning(f"Alert {event['state']}: {event['rule']} on {event['device']} "
+                                    f"(value {event['value']}, threshold {event['threshold']})")
+            if self.notifier is not None:
+                self.notifier.send(event)
+        return events
+
+    def _acquire(self):
+        """Take the evaluator lock without blocking; True if this process holds it"""
+        if self._lock_file is not None:
+            return True
+        lock_file = open(self.path + '.lock', 'w')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+
+        # Pick up where the previous evaluator left off
+        with self._lock:
+            self._checked_at = 0.0
+            self._mtime = None
+            self._reload()
+        return True
+
+    def start(self, poller, read_devices, read_settings):
+        """
+        Evaluate in a background thread (once per process) whenever poller
+        publishes a snapshot, and at least every check_interval seconds.
+        read_devices(snapshot) -> {device_id: (timestamp, values)}.
+        """
+        with self._lock:
+            if self._thread_pid == os.getpid():
+                return
+            self._thread_pid = os.getpid()
+        threading.Thread(target=self._run, args=(poller, read_devices, read_settings),
+                         name="alert-engine", daemon=True).start()
+
+    def _run(self, poller, read_devices, read_settings):
+        # Wait until this worker is the evaluator
+        while not self._acquire():
+            time.sleep(self.check_interval)
+
+        # Subscribing keeps the poller fetching snapshots while no browser is connected
+        with poller.subscribe(internal=True) as subscription:
+            while True:
+                snapshot = subscription.wait(timeout=self.check_interval) or poller.latest()
+                if snapshot is None:
+                    continue
+                try:
+                    self.evaluate(read_devices(snapshot), read_settings())
+                except Exception as e:
+                    if self.logger:
+                        self.logger.error(f"Error evaluating alerts: {str(e)}")
@@ -8,15 +8,44 @@ Key changes:
 """
 
 import os
+import csv
+import gzip
+import hashlib
+import io
+import ipaddress
+import tempfile
 import json
 import time
 import yaml
-import requests
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from flask import Flask, render_template, request, Response, jsonify, stream_with_context
+from flask import Flask, render_template, request, Response, g, jsonify, stream_with_context
+from alerts import AlertEngine, Notifier
+from cache import ResponseCache
+from derived import DERIVED_METRICS, water_level
+from device_registry import DeviceRegistry
+from health import HealthProber, ap_mode_probe, http_probe, tcp_probe
+from downsample import MODES as DOWNSAMPLE_MODES, downsample
+from encoding import (FORMATS as PAYLOAD_FORMATS, BINARY_MIMETYPE, encode_binary,
+                      parse_vm_values, to_columnar, to_point_list)
+from hot_tier import HotTier
+from instrumentation import LATENCY_BUCKETS, POINT_BUCKETS, SIZE_BUCKETS, Registry
+from live import SnapshotPoller
+from mqtt_live import LiveState, TelemetrySubscriber
+from rollups import RollupStore
+from scheduler import Overloaded, QueryScheduler, RateLimiter
+from stats import parse_stats, reduce as reduce_stats, rollup_query
+from tank_settings import TankSettings
+from vm_client import VMClient, series_selector
 
-# Load config
-config_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'config/config.yml')
+try:
+    import brotli
+except ImportError:  # brotli is optional; gzip is always available
+    brotli = None
+
+# Load config (SYHUB_CONFIG points at another file, e.g. for the benchmarks in bench/)
+config_path = os.environ.get('SYHUB_CONFIG') or os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'config/config.yml')
 with open(config_path, 'r') as file:
     config = yaml.safe_load(file)
 
@@ -27,118 +56,638 @@ NODERED_URL = f"http://localhost:{config['node_red']['port']}"
 VICTORIA_URL = f"http://localhost:{config['victoria_metrics']['port']}"
 PROJECT_NAME = config['project']['name']
 UPDATE_INTERVAL = 60  # Update interval in seconds
+WORKER_CLASS = config['dashboard'].get('worker_class', 'sync')
+
+# Sync workers are killed after gunicorn's 30s timeout, so their SSE streams
+# must end before that; gevent workers can hold a stream much longer
+SSE_MAX_SECONDS = config['dashboard'].get('sse_max_seconds', 25 if WORKER_CLASS == 'sync' else 300)
+VM_QUERY_CONCURRENCY = config['dashboard'].get('vm_query_concurrency', 3)  # Parallel range queries per worker
+
+# Admission control: per-class concurrency and priority for VM requests (live > range > export)
+scheduler_config = config['dashboard'].get('query_scheduler') or {}
+query_scheduler = None
+if scheduler_config.get('enabled', True):
+    query_scheduler = QueryScheduler.from_config(
+        scheduler_config, os.path.join(tempfile.gettempdir(), f"{PROJECT_NAME}-dashboard-slots")
+    )
 
-# Available metrics and their last known values
-metrics = {
-    "temperature": {"value": 0, "last_updated": None},
-    "pH": {"value": 0, "last_updated": None},
-    "EC": {"value": 0, "last_updated": None},
-    "TDS": {"value": 0, "last_updated": None},
-    "waterLevel": {"value": 0, "last_updated": None},
-    "distance": {"value": 0, "last_updated": None},
-    "ORP": {"value": 0, "last_updated": None}
+# Keep-alive client used for all VictoriaMetrics traffic from this worker
+vm_client = VMClient.from_config(VICTORIA_URL, config['dashboard'].get('vm_client'), query_scheduler)
+
+# Per-client token buckets for the expensive endpoints, keyed by route
+rate_limiters = {
+    f"/api/{name}": RateLimiter(options.get('per_minute', 60), options.get('burst', 10))
+    for name, options in (config['dashboard'].get('rate_limits') or {}).items()
 }
 
-# Tank configuration with default values
-tank_config = {
+# Peers allowed to name the client in X-Real-IP (nginx); anyone else could spoof it
+TRUSTED_PROXIES = [
+    ipaddress.ip_network(proxy, strict=False)
+    for proxy in config['dashboard'].get('trusted_proxies', ['127.0.0.1', '::1'])
+]
+
+def client_address():
+    """The client to rate limit: X-Real-IP from a trusted proxy, otherwise the peer address"""
+    real_ip = request.headers.get('X-Real-IP')
+    if real_ip and request.remote_addr:
+        try:
+            peer = ipaddress.ip_address(request.remote_addr)
+        except ValueError:
+            return request.remote_addr
+        if any(peer in network for network in TRUSTED_PROXIES):
+            return real_ip
+    return request.remote_addr
+
+# Prometheus metrics for /metrics, merged across workers through per-pid files
+metrics_config = config['dashboard'].get('metrics') or {}
+metrics_registry = Registry(
+    metrics_config.get('directory') or os.path.join(tempfile.gettempdir(), f"{PROJECT_NAME}-dashboard-metrics")
+)
+metrics_registry.describe('dashboard_http_requests_total', 'counter', 'HTTP requests by route, method and status')
+metrics_registry.describe('dashboard_http_request_duration_seconds', 'histogram',
+                          'Time to produce a response (streams: until the first byte)', LATENCY_BUCKETS)
+metrics_registry.describe('dashboard_http_response_size_bytes', 'histogram', 'Response body size after compression', SIZE_BUCKETS)
+metrics_registry.describe('dashboard_response_points', 'histogram', 'Points encoded per computed (uncached) time-series response', POINT_BUCKETS)
+metrics_registry.describe('dashboard_encode_duration_seconds', 'histogram', 'Time spent encoding time-series payloads', LATENCY_BUCKETS)
+metrics_registry.describe('dashboard_export_rows_total', 'counter', 'Rows streamed by /api/export by format')
+metrics_registry.describe('dashboard_vm_request_duration_seconds', 'histogram', 'VictoriaMetrics request latency by query type', LATENCY_BUCKETS)
+metrics_registry.describe('dashboard_vm_request_errors_total', 'counter', 'Failed VictoriaMetrics requests by query type')
+metrics_registry.describe('dashboard_sse_subscribers', 'gauge', 'Open /api/events streams')
+metrics_registry.describe('dashboard_sse_streams_total', 'counter', '/api/events streams opened')
+metrics_registry.describe('dashboard_response_cache_requests_total', 'counter', 'Response cache lookups by result (hit, miss, coalesced)')
+metrics_registry.describe('dashboard_response_cache_evictions_total', 'counter', 'Response cache entries evicted to stay under the size cap')
+metrics_registry.describe('dashboard_response_cache_bytes', 'gauge', 'Bytes held by the response cache')
+metrics_registry.describe('dashboard_hot_tier_requests_total', 'counter', 'Trend lookups in the in-memory hot tier by result (hit, miss)')
+metrics_registry.describe('dashboard_hot_tier_bytes', 'gauge', 'Bytes allocated for hot tier ring buffers')
+# Every worker probes the services itself, so these are combined rather than summed
+metrics_registry.describe('dashboard_service_up', 'gauge', 'Last background health probe per service (1 ok, 0 otherwise; 0 if any worker saw it down)', merge='min')
+metrics_registry.describe('dashboard_service_probe_seconds', 'gauge', 'Duration of the last background health probe per service (slowest worker)', merge='max')
+metrics_registry.describe('dashboard_vm_queue_requests_total', 'counter', 'VictoriaMetrics requests by scheduling class and result (admitted, rejected)')
+metrics_registry.describe('dashboard_vm_queue_wait_seconds_total', 'counter', 'Time VictoriaMetrics requests spent waiting for a slot by scheduling class')
+metrics_registry.describe('dashboard_rate_limited_total', 'counter', 'Requests rejected by the per-client rate limits by route')
+
+def record_vm_request(query_type, elapsed, error):
+    """VMClient observer: latency and errors per query type"""
+    metrics_registry.observe('dashboard_vm_request_duration_seconds', elapsed, {"query_type": query_type})
+    if error:
+        metrics_registry.inc('dashboard_vm_request_errors_total', {"query_type": query_type})
+
+vm_client.add_observer(record_vm_request)
+
+# Cache for /api/trends and /api/query responses, bounded by body size
+response_cache_config = config['dashboard'].get('response_cache') or {}
+response_cache = ResponseCache(
+    max_bytes=int(response_cache_config.get('max_mb', 16) * 1024 * 1024),
+    max_ttl=response_cache_config.get('max_ttl', 3600)
+)
+
+# Responses of these types larger than COMPRESS_MIN_BYTES are compressed
+COMPRESSIBLE_MIMETYPES = {'application/json', BINARY_MIMETYPE}
+COMPRESS_MIN_BYTES = 1024
+
+# Server-side downsampling limits for max_points requests
+downsample_config = config['dashboard'].get('downsample') or {}
+DOWNSAMPLE_MAX_POINTS = downsample_config.get('max_points_limit', 5000)
+DOWNSAMPLE_MODE = downsample_config.get('default_mode', 'lttb')
+
+# Shared pool for range queries, bounded so a multi-metric request can't swamp VM
+range_query_pool = ThreadPoolExecutor(max_workers=VM_QUERY_CONCURRENCY, thread_name_prefix="vm-range")
+
+# Last known metric values and sample time per device, used when VM is unreachable
+last_known_values = {}
+last_sample_times = {}
+
+# Metrics included in the live snapshot
+LATEST_METRICS = ["temperature", "pH", "EC", "TDS", "distance", "ORP"]
+
+# How far back the live snapshot looks for each device's last sample time
+# (at least an hour, and as long as the longest stale alert rule's max_age)
+LAST_SAMPLE_WINDOW = max([3600] + [
+    rule.get('max_age', 300)
+    for rule in (config['dashboard'].get('alerts') or {}).get('rules') or []
+    if rule.get('type') == 'stale'
+])
+
+# Recent raw samples per device and metric, held in memory to answer short trend windows
+hot_tier_config = config['dashboard'].get('hot_tier') or {}
+hot_tier = None
+if hot_tier_config.get('enabled', True):
+    hot_tier = HotTier(
+        vm_client,
+        LATEST_METRICS,
+        capacity=hot_tier_config.get('max_points_per_series', 10800),
+        window=int(hot_tier_config.get('window_hours', 24) * 3600),
+        logger=app.logger
+    )
+
+# Stats of derived metrics are reduced from every raw sample of their sources,
+# so /api/stats only allows them over windows about the size of the hot tier
+DERIVED_STATS_MAX_MINUTES = int(config['dashboard'].get('derived_stats_max_hours', hot_tier_config.get('window_hours', 24)) * 60)
+
+# max_points windows up to this long are reduced from raw samples; longer ones
+# are bucketed inside VictoriaMetrics so a worker never holds months of samples
+DOWNSAMPLE_MAX_RAW_MINUTES = int(downsample_config.get('max_raw_hours', hot_tier_config.get('window_hours', 24)) * 60)
+
+# Hourly/daily rollups in SQLite, used for long windows with hour-multiple steps
+rollup_config = config['dashboard'].get('rollups') or {}
+rollup_store = None
+if rollup_config.get('enabled', True):
+    rollup_store = RollupStore(
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), rollup_config.get('path', 'rollups.db')),
+        vm_client,
+        rollup_config.get('metrics') or LATEST_METRICS,
+        backfill_days=rollup_config.get('backfill_days', 365),
+        settle=rollup_config.get('settle', 300),
+        overlap=rollup_config.get('overlap', 3600),
+        max_chunks_per_run=rollup_config.get('max_days_per_run', 30),
+        logger=app.logger
+    )
+
+# Tank configuration defaults, persisted to a file shared by all workers once changed
+TANK_DEFAULTS = {
     "maxDistance": 3.0,  # m when tank is empty (0%)
     "minDistance": 0.3,    # m when tank is full (100%)
     "alertLevel": 10       # % alert level
 }
+tank_config_store = TankSettings(
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), config['dashboard'].get('tank_settings_file', 'tank_settings.json')),
+    TANK_DEFAULTS,
+    logger=app.logger
+)
 
 # Calculate water level percentage based on distance and tank configuration
 def calculate_water_level(distance):
-    max_distance = tank_config["maxDistance"]
-    min_distance = tank_config["minDistance"]
+    # Same formula the trend endpoints apply to whole waterLevel series
+    return float(water_level(distance, tank_config_store.get()))
+
+def derived_labels(metric, device_id):
+    """Series labels reported for a derived metric"""
+    return {"__name__": metric, "device": device_id} if device_id else {"__name__": metric}
+
+# Step suffixes accepted by VictoriaMetrics, in seconds
+STEP_UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400, 'w': 604800}
+
+def default_step(minutes):
+    """Pick a range query step for a time window"""
+    if minutes >= 10080:  # 7 days
+        return '2h'
+    elif minutes >= 1440:  # 24 hours
+        return '15m'
+    elif minutes >= 720:  # 12 hours
+        return '8m'
+    return '1m'
+
+def parse_step_seconds(step):
+    """Convert a step such as '15m' or '30' to seconds, or None if it can't be parsed"""
+    try:
+        if step[-1] in STEP_UNITS:
+            seconds = int(float(step[:-1]) * STEP_UNITS[step[-1]])
+        else:
+            seconds = int(float(step))
+    except (ValueError, IndexError, TypeError):
+        return None
+    return seconds if seconds > 0 else None
+
+def snap_window(minutes, step):
+    """
+    Return (start, end, step_seconds) for the last `minutes`, with both ends
+    aligned down to the step grid. Unparseable steps are passed through
+    unaligned with step_seconds None.
+    """
+    now = int(time.time())
+    start = now - (minutes * 60)
+    step_seconds = parse_step_seconds(step)
+    if not step_seconds:
+        return start, now, None
+    return start - start % step_seconds, now - now % step_seconds, step_seconds
+
+def to_json_body(payload):
+    """Serialize a response payload once so it can be cached as bytes"""
+    return json.dumps(payload, separators=(',', ':')).encode('utf-8')
+
+def cached_response(cache_key, ttl, compute, mimetype='application/json'):
+    """Serve a response body through the response cache (no key means no caching)"""
+    if cache_key is None:
+        body, _ = compute()
+        cache_status = "BYPASS"
+    else:
+        body, cache_status = response_cache.get_or_compute(cache_key, ttl, compute)
+    
+    response = Response(body, mimetype=mimetype)
+    response.headers['X-Cache'] = cache_status
+    if cache_key is not None:
+        # Lets compress_response reuse the compressed body kept in the cache
+        response.cache_entry = (cache_key, body)
+    return response
+
+def parse_format_args():
+    """Read the payload format (points, columnar, binary) and binary value type"""
+    payload_format = request.args.get('format', 'points')
+    if payload_format not in PAYLOAD_FORMATS:
+        raise ValueError(f"Unsupported format: {payload_format}")
+    
+    value_type = request.args.get('dtype', 'f64')
+    if value_type not in ('f32', 'f64'):
+        raise ValueError(f"Unsupported dtype: {value_type}")
+    return payload_format, value_type
+
+def cursor_scope(device_id, metric_names):
+    """Short hash of the device and metrics a cursor's points belong to"""
+    key = device_id + '|' + ','.join(sorted(metric_names))
+    return hashlib.sha1(key.encode()).hexdigest()[:12]
+
+def parse_incremental_args(minutes, start, end, step_seconds, settings_version, scope):
+    """
+    Resolve ?cursor=<token> (from a previous response) or ?since=<timestamp>
+    for incremental chart updates. Returns (fetch_start, reset): series are
+    fetched from fetch_start, and reset tells the client to replace its
+    points instead of merging the new ones in. scope is the cursor_scope()
+    of the request; a cursor from another device or metric set resets.
+    """
+    cursor = request.args.get('cursor')
+    since = request.args.get('since')
+    if not step_seconds or (cursor is None and since is None):
+        return start, True
     
-    # Handle invalid configurations
-    if max_distance <= min_distance:
-        return 50.0  # Return default if configuration is invalid
+    if cursor is not None:
+        try:
+            since, cursor_step, cursor_minutes, cursor_version, cursor_scope_ = cursor.split(':')
+            cursor_step, cursor_minutes = int(cursor_step), int(cursor_minutes)
+        except ValueError:
+            # Unreadable cursors start over with the whole window
+            return start, True
+        # The client's points are on another grid, window, tank configuration or series
+        if (cursor_step, cursor_minutes, cursor_version, cursor_scope_) != (
+                step_seconds, minutes, str(settings_version or 0), scope):
+            return start, True
     
-    # Calculate percentage (reverse scale - shorter distance means higher water level)
-    level = ((max_distance - distance) / (max_distance - min_distance)) * 100
+    # First grid point after since
+    try:
+        since = int(float(since))
+    except (ValueError, OverflowError):
+        return start, True
+    fetch_start = (since // step_seconds + 1) * step_seconds
     
-    # Clamp to 0-100 range
-    return max(0, min(100, level))
+    # Too far behind (or ahead) to merge; send the whole window
+    if fetch_start <= start or fetch_start > end + step_seconds:
+        return start, True
+    return fetch_start, False
 
-def get_current_values():
-    """Query VictoriaMetrics for the latest data points for each metric"""
-    now = int(time.time())
+def make_cursor(minutes, end, step_seconds, settings_version, scope):
+    """
+    Cursor for the next incremental request. It points one step before end
+    so the last point, which may still change, is sent again.
+    """
+    if not step_seconds:
+        return None
+    return f"{end - step_seconds}:{step_seconds}:{minutes}:{settings_version or 0}:{scope}"
+
+def record_points(count):
+    """Observe the number of points in a computed time-series response"""
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    metrics_registry.observe('dashboard_response_points', count, {"route": route})
+
+def encode_series_map(series, payload_format, value_type, meta=None):
+    """Encode {metric: (timestamps, values)} for /api/trends in the requested format, with meta keys added"""
+    record_points(sum(len(arrays[0]) for arrays in series.values()))
+    with metrics_registry.time('dashboard_encode_duration_seconds', {"format": payload_format}):
+        if payload_format == 'binary':
+            return encode_binary(series, value_type, meta)
+        if payload_format == 'columnar':
+            data = {metric: to_columnar(*arrays) for metric, arrays in series.items()}
+            return to_json_body(dict({"status": "success", "format": "columnar", "data": data}, **(meta or {})))
+        data = {metric: to_point_list(*arrays) for metric, arrays in series.items()}
+        return to_json_body(dict({"status": "success", "data": data}, **(meta or {})))
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.before_request
+def enforce_rate_limits():
+    """Answer 429 when a client exceeds the rate limit of an expensive endpoint"""
+    limiter = rate_limiters.get(request.url_rule.rule) if request.url_rule else None
+    if limiter is None:
+        return None
+    # Behind nginx every request comes from localhost; it passes the client in X-Real-IP
+    wait = limiter.check(client_address())
+    if not wait:
+        return None
+    response = jsonify({"status": "error", "message": "Too many requests"})
+    response.status_code = 429
+    response.headers['Retry-After'] = str(wait)
+    return response
+
+@app.errorhandler(Overloaded)
+def vm_overloaded(e):
+    """Shed load with 503 when VictoriaMetrics queries can't get a slot in time"""
+    response = jsonify({"status": "error", "message": str(e)})
+    response.status_code = 503
+    response.headers['Retry-After'] = str(e.retry_after)
+    return response
+
+# Registered before compress_response so it runs after it and sees the final size
+@app.after_request
+def record_request_metrics(response):
+    """Count the request and observe its latency and response size"""
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    metrics_registry.inc('dashboard_http_requests_total',
+                         {"route": route, "method": request.method, "status": str(response.status_code)})
+    started = g.get('request_started')
+    if started is not None:
+        metrics_registry.observe('dashboard_http_request_duration_seconds', time.perf_counter() - started,
+                                 {"route": route, "method": request.method})
+    if not response.is_streamed and response.content_length is not None:
+        metrics_registry.observe('dashboard_http_response_size_bytes', response.content_length, {"route": route})
+    metrics_registry.maybe_write()
+    return response
+
+@app.after_request
+def compress_response(response):
+    """gzip (or brotli, if installed) larger API bodies for clients that accept it"""
+    if (response.direct_passthrough or response.is_streamed
+            or response.status_code != 200
+            or 'Content-Encoding' in response.headers
+            or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+        return response
     
-    # Get the device list from VM
-    devices = get_device_list()
+    cache_entry = getattr(response, 'cache_entry', None)
+    body = cache_entry[1] if cache_entry is not None else response.get_data()
+    if len(body) < COMPRESS_MIN_BYTES:
+        return response
+    
+    if brotli is not None and request.accept_encodings['br']:
+        encoding, encode = 'br', lambda data: brotli.compress(data, quality=4)
+    elif request.accept_encodings['gzip']:
+        encoding, encode = 'gzip', lambda data: gzip.compress(data, compresslevel=5)
+    else:
+        return response
+    
+    # Cached bodies are compressed once per encoding and kept with the entry
+    if cache_entry is not None:
+        response.set_data(response_cache.encoded(cache_entry[0], body, encoding, encode))
+    else:
+        response.set_data(encode(body))
+    response.headers['Content-Encoding'] = encoding
+    
+    response.vary.add('Accept-Encoding')
+    return response
+
+def parse_downsample_args(minutes, metric_names):
+    """
+    Read the optional max_points (alias pixels) and downsample query parameters.
+    Returns (max_points, mode), with max_points None when no reduction was asked for.
+    Derived metrics can only be reduced over windows short enough to read raw.
+    """
+    max_points = request.args.get('max_points') or request.args.get('pixels')
+    if not max_points:
+        return None, None
+    
+    try:
+        max_points = int(max_points)
+    except ValueError:
+        raise ValueError("max_points must be an integer")
+    if max_points < 3:
+        raise ValueError("max_points must be at least 3")
+    max_points = min(max_points, DOWNSAMPLE_MAX_POINTS)
+    
+    mode = request.args.get('downsample', DOWNSAMPLE_MODE)
+    if mode not in DOWNSAMPLE_MODES:
+        raise ValueError(f"Unsupported downsample mode: {mode}")
     
-    # Return early if no devices
-    if not devices:
-        return {
-            "deviceID": None,
-            "lastUpdate": datetime.now().isoformat(),
-            "timestamp": now
-        }
+    derived = [metric for metric in metric_names if metric in DERIVED_METRICS]
+    if derived and minutes > DOWNSAMPLE_MAX_RAW_MINUTES:
+        raise ValueError(f"max_points for {', '.join(derived)} is limited to the last {DOWNSAMPLE_MAX_RAW_MINUTES} minutes")
+    return max_points, mode
+
+def fetch_raw_series(metric, device_id, start, end):
+    """
+    Fetch native-resolution samples of the first series matching metric/device.
+    Returns (labels, timestamps, values) with timestamps in seconds as NumPy arrays.
+    """
+    # Windows held by the hot tier are served from memory
+    if hot_tier is not None:
+        hot = hot_tier.raw(device_id, metric, start, end)
+        if hot is not None:
+            labels = {"__name__": metric, "device": device_id} if len(hot[0]) else None
+            return (labels,) + hot
+    
+    selector = series_selector([metric], [device_id] if device_id else None)
+    
+    labels = None
+    timestamp_chunks = []
+    value_chunks = []
+    for block in vm_client.iter_export(selector, start, end, query_type="range"):
+        # Like the range queries, only the first series is used
+        if labels is None:
+            labels = block.get('metric', {})
+        elif block.get('metric', {}) != labels:
+            continue
+        timestamp_chunks.append(np.array(block.get('timestamps', []), dtype=np.float64) / 1000.0)
+        value_chunks.append(np.array(block.get('values', []), dtype=np.float64))
+    
+    if not timestamp_chunks:
+        return None, np.empty(0), np.empty(0)
+    
+    timestamps = np.concatenate(timestamp_chunks)
+    values = np.concatenate(value_chunks)
+    order = np.argsort(timestamps, kind='stable')
+    return labels, timestamps[order], values[order]
+
+def fetch_bucketed_series(metric, device_id, start, end, max_points, mode):
+    """
+    Reduce a stored metric inside VictoriaMetrics, for windows too long to read
+    raw: the min and max of each bucket for minmax, the average otherwise (LTTB
+    then picks from four times as many averaged buckets).
+    Returns (labels, timestamps, values) like fetch_raw_series.
+    """
+    selector = series_selector([metric], [device_id] if device_id else None)
+    buckets = {'minmax': max(1, max_points // 2), 'avg': max_points}.get(mode, max_points * 4)
+    width = max(60, -(-(end - start) // buckets))
+    
+    labels = None
+    timestamp_parts = []
+    value_parts = []
+    for stat in (('min', 'max') if mode == 'minmax' else ('mean',)):
+        # Each point covers the bucket ending at it; it is stamped with the bucket start
+        response = vm_client.query_range(rollup_query(stat, selector, width), start + width, end, f"{width}s")
+        response.raise_for_status()
+        for series in response.json().get('data', {}).get('result') or []:
+            # Like the raw export, only the first series is used
+            if labels is None:
+                labels = series.get('metric', {})
+            elif series.get('metric', {}) != labels:
+                continue
+            timestamps, values = parse_vm_values(series.get('values', []))
+            timestamp_parts.append(timestamps - width)
+            value_parts.append(values)
+    
+    if not timestamp_parts:
+        return None, np.empty(0), np.empty(0)
+    timestamps = np.concatenate(timestamp_parts)
+    values = np.concatenate(value_parts)
+    order = np.argsort(timestamps, kind='stable')
+    return (labels,) + downsample(timestamps[order], values[order], max_points, mode)
+
+def fetch_reduced_series(metric, device_id, start, end, max_points, mode):
+    """A stored metric reduced to at most max_points points, as (labels, timestamps, values)"""
+    if end - start > DOWNSAMPLE_MAX_RAW_MINUTES * 60:
+        return fetch_bucketed_series(metric, device_id, start, end, max_points, mode)
+    labels, timestamps, values = fetch_raw_series(metric, device_id, start, end)
+    return (labels,) + downsample(timestamps, values, max_points, mode)
+
+def fetch_downsampled_series(metric, device_id, start, end, max_points, mode):
+    """Fetch a metric and reduce it to at most max_points points"""
+    derived = DERIVED_METRICS.get(metric)
+    if derived is None:
+        return fetch_reduced_series(metric, device_id, start, end, max_points, mode)[1:]
+    # Derived metrics are computed at native resolution, then reduced
+    # (parse_downsample_args keeps their windows short enough to read raw)
+    sources = {source: fetch_raw_series(source, device_id, start, end)[1:] for source in derived.sources}
+    timestamps, values = derived.compute(sources, tank_config_store.get())
+    return downsample(timestamps, values, max_points, mode)
+
+def parse_sample(value):
+    """Parse a VM sample value, returning None for NaN or unparseable values"""
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    return None if value != value else value
+
+def query_vector(query, now):
+    """Run an instant query and yield (device_id, metric_name, value, labels) for the snapshot metrics"""
+    response = vm_client.query(query, now)
+    response.raise_for_status()
+    for series in response.json().get('data', {}).get('result') or []:
+        labels = series.get('metric', {})
+        device_id = labels.get('device')
+        metric_name = labels.get('__name__')
+        if device_id and metric_name in LATEST_METRICS and 'value' in series:
+            yield device_id, metric_name, series['value'][1], labels
+
+def fetch_latest_samples():
+    """
+    Latest value and sample time of each metric on every device from
+    VictoriaMetrics, as ({device_id: {metric_name: value}},
+    {device_id: {metric_name: timestamp}}). NaN samples have the value None;
+    metrics whose last sample is older than VM's lookback have a time but no
+    value entry.
+    """
+    now = int(time.time())
+    values = {}
+    sample_times = {}
+    
+    # One instant query per tick for all metrics and devices, grouped by
+    # device below. An instant query's timestamps are its evaluation time, so
+    # the sample times come from tlast_over_time, tagged sample="time" so they
+    # can't be matched away by `or` and can be told apart from the values;
+    # its longer window also finds devices that went quiet longer ago than
+    # VM's lookback
+    selector = series_selector(LATEST_METRICS)
+    query = (f'{selector} or label_set(tlast_over_time({selector}[{LAST_SAMPLE_WINDOW}s]) keep_metric_names, '
+             f'"sample", "time")')
+    for device_id, metric_name, value, labels in query_vector(query, now):
+        # Keep the first series per device and metric
+        if labels.get('sample') == 'time':
+            sample_times.setdefault(device_id, {}).setdefault(metric_name, int(float(value)))
+        else:
+            values.setdefault(device_id, {}).setdefault(metric_name, parse_sample(value))
+    return values, sample_times
+
+def get_fleet_values():
+    """Query VictoriaMetrics for the latest data point of each metric on every device"""
+    try:
+        values, sample_times = fetch_latest_samples()
+    except Exception as e:
+        app.logger.error(f"Error querying latest metrics: {str(e)}")
+        
+        # Use the last known values where available, otherwise report null
+        return build_fleet_snapshot({
+            device_id: build_device_snapshot(device_id, {
+                metric_name: last_known_values.get(device_id, {}).get(metric_name)
+                for metric_name in LATEST_METRICS
+            }, last_sample_times.get(device_id))
+            for device_id in get_device_list()
+        })
+    return build_fleet_values(values, sample_times)
+
+def build_fleet_values(values, sample_times):
+    """
+    Fleet snapshot from fetch_latest_samples(), listing known devices without
+    readings too. NaN samples stay in the snapshot as null.
+    """
+    devices = {}
+    for device_id in list(values) + [d for d in sample_times if d not in values]:
+        device_values = values.get(device_id, {})
+        device_times = sample_times.get(device_id, {})
+        timestamp = max(device_times.values()) if device_times else None
+        last_known_values.setdefault(device_id, {}).update(
+            {name: value for name, value in device_values.items() if value is not None})
+        if timestamp is not None:
+            last_sample_times[device_id] = timestamp
+            device_registry.observe(device_id, timestamp, device_values.keys())
+        devices[device_id] = build_device_snapshot(device_id, device_values, timestamp)
     
-    # Use the first device or a provided default
-    device_id = devices[0]
+    # Known devices without a recent reading are still listed
+    for device_id in get_device_list():
+        if device_id not in devices:
+            devices[device_id] = build_device_snapshot(device_id, {}, None)
     
+    return build_fleet_snapshot(devices)
+
+def build_device_snapshot(device_id, values, timestamp):
+    """
+    Snapshot of one device: its metric values, reading timestamp and waterLevel.
+    lastSample is the time of the device's newest sample, or None if it sent
+    nothing within LAST_SAMPLE_WINDOW; timestamp falls back to now then.
+    """
     result = {
         "deviceID": device_id,
         "lastUpdate": datetime.now().isoformat(),
-        "timestamp": now
+        "timestamp": timestamp if timestamp is not None else int(time.time()),
+        "lastSample": timestamp
     }
+    result.update(values)
+    add_water_level(result)
+    return result
+
+def build_fleet_snapshot(devices):
+    """Combine per-device snapshots; the fleet timestamp is the newest reading"""
+    # Devices without any reading don't move the fleet timestamp, so SSE
+    # clients watching the whole fleet aren't sent unchanged snapshots
+    timestamps = [d["timestamp"] for d in devices.values() if any(name in d for name in LATEST_METRICS)]
+    return {
+        "devices": devices,
+        "lastUpdate": datetime.now().isoformat(),
+        "timestamp": max(timestamps) if timestamps else int(time.time())
+    }
+
+def select_device(fleet, device_id=None):
+    """
+    Pick one device's snapshot from a fleet snapshot. Without a device id the
+    first known device is used, like the single-device dashboard always did.
+    Returns None for an unknown device.
+    """
+    if device_id is not None:
+        return fleet["devices"].get(device_id)
     
-    # Query each metric individually with improved error handling
-    available_metrics = ["temperature", "pH", "EC", "TDS", "distance", "ORP"]
-    metric_timestamps = []  # To track all timestamps from metrics
-    
-    for metric_name in available_metrics:
-        try:
-            # Use instant query for current value with timeout to prevent hanging
-            query_url = f"{VICTORIA_URL}/api/v1/query"
-            params = {
-                'query': f'{metric_name}{{device="{device_id}"}}',
-                'time': now
-            }
-            
-            response = requests.get(query_url, params=params, timeout=2)
-            
-            if response.status_code == 200:
-                data = response.json()
-                if data.get('data', {}).get('result') and len(data['data']['result']) > 0:
-                    # Get the first result and extract value and timestamp
-                    first_result = data['data']['result'][0]
-                    if 'value' in first_result:
-                        value = first_result['value'][1]
-                        timestamp = int(first_result['value'][0])
-                        
-                        # Keep track of the timestamp for this metric
-                        metric_timestamps.append(timestamp)
-                        
-                        # Skip NaN values but include them in result as null for proper handling
-                        if value == "NaN" or value == "nan":
-                            result[metric_name] = None
-                        else:
-                            try:
-                                # Always convert to float for consistency
-                                value = float(value)
-                                # Store in metrics cache
-                                metrics[metric_name]['value'] = value
-                                metrics[metric_name]['last_updated'] = timestamp
-                                result[metric_name] = value
-                            except ValueError:
-                                # If conversion fails, use null
-                                result[metric_name] = None
-        except Exception as e:
-            app.logger.error(f"Error querying {metric_name}: {str(e)}")
-            
-            # Use cached value if available, otherwise set to null
-            if metrics[metric_name]['last_updated']:
-                result[metric_name] = metrics[metric_name]['value']
-            else:
-                result[metric_name] = None
-    
-    # Use the latest timestamp as the device timestamp
-    if metric_timestamps:
-        result["timestamp"] = max(metric_timestamps)
-    
+    devices = get_device_list()
+    device_id = devices[0] if devices else None
+    if device_id in fleet["devices"]:
+        return fleet["devices"][device_id]
+    return {
+        "deviceID": device_id,
+        "lastUpdate": datetime.now().isoformat(),
+        "timestamp": int(time.time())
+    }
+
+def get_current_values(device_id=None):
+    """Query VictoriaMetrics for the latest data points of one device (the first by default)"""
+    return select_device(get_fleet_values(), device_id)
+
+def add_water_level(result):
+    """Derive waterLevel from the snapshot's distance reading"""
     # Calculate water level if we have distance
     if "distance" in result and result["distance"] is not None:
         try:
@@ -149,35 +698,218 @@ def get_current_values():
             result["waterLevel"] = 50.0  # Default if conversion fails
     elif "waterLevel" not in result:
         result["waterLevel"] = 50.0  # Default water level
-    
-    return result
 
-def get_device_list():
-    """Get list of available devices from VictoriaMetrics with improved error handling"""
+def build_live_snapshot(device_id, state):
+    """Format a device's MQTT live state the same way get_fleet_values() does"""
+    values = {name: state[name]['value'] for name in LATEST_METRICS if name in state}
+    timestamps = [state[name]['last_updated'] for name in LATEST_METRICS if name in state]
+    return build_device_snapshot(device_id, values, max(timestamps) if timestamps else None)
+
+def get_latest_snapshot():
+    """Latest fleet snapshot from VictoriaMetrics, merged with newer MQTT live readings"""
+    if not mqtt_subscriber:
+        return get_fleet_values()
+    
     try:
-        # Query for a common metric to get device list with increased timeout
-        query_url = f"{VICTORIA_URL}/api/v1/query"
-        params = {
-            'query': 'temperature',  # Use temperature as it's likely always present
-        }
-        
-        response = requests.get(query_url, params=params, timeout=3)
-        
-        if response.status_code == 200:
-            data = response.json()
-            devices = []
-            
-            if data.get('data', {}).get('result'):
-                for result in data['data']['result']:
-                    if 'metric' in result and 'device' in result['metric']:
-                        devices.append(result['metric']['device'])
-            
-            # Deduplicate the list
-            return list(set(devices))
-        return ['plt-404cca470da0']  # Fallback to default if query fails
+        values, sample_times = fetch_latest_samples()
     except Exception as e:
-        app.logger.error(f"Error getting device list: {str(e)}")
-        return ['plt-404cca470da0']  # Fallback to default
+        # The live state still holds the last readings from VM and MQTT
+        app.logger.error(f"Error querying latest metrics: {str(e)}")
+        values, sample_times = {}, {}
+    fleet = build_fleet_values(values, sample_times)
+    
+    devices = {}
+    for device_id, result in fleet["devices"].items():
+        # VM values fill in metrics the live state hasn't seen yet, so partial
+        # MQTT messages still produce a complete snapshot; each one only
+        # replaces a live reading taken before its own sample time
+        device_times = sample_times.get(device_id, {})
+        for name, value in values.get(device_id, {}).items():
+            if name in device_times and value is not None:
+                live_state.update(device_id, device_times[name], {name: value}, newer_only=True)
+        state = live_state.get(device_id)
+        devices[device_id] = build_live_snapshot(device_id, state) if state else result
+    
+    # Devices only seen over MQTT so far
+    for device_id in live_state.devices():
+        if device_id not in devices:
+            devices[device_id] = build_live_snapshot(device_id, live_state.get(device_id))
+    
+    return build_fleet_snapshot(devices)
+
+def on_live_reading(device_id, timestamp, values):
+    """MQTT callback: record the reading and push it to SSE clients right away"""
+    timestamp = int(timestamp)
+    state = live_state.update(device_id, timestamp, values)
+    device_registry.observe(device_id, timestamp, values.keys())
+    last_known_values.setdefault(device_id, {}).update(values)
+    
+    # Nothing to update until the poller has loaded the fleet from VM
+    current = snapshot_poller.latest()
+    if current is None:
+        return
+    
+    devices = dict(current["devices"])
+    devices[device_id] = build_live_snapshot(device_id, state)
+    snapshot_poller.publish(build_fleet_snapshot(devices))
+
+# Optional MQTT subscription for push-based live updates
+mqtt_live_config = config['dashboard'].get('mqtt_live') or {}
+live_state = LiveState()
+mqtt_subscriber = None
+if mqtt_live_config.get('enabled', False):
+    mqtt_subscriber = TelemetrySubscriber(
+        host=mqtt_live_config.get('host', 'localhost'),
+        port=config['mqtt']['port'],
+        topic=config['mqtt']['topic_telemetry'],
+        on_reading=on_live_reading,
+        username=config['mqtt'].get('username'),
+        password=config['mqtt'].get('password'),
+        client_id_base=config['mqtt'].get('client_id_base', PROJECT_NAME),
+        logger=app.logger
+    )
+
+# One poller per worker refreshes the live snapshot for all SSE clients; with
+# MQTT live updates it only resyncs from VM occasionally
+SNAPSHOT_RESYNC_INTERVAL = mqtt_live_config.get('resync_interval', 300) if mqtt_subscriber else UPDATE_INTERVAL
+snapshot_poller = SnapshotPoller(get_latest_snapshot, SNAPSHOT_RESYNC_INTERVAL, logger=app.logger)
+
+def on_tank_settings_changed(settings):
+    """Recompute waterLevel in the shared live snapshot when the tank settings change"""
+    fleet = snapshot_poller.latest()
+    if fleet is None:
+        return
+    
+    devices = {}
+    for device_id, result in fleet["devices"].items():
+        result = dict(result)
+        result.pop("waterLevel", None)
+        add_water_level(result)
+        devices[device_id] = result
+    snapshot_poller.publish(build_fleet_snapshot(devices))
+
+tank_config_store.add_listener(on_tank_settings_changed)
+
+def read_alert_devices(fleet):
+    """Per-device (timestamp, values) from a fleet snapshot for the alert rules"""
+    devices = {}
+    for device_id, result in fleet["devices"].items():
+        # Metrics without data are None; the rules skip them
+        values = {name: result[name] for name in LATEST_METRICS if name in result}
+        # waterLevel falls back to a placeholder without a distance reading
+        if values.get("distance") is not None and result.get("waterLevel") is not None:
+            values["waterLevel"] = result["waterLevel"]
+        # Stale rules go by the real sample time, not the snapshot's
+        devices[device_id] = (result.get("lastSample"), values)
+    return devices
+
+# Alert rules evaluated by one worker as snapshots arrive, shared through a state file
+alerts_config = config['dashboard'].get('alerts') or {}
+ALERT_POLL_SECONDS = 2  # How often SSE streams check for new alerts
+alert_engine = None
+if alerts_config.get('enabled', False):
+    alert_engine = AlertEngine(
+        alerts_config.get('rules') or [],
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), alerts_config.get('state_file', 'alerts.json')),
+        notifier=Notifier(
+            webhook_url=alerts_config.get('webhook_url') or None,
+            mqtt_topic=alerts_config.get('mqtt_topic') or None,
+            mqtt_options={
+                'host': alerts_config.get('mqtt_host', 'localhost'),
+                'port': config['mqtt']['port'],
+                'username': config['mqtt'].get('username'),
+                'password': config['mqtt'].get('password')
+            },
+            logger=app.logger
+        ),
+        check_interval=alerts_config.get('check_interval', 30),
+        logger=app.logger
+    )
+
+def collect_component_metrics(registry):
+    """Copy counters kept by the cache, hot tier and SSE poller into the metrics registry"""
+    registry.set('dashboard_sse_subscribers', snapshot_poller.subscriber_count)
+    
+    cache_stats = response_cache.stats()
+    for result, key in (("hit", "hits"), ("miss", "misses"), ("coalesced", "coalesced")):
+        registry.set('dashboard_response_cache_requests_total', cache_stats[key], {"result": result})
+    registry.set('dashboard_response_cache_evictions_total', cache_stats["evictions"])
+    registry.set('dashboard_response_cache_bytes', cache_stats["bytes"])
+    
+    if hot_tier is not None:
+        hot_stats = hot_tier.stats()
+        registry.set('dashboard_hot_tier_requests_total', hot_stats["hits"], {"result": "hit"})
+        registry.set('dashboard_hot_tier_requests_total', hot_stats["misses"], {"result": "miss"})
+        registry.set('dashboard_hot_tier_bytes', hot_stats["bytes"])
+    
+    for name, state in health_prober.states().items():
+        if state["checked_at"] is None:
+            continue
+        registry.set('dashboard_service_up', 1 if state["status"] == "ok" else 0, {"service": name})
+        registry.set('dashboard_service_probe_seconds', state["latency_ms"] / 1000, {"service": name})
+    
+    if query_scheduler is not None:
+        for query_class, class_stats in query_scheduler.stats().items():
+            registry.set('dashboard_vm_queue_requests_total', class_stats["admitted"], {"class": query_class, "result": "admitted"})
+            registry.set('dashboard_vm_queue_requests_total', class_stats["rejected"], {"class": query_class, "result": "rejected"})
+            registry.set('dashboard_vm_queue_wait_seconds_total', class_stats["wait_seconds"], {"class": query_class})
+    for route, limiter in rate_limiters.items():
+        registry.set('dashboard_rate_limited_total', limiter.rejected, {"route": route})
+
+metrics_registry.add_collector(collect_component_metrics)
+
+# Service health, probed in the background so /health answers from memory
+health_config = config['dashboard'].get('health') or {}
+health_prober = HealthProber(logger=app.logger)
+
+def add_health_check(name, probe, default_interval):
+    options = (health_config.get('services') or {}).get(name) or {}
+    health_prober.add(
+        name,
+        probe,
+        interval=options.get('interval', default_interval),
+        timeout=options.get('timeout', health_config.get('timeout', 2))
+    )
+
+add_health_check("node_red", tcp_probe('localhost', config['node_red']['port']), 30)
+add_health_check("victoria_metrics", http_probe(vm_client), 15)
+add_health_check("mqtt", tcp_probe('localhost', config['mqtt']['port']), 30)
+add_health_check("ap_mode", ap_mode_probe, 60)
+
+@app.before_request
+def start_background_services():
+    """Start per-worker background services (inside the gunicorn worker, not the master)"""
+    if mqtt_subscriber is not None:
+        mqtt_subscriber.start()
+    if hot_tier is not None:
+        hot_tier.start_backfill()
+    if rollup_store is not None:
+        rollup_store.start(rollup_config.get('interval', 300))
+    health_prober.start()
+    if alert_engine is not None:
+        alert_engine.start(snapshot_poller, read_alert_devices, tank_config_store.get)
+
+# gunicorn imports the app in each worker (no --preload), so alerts are
+# evaluated from startup rather than from the first request; only the worker
+# holding the evaluator lock evaluates, and the hook above restarts the
+# thread after a fork
+if alert_engine is not None:
+    alert_engine.start(snapshot_poller, read_alert_devices, tank_config_store.get)
+
+# Devices discovered from VM's series index, refreshed in the background
+device_registry_config = config['dashboard'].get('device_registry') or {}
+device_registry = DeviceRegistry(
+    vm_client,
+    LATEST_METRICS,
+    ttl=device_registry_config.get('ttl', 300),
+    lookback=int(device_registry_config.get('lookback_hours', 168) * 3600),
+    fallback=['plt-404cca470da0'],
+    logger=app.logger
+)
+
+def get_device_list():
+    """Get list of available devices from the cached device registry"""
+    return device_registry.devices()
 
 @app.route('/')
 def index():
@@ -187,7 +919,7 @@ def index():
 @app.route('/settings')
 def settings():
     """Settings page"""
-    return render_template('settings.html', project_name=PROJECT_NAME, config=config, tank_config=tank_config)
+    return render_template('settings.html', project_name=PROJECT_NAME, config=config, tank_config=tank_config_store.get())
 
 @app.route('/trends')
 def trends():
@@ -196,7 +928,25 @@ def trends():
 
 @app.route('/api/events')
 def events():
-    """SSE endpoint with real data from VictoriaMetrics"""
+    """
+    SSE endpoint with real data from VictoriaMetrics.
+    ?device=<id> streams one device (the first known device by default),
+    ?device=all streams the whole fleet snapshot.
+    Alerts are sent as "event: alert" messages with the alert sequence as id,
+    so a reconnecting client only gets the ones it missed. After each batch an
+    id-only message moves the client's Last-Event-ID up to the sequence the
+    batch covers, so alerts that were filtered out or already resolved aren't
+    replayed on reconnect.
+    """
+    device_filter = request.args.get('device')
+    last_event_id = request.headers.get('Last-Event-ID')
+    metrics_registry.inc('dashboard_sse_streams_total')
+    
+    def alert_messages(events):
+        for event in events:
+            if device_filter in (None, 'all') or event["device"] == device_filter:
+                yield f"id: {event['seq']}\nevent: alert\ndata: {json.dumps(event)}\n\n"
+    
     def generate():
         last_sent_timestamp = 0
         
@@ -204,31 +954,56 @@ def events():
             # Send initial connection message
             yield f"data: {json.dumps({'status': 'connected', 'timestamp': datetime.now().isoformat()})}\n\n"
             
+            # Alerts missed since the client's last one, or the active ones for a new client
+            alert_seq = None
+            if alert_engine is not None:
+                alert_seq = alert_engine.sequence()
+                if last_event_id and last_event_id.isdigit():
+                    missed = alert_engine.events_since(int(last_event_id))
+                    if missed:
+                        alert_seq = max(alert_seq, missed[-1]["seq"])
+                    yield from alert_messages(missed)
+                else:
+                    yield from alert_messages(alert_engine.active())
+                yield f"id: {alert_seq}\n\n"
+            
             # Send data updates only when new device data is available
-            max_time = 25  # seconds (just under gunicorn's default 30 sec timeout)
+            max_time = SSE_MAX_SECONDS
             start_time = time.time()
             
-            while (time.time() - start_time) < max_time:
-                # Get the latest data
-                current_data = get_current_values()
-                
-                # Check if data has a new timestamp from the device
-                device_timestamp = current_data.get("timestamp", 0)
-                
-                # Only send data if it's truly a new reading with a new timestamp
-                if device_timestamp > last_sent_timestamp:
-                    # Update last sent timestamp
-                    last_sent_timestamp = device_timestamp
+            # Snapshots come from the shared poller; this client only waits for them
+            with snapshot_poller.subscribe() as subscription:
+                while (time.time() - start_time) < max_time:
+                    remaining = max_time - (time.time() - start_time)
+                    # With alerts on, wake up regularly to check for new ones
+                    fleet = subscription.wait(timeout=min(remaining, ALERT_POLL_SECONDS) if alert_engine else remaining)
                     
-                    # Send the new data
-                    yield f"data: {json.dumps(current_data)}\n\n"
-                
-                # Sleep for update interval, but don't exceed max time
-                remaining = max(0, min(UPDATE_INTERVAL, max_time - (time.time() - start_time)))
-                if remaining > 0:
-                    time.sleep(remaining)
-                else:
-                    break
+                    if alert_engine is not None:
+                        new_alerts = alert_engine.events_since(alert_seq)
+                        if new_alerts:
+                            alert_seq = new_alerts[-1]["seq"]
+                            yield from alert_messages(new_alerts)
+                            yield f"id: {alert_seq}\n\n"
+                    
+                    if fleet is None:
+                        if alert_engine is not None:
+                            continue
+                        break
+                    
+                    current_data = fleet if device_filter == 'all' else select_device(fleet, device_filter)
+                    if current_data is None:
+                        continue
+                    
+                    # Check if data has a new timestamp from the device
+                    device_timestamp = current_data.get("timestamp", 0)
+                    
+                    # Only send data if it's truly a new reading with a new timestamp
+                    if device_timestamp > last_sent_timestamp:
+                        # Update last sent timestamp
+                        last_sent_timestamp = device_timestamp
+                        
+                        # Send the new data
+                        yield f"data: {json.dumps(current_data)}\n\n"
                     
             # Tell client to reconnect
             yield f"retry: 100\n\n"
@@ -248,36 +1023,56 @@ def events():
 
 @app.route('/api/tank-settings', methods=['GET', 'POST'])
 def tank_settings():
-    """Tank settings API"""
-    global tank_config
-    
+    """Tank settings API (shared by all workers and kept across restarts)"""
     if request.method == 'GET':
-        return jsonify(tank_config)
+        return jsonify(tank_config_store.get())
     elif request.method == 'POST':
         try:
             data = request.get_json()
+            changes = {}
             
             # Update configuration if valid values provided
             if 'maxDistance' in data and isinstance(data['maxDistance'], (int, float)) and data['maxDistance'] > 0:
-                tank_config['maxDistance'] = float(data['maxDistance'])
+                changes['maxDistance'] = float(data['maxDistance'])
             
             if 'minDistance' in data and isinstance(data['minDistance'], (int, float)) and data['minDistance'] >= 0:
-                tank_config['minDistance'] = float(data['minDistance'])
+                changes['minDistance'] = float(data['minDistance'])
             
             if 'alertLevel' in data and isinstance(data['alertLevel'], (int, float)) and 0 <= data['alertLevel'] <= 100:
-                tank_config['alertLevel'] = float(data['alertLevel'])
+                changes['alertLevel'] = float(data['alertLevel'])
                 
-            return jsonify({"status": "success", "config": tank_config})
+            return jsonify({"status": "success", "config": tank_config_store.update(changes)})
         except Exception as e:
             app.logger.error(f"Error updating tank settings: {str(e)}")
             return jsonify({"status": "error", "message": str(e)}), 400
 
 @app.route('/api/latest')
 def latest_data():
-    """Get latest sensor data from VictoriaMetrics"""
+    """
+    Get latest sensor data from VictoriaMetrics.
+    ?device=<id> selects a device (the first known device by default),
+    ?device=all returns {"devices": {device: snapshot}, "timestamp", "lastUpdate"}.
+    """
     try:
-        # Get current values from VictoriaMetrics
-        current_data = get_current_values()
+        # With MQTT live updates the poller's snapshot is kept current in memory,
+        # as long as the poller has resynced from VM recently (it stops while
+        # no SSE client is connected, and MQTT may have dropped meanwhile)
+        fleet = None
+        if mqtt_subscriber:
+            age = snapshot_poller.age()
+            if age is not None and age <= SNAPSHOT_RESYNC_INTERVAL:
+                fleet = snapshot_poller.latest()
+        if fleet is None:
+            # Get current values from VictoriaMetrics
+            fleet = get_latest_snapshot()
+        
+        device_id = request.args.get('device')
+        if device_id == 'all':
+            return jsonify(fleet)
+        
+        current_data = select_device(fleet, device_id)
+        if current_data is None:
+            return jsonify({"status": "error", "error": f"Unknown device: {device_id}"}), 404
         return jsonify(current_data)
     except Exception as e:
         app.logger.error(f"Error fetching latest data: {str(e)}")
@@ -285,7 +1080,12 @@ def latest_data():
 
 @app.route('/api/query')
 def query_data():
-    """Query historical data from VictoriaMetrics"""
+    """
+    Query historical data from VictoriaMetrics.
+    With ?cursor= (or ?since=) only the points after it are returned; the
+    response's cursor is passed to the next call, and reset says whether the
+    client has to replace its points because the step or window changed.
+    """
     try:
         # Get parameters
         metric = request.args.get('metric', 'temperature')
@@ -295,81 +1095,207 @@ def query_data():
         minutes = int(request.args.get('minutes', 1440))
         
         # Get custom step size if provided, otherwise calculate based on time range
-        step_size = request.args.get('step')
+        step_size = request.args.get('step') or default_step(minutes)
         
-        # Calculate time range
-        now = int(time.time())
-        start = now - (minutes * 60)
+        # With max_points the series is fetched raw and reduced, so the window
+        # is snapped to the bucket width instead of the step
+        try:
+            max_points, mode = parse_downsample_args(minutes, [metric])
+        except ValueError as e:
+            return jsonify({"status": "error", "message": str(e)}), 400
+        if max_points:
+            step_size = f"{max(60, (minutes * 60) // max_points)}s"
+        
+        try:
+            payload_format, value_type = parse_format_args()
+        except ValueError as e:
+            return jsonify({"status": "error", "message": str(e)}), 400
+        
+        # Calculate time range, snapped to the step grid so refreshes share a cache key
+        start, end, step_seconds = snap_window(minutes, step_size)
+        
+        # Derived series change with the tank settings
+        settings_version = tank_config_store.version if metric in DERIVED_METRICS else None
+        scope = cursor_scope(device_id, [metric])
+        
+        # Incremental updates only apply on a step grid, not to downsampled series
+        if max_points:
+            fetch_start, reset = start, True
+        else:
+            fetch_start, reset = parse_incremental_args(minutes, start, end, step_seconds, settings_version, scope)
+        meta = {"cursor": None if max_points else make_cursor(minutes, end, step_seconds, settings_version, scope),
+                "reset": reset}
         
         # Construct device filter if provided
         device_filter = f',device="{device_id}"' if device_id else ''
         
-        # If step size is not provided, calculate it based on time range
-        if not step_size:
-            if minutes >= 10080:  # 7 days
-                step_size = '2h'
-            elif minutes >= 1440:  # 24 hours
-                step_size = '15m'
-            elif minutes >= 720:  # 12 hours
-                step_size = '8m'
-            else:
-                step_size = '1m'
-        
         # Construct query
         query = f'{metric}{{{device_filter}}}'
         
-        params = {
-            'query': query,
-            'start': start,
-            'end': now,
-            'step': step_size
-        }
+        def encode_first_series(labels, timestamps, values):
+            # Encode the first matching series (if any) in the requested format
+            record_points(len(timestamps) if labels is not None else 0)
+            with metrics_registry.time('dashboard_encode_duration_seconds', {"format": payload_format}):
+                return encode_series(labels, timestamps, values)
         
-        app.logger.info(f"VM Query: {query}, Step: {step_size}")
+        def encode_series(labels, timestamps, values):
+            if payload_format == 'binary':
+                return encode_binary({metric: (timestamps, values)} if labels is not None else {}, value_type, meta)
+            
+            result = []
+            if labels is not None:
+                if payload_format == 'columnar':
+                    result.append(dict(metric=labels, **to_columnar(timestamps, values)))
+                else:
+                    result.append({"metric": labels, "values": to_point_list(timestamps, values)})
+            
+            payload = {"status": "success", "data": {"status": "success", "data": {"resultType": "matrix", "result": result}}}
+            payload.update(meta)
+            if payload_format == 'columnar':
+                payload["format"] = "columnar"
+            return to_json_body(payload)
         
-        # Increase timeout for larger queries
-        response = requests.get(f"{VICTORIA_URL}/api/v1/query_range", params=params, timeout=10)
+        def compute_downsampled():
+            if metric in DERIVED_METRICS:
+                timestamps, values = fetch_downsampled_series(metric, device_id, start, end, max_points, mode)
+                labels = derived_labels(metric, device_id) if len(timestamps) else None
+                return encode_first_series(labels, timestamps, values), True
+            labels, timestamps, values = fetch_reduced_series(metric, device_id, start, end, max_points, mode)
+            return encode_first_series(labels, timestamps, values), True
         
-        if response.status_code == 200:
-            data = response.json()
+        def compute():
+            # Nothing new since the cursor
+            if fetch_start > end:
+                return encode_first_series(None, *parse_vm_values([])), True
+            
+            # Derived metrics are computed from their source series
+            if metric in DERIVED_METRICS:
+                timestamps, values = fetch_trend_series(metric, device_id, fetch_start, end, step_size)
+                labels = derived_labels(metric, device_id) if len(timestamps) else None
+                return encode_first_series(labels, timestamps, values), True
+            
+            # Windows held by the hot tier are resampled from memory
+            hot = hot_tier.range(device_id, metric, fetch_start, end, step_seconds) if hot_tier and step_seconds else None
+            if hot is not None:
+                labels = {"__name__": metric, "device": device_id} if len(hot[0]) else None
+                return encode_first_series(labels, *hot), True
+            
+            app.logger.info(f"VM Query: {query}, Step: {step_size}")
+            
+            response = vm_client.query_range(query, fetch_start, end, step_size)
             
-            # Process data for frontend consumption
-            if data.get('data', {}).get('result') and len(data['data']['result']) > 0:
-                result = data['data']['result'][0]
+            if response.status_code == 200:
+                data = response.json()
                 
-                # Process values to handle NaN
-                if 'values' in result:
-                    processed_values = []
+                # Compact formats only carry the first series, parsed into arrays
+                if payload_format != 'points':
+                    results = data.get('data', {}).get('result') or []
+                    if not results:
+                        return encode_first_series(None, *parse_vm_values([])), True
+                    first = results[0]
+                    return encode_first_series(first.get('metric', {}), *parse_vm_values(first.get('values', []))), True
+                
+                # Process data for frontend consumption
+                if data.get('data', {}).get('result') and len(data['data']['result']) > 0:
+                    result = data['data']['result'][0]
                     
-                    for timestamp, value in result['values']:
-                        if value == "NaN" or value == "nan":
-                            processed_values.append([timestamp, None])
-                        else:
-                            try:
-                                processed_values.append([timestamp, float(value)])
-                            except ValueError:
+                    # Process values to handle NaN
+                    if 'values' in result:
+                        processed_values = []
+                        
+                        for timestamp, value in result['values']:
+                            if value == "NaN" or value == "nan":
                                 processed_values.append([timestamp, None])
-                    
-                    # Replace values with processed ones
-                    result['values'] = processed_values
+                            else:
+                                try:
+                                    processed_values.append([timestamp, float(value)])
+                                except ValueError:
+                                    processed_values.append([timestamp, None])
+                        
+                        # Replace values with processed ones
+                        result['values'] = processed_values
+                
+                return to_json_body(dict({"status": "success", "data": data}, **meta)), True
             
-            return jsonify({"status": "success", "data": data})
-        
-        # Return empty result with success status if no data
-        return jsonify({
-            "status": "success",
-            "data": {
-                "resultType": "matrix",
-                "result": []
-            }
-        })
+            # Return empty result with success status if no data
+            if payload_format != 'points':
+                return encode_first_series(None, *parse_vm_values([])), False
+            return to_json_body(dict({
+                "status": "success",
+                "data": {
+                    "resultType": "matrix",
+                    "result": []
+                }
+            }, **meta)), False
+        
+        mimetype = BINARY_MIMETYPE if payload_format == 'binary' else 'application/json'
+        if max_points:
+            cache_key = ('query', metric, device_id, max_points, mode, payload_format, value_type, start, end,
+                         settings_version)
+            return cached_response(cache_key, step_seconds, compute_downsampled, mimetype)
+        
+        cache_key = None
+        if step_seconds:
+            cache_key = ('query', metric, device_id, step_size, payload_format, value_type, minutes, fetch_start, end,
+                         settings_version)
+        return cached_response(cache_key, step_seconds, compute, mimetype)
+    except Overloaded:
+        raise
     except Exception as e:
         app.logger.error(f"Error querying data: {str(e)}", exc_info=True)
         return jsonify({"status": "error", "message": str(e)}), 500
 
+def fetch_trend_series(metric, device_id, start, end, step):
+    """Run one range query and return (timestamps, values) arrays for a metric"""
+    # Derived metrics are computed from their sources over the whole range
+    derived = DERIVED_METRICS.get(metric)
+    if derived is not None:
+        sources = {source: fetch_trend_series(source, device_id, start, end, step) for source in derived.sources}
+        return derived.compute(sources, tank_config_store.get())
+    
+    # Windows held by the hot tier are resampled from memory
+    step_seconds = parse_step_seconds(step)
+    if hot_tier is not None and step_seconds:
+        hot = hot_tier.range(device_id, metric, start, end, step_seconds)
+        if hot is not None:
+            return hot
+    
+    # Long windows with hourly or daily steps are averaged from the rollups,
+    # with the part since the last rollup run read raw. Unlike a range query,
+    # each point is the average of all samples in its step, stamped at the
+    # start of the step, rather than the last sample before the step time
+    if rollup_store is not None and step_seconds and device_id:
+        rolled = rollup_store.series(device_id, metric, start, end, step_seconds,
+                                     lambda tail_start, tail_end: fetch_raw_series(metric, device_id, tail_start, tail_end)[1:])
+        if rolled is not None:
+            return rolled
+    
+    # Build device filter
+    device_filter = f'device="{device_id}"' if device_id else ''
+    
+    # Build query
+    query = f'{metric}{{{device_filter}}}' if device_filter else metric
+    
+    # Query Victoria Metrics
+    app.logger.info(f"VM Query: {query}, Step: {step}")
+    
+    response = vm_client.query_range(query, start, end, step)
+    
+    # Process response; errors raise so the caller marks the metric as failed
+    response.raise_for_status()
+    data = response.json()
+    
+    # Parse the first series into arrays (NaN and invalid values become NaN)
+    if data.get('data', {}).get('result') and len(data['data']['result']) > 0:
+        return parse_vm_values(data['data']['result'][0].get('values', []))
+    return parse_vm_values([])
+
 @app.route('/api/trends')
 def trends_data():
-    """Query multiple metrics over time for trends page"""
+    """
+    Query multiple metrics over time for trends page.
+    Supports ?cursor= / ?since= incremental updates like /api/query.
+    """
     try:
         # Get parameters
         metrics_str = request.args.get('metrics', 'temperature,pH,EC,TDS,distance,ORP')
@@ -385,211 +1311,436 @@ def trends_data():
         # Get custom step size if provided
         step_size = request.args.get('step')
         
-        # Calculate time range
-        now = int(time.time())
-        start = now - (minutes * 60)
+        # If step size is not provided, calculate it based on time range
+        step_size = step_size or default_step(minutes)
+        
+        # With max_points the series are fetched raw and reduced, so the window
+        # is snapped to the bucket width instead of the step
+        try:
+            max_points, mode = parse_downsample_args(minutes, [metric.strip() for metric in metrics_list])
+        except ValueError as e:
+            return jsonify({"status": "error", "message": str(e)}), 400
+        if max_points:
+            step_size = f"{max(60, (minutes * 60) // max_points)}s"
+        
+        try:
+            payload_format, value_type = parse_format_args()
+        except ValueError as e:
+            return jsonify({"status": "error", "message": str(e)}), 400
         
-        # Initialize results
-        results = {}
+        # Calculate time range, snapped to the step grid so refreshes share a cache key
+        start, end, step_seconds = snap_window(minutes, step_size)
         
-        # Process each metric
+        # Deduplicate metric names, keeping the requested order
+        metric_names = []
         for metric in metrics_list:
             metric = metric.strip()
-            if not metric:
-                continue
-                
-            try:
-                # Build device filter
-                device_filter = f'device="{device_id}"' if device_id else ''
-                
-                # Build query
-                query = f'{metric}{{{device_filter}}}' if device_filter else metric
-                
-                # If step size is not provided, calculate it based on time range
-                current_step = step_size
-                if not current_step:
-                    if minutes >= 10080:  # 7 days
-                        current_step = '2h'
-                    elif minutes >= 1440:  # 24 hours
-                        current_step = '15m'
-                    elif minutes >= 720:  # 12 hours
-                        current_step = '8m'
-                    else:
-                        current_step = '1m'
-                
-                # Query Victoria Metrics
-                query_url = f"{VICTORIA_URL}/api/v1/query_range"
-                params = {
-                    'query': query,
-                    'start': start,
-                    'end': now,
-                    'step': current_step
+            if metric and metric not in metric_names:
+                metric_names.append(metric)
+        
+        # Derived series change with the tank settings
+        settings_version = tank_config_store.version if any(m in DERIVED_METRICS for m in metric_names) else None
+        scope = cursor_scope(device_id, metric_names)
+        
+        # Incremental updates only apply on a step grid, not to downsampled series
+        if max_points:
+            fetch_start, reset = start, True
+        else:
+            fetch_start, reset = parse_incremental_args(minutes, start, end, step_seconds, settings_version, scope)
+        meta = {"cursor": None if max_points else make_cursor(minutes, end, step_seconds, settings_version, scope),
+                "reset": reset}
+        
+        def compute():
+            # Nothing new since the cursor
+            if fetch_start > end:
+                return encode_series_map({metric: parse_vm_values([]) for metric in metric_names},
+                                         payload_format, value_type, meta), True
+            
+            # Submit every metric to the shared pool so the range queries overlap
+            if max_points:
+                futures = {
+                    metric: range_query_pool.submit(fetch_downsampled_series, metric, device_id, start, end, max_points, mode)
+                    for metric in metric_names
                 }
-                
-                app.logger.info(f"VM Query: {query}, Step: {current_step}")
-                
-                # Use longer timeout for range queries
-                response = requests.get(query_url, params=params, timeout=10)
-                
-                # Process response
-                values = []
-                if response.status_code == 200:
-                    data = response.json()
-                    
-                    if data.get('data', {}).get('result') and len(data['data']['result']) > 0:
-                        result = data['data']['result'][0]
-                        
-                        if 'values' in result:
-                            for point in result['values']:
-                                if len(point) == 2:
-                                    timestamp, value = point
-                                    
-                                    # Handle NaN values
-                                    if value == "NaN" or value == "nan":
-                                        values.append([int(timestamp), None])
-                                    else:
-                                        try:
-                                            values.append([int(timestamp), float(value)])
-                                        except (ValueError, TypeError):
-                                            values.append([int(timestamp), None])
-                
-                # Store in results
-                results[metric] = values
-            except Exception as e:
-                app.logger.error(f"Error processing metric {metric}: {str(e)}")
-                results[metric] = []
+            else:
+                futures = {
+                    metric: range_query_pool.submit(fetch_trend_series, metric, device_id, fetch_start, end, step_size)
+                    for metric in metric_names
+                }
+            
+            # Collect results; a failing metric gets an empty series
+            results = {}
+            complete = True
+            for metric, future in futures.items():
+                try:
+                    results[metric] = future.result()
+                except Overloaded:
+                    # Shed the whole request rather than answer with gaps
+                    raise
+                except Exception as e:
+                    app.logger.error(f"Error processing metric {metric}: {str(e)}")
+                    results[metric] = parse_vm_values([])
+                    complete = False
+            
+            # Only cache responses where every metric was fetched successfully
+            return encode_series_map(results, payload_format, value_type, meta), complete
         
-        return jsonify({"status": "success", "data": results})
+        mimetype = BINARY_MIMETYPE if payload_format == 'binary' else 'application/json'
+        cache_key = None
+        if step_seconds:
+            cache_key = ('trends', tuple(sorted(metric_names)), device_id, step_size, max_points, mode,
+                         payload_format, value_type, minutes, fetch_start, end, settings_version)
+        return cached_response(cache_key, step_seconds, compute, mimetype)
+    except Overloaded:
+        raise
     except Exception as e:
         app.logger.error(f"Error in trends_data: {str(e)}", exc_info=True)
         return jsonify({"status": "error", "message": str(e)}), 500
 
-@app.route('/health')
-def health_check():
-    """Enhanced health check endpoint"""
-    services = {
-        "dashboard": {"status": "ok"},
-        "node_red": {"status": "unknown"},
-        "victoria_metrics": {"status": "unknown"},
-        "mqtt": {"status": "unknown"},
-        "ap_mode": {"status": "unknown"}
-    }
+def fetch_vm_stat(stat, selector, start, end, group):
+    """
+    Compute one stat for every series matching selector inside VictoriaMetrics.
+    Returns [(labels, bucket_starts, values)], one bucket per group (or one for the window).
+    """
+    if group:
+        # Each point covers the group ending at it
+        response = vm_client.query_range(rollup_query(stat, selector, group), start + group, end, f"{group}s")
+    else:
+        response = vm_client.query(rollup_query(stat, selector, end - start), end, query_type="range")
+    response.raise_for_status()
     
-    # Check Node-RED
-    try:
-        import socket
-        s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        s.settimeout(1)
-        result = s.connect_ex(('localhost', config['node_red']['port']))
-        services["node_red"]["status"] = "ok" if result == 0 else "error"
-        s.close()
-    except:
-        services["node_red"]["status"] = "error"
-    
-    # Check VictoriaMetrics with timeout
-    try:
-        resp = requests.get(f"{VICTORIA_URL}/health", timeout=2)
-        services["victoria_metrics"]["status"] = "ok" if resp.status_code == 200 else "error"
-    except:
-        services["victoria_metrics"]["status"] = "error"
-    
-    # Check MQTT (assuming standard port 1883)
-    try:
-        import socket
-        s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        s.settimeout(1)
-        result = s.connect_ex(('localhost', 1883))
-        services["mqtt"]["status"] = "ok" if result == 0 else "error"
-        s.close()
-    except:
-        # If we can't check MQTT, leave as unknown
-        pass
-    
-    # Check AP mode status using system commands
+    results = []
+    for series in response.json().get('data', {}).get('result') or []:
+        values = series.get('values') or ([series['value']] if 'value' in series else [])
+        timestamps, parsed = parse_vm_values(values)
+        results.append((series.get('metric', {}), timestamps - (group or end - start), parsed))
+    return results
+
+def compute_derived_stats(metric, device_id, stat_names, start, end, group):
+    """Compute stats for a derived metric from its raw sources with NumPy"""
+    derived = DERIVED_METRICS[metric]
+    sources = {source: fetch_raw_series(source, device_id, start, end)[1:] for source in derived.sources}
+    timestamps, values = derived.compute(sources, tank_config_store.get())
+    return reduce_stats(timestamps, values, stat_names, start, end, group or end - start)
+
+@app.route('/api/stats')
+def stats_data():
+    """
+    Aggregates per device and metric over the last `minutes`.
+    ?stats= takes min, max, mean, sum, count, stddev and quantiles such as p95
+    (default min,max,mean,count); ?group_by=1h returns one value per interval.
+    Stored metrics are reduced by VictoriaMetrics' rollup functions, derived
+    metrics with NumPy from their raw samples, so only over the last
+    derived_stats_max_hours.
+    """
     try:
-        import subprocess
-        result = subprocess.run(["iwconfig"], capture_output=True, text=True)
-        if "Mode:Master" in result.stdout:
-            services["ap_mode"]["status"] = "ok"
-        else:
-            services["ap_mode"]["status"] = "inactive"
-    except:
-        # If can't check AP mode, leave as unknown
-        pass
+        # 'metrics'/'devices' take comma separated lists; no devices means all of them
+        metric_param = request.args.get('metrics') or request.args.get('metric') or ','.join(LATEST_METRICS)
+        device_param = request.args.get('devices') or request.args.get('device', '')
+        metric_names = []
+        for metric in metric_param.split(','):
+            metric = metric.strip()
+            if metric and metric not in metric_names:
+                metric_names.append(metric)
+        devices_list = [d.strip() for d in device_param.split(',') if d.strip() and d.strip() != 'all']
+        
+        stat_names = parse_stats(request.args.get('stats'))
+        minutes = int(request.args.get('minutes', 1440))
+        
+        group_by = request.args.get('group_by')
+        group_seconds = None
+        if group_by:
+            group_seconds = parse_step_seconds(group_by)
+            if not group_seconds:
+                raise ValueError(f"Invalid group_by: {group_by}")
+        
+        # Snap the window to the group grid (or the minute) so repeated calls share a cache key
+        start, end, _ = snap_window(minutes, f"{group_seconds or 60}s")
+        if group_seconds and (end - start) // group_seconds > DOWNSAMPLE_MAX_POINTS:
+            raise ValueError(f"More than {DOWNSAMPLE_MAX_POINTS} groups; use a larger group_by")
+        
+        stored_metrics = [m for m in metric_names if m not in DERIVED_METRICS]
+        derived_metrics = [m for m in metric_names if m in DERIVED_METRICS]
+        if derived_metrics and minutes > DERIVED_STATS_MAX_MINUTES:
+            raise ValueError(f"Stats for {', '.join(derived_metrics)} are limited to the last {DERIVED_STATS_MAX_MINUTES} minutes")
+        
+        def compute():
+            # One query per stat covers every stored metric and device
+            futures = []
+            if stored_metrics:
+                selector = series_selector(stored_metrics, devices_list)
+                futures = [(stat, None, None, range_query_pool.submit(fetch_vm_stat, stat, selector, start, end, group_seconds))
+                           for stat in stat_names]
+            for metric in derived_metrics:
+                for device_id in devices_list or get_device_list():
+                    futures.append((None, metric, device_id, range_query_pool.submit(
+                        compute_derived_stats, metric, device_id, stat_names, start, end, group_seconds)))
+            
+            # (device, metric) -> bucket start -> stat -> value
+            buckets = {}
+            for stat, metric, device_id, future in futures:
+                if stat is not None:
+                    for labels, timestamps, values in future.result():
+                        key = (labels.get('device'), labels.get('__name__'))
+                        if key[0] is None:
+                            continue
+                        series = buckets.setdefault(key, {})
+                        for timestamp, value in zip(timestamps.tolist(), values.tolist()):
+                            series.setdefault(timestamp, {})[stat] = value
+                else:
+                    timestamps, results = future.result()
+                    series = buckets.setdefault((device_id, metric), {})
+                    for stat_name, values in results.items():
+                        for timestamp, value in zip(timestamps.tolist(), values.tolist()):
+                            series.setdefault(timestamp, {})[stat_name] = value
+            
+            data = {}
+            for (device_id, metric), series in sorted(buckets.items()):
+                timestamps = sorted(series)
+                if group_seconds:
+                    entry = {"timestamps": timestamps}
+                    for stat in stat_names:
+                        entry[stat] = [parse_sample(series[timestamp].get(stat)) for timestamp in timestamps]
+                else:
+                    entry = {stat: parse_sample(series[timestamps[0]].get(stat)) for stat in stat_names} if timestamps else {}
+                data.setdefault(device_id, {})[metric] = entry
+            
+            return to_json_body({
+                "status": "success",
+                "start": start,
+                "end": end,
+                "group_by": group_seconds,
+                "stats": stat_names,
+                "data": data
+            }), True
+        
+        # Derived stats change with the tank settings
+        settings_version = tank_config_store.version if derived_metrics else None
+        cache_key = ('stats', tuple(metric_names), tuple(devices_list), tuple(stat_names), start, end,
+                     group_seconds, settings_version)
+        return cached_response(cache_key, group_seconds or 60, compute)
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    except Overloaded:
+        raise
+    except Exception as e:
+        app.logger.error(f"Error in stats_data: {str(e)}", exc_info=True)
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+@app.route('/health')
+def health_check():
+    """
+    Service health from the background prober. Each service reports its
+    status, the probe's latency and when the status last changed;
+    ?fresh=1 probes everything before answering.
+    """
+    if request.args.get('fresh') == '1':
+        health_prober.refresh()
     
+    services = {"dashboard": {"status": "ok"}}
+    services.update(health_prober.states())
     return jsonify({"status": "ok", "services": services})
 
+@app.route('/api/alerts')
+def alerts():
+    """Active alerts and recent alert events (newest first)"""
+    if alert_engine is None:
+        return jsonify({"status": "success", "enabled": False, "active": [], "events": []})
+    return jsonify({"status": "success", "enabled": True, "active": alert_engine.active(), "events": alert_engine.recent()})
+
 @app.route('/api/devices')
 def devices():
     """Get a list of available devices"""
     try:
         devices = get_device_list()
-        return jsonify({"status": "success", "devices": devices})
+        return jsonify({"status": "success", "devices": devices, "details": device_registry.details()})
     except Exception as e:
         app.logger.error(f"Error fetching devices: {str(e)}")
         return jsonify({"status": "error", "message": str(e)}), 500
 
+@app.route('/api/diagnostics')
+def diagnostics():
+    """Internal counters for this worker"""
+    return jsonify({
+        "status": "success",
+        "pid": os.getpid(),
+        "vm_client": vm_client.stats(),
+        "query_scheduler": query_scheduler.stats() if query_scheduler else None,
+        "response_cache": response_cache.stats(),
+        "hot_tier": hot_tier.stats() if hot_tier else None,
+        "mqtt_live": dict(mqtt_subscriber.stats) if mqtt_subscriber else None
+    })
+
+@app.route('/metrics')
+def prometheus_metrics():
+    """Prometheus metrics of all dashboard workers"""
+    return Response(metrics_registry.render(), mimetype='text/plain; version=0.0.4')
+
+# Content types and file extensions for each export format
+EXPORT_FORMATS = {
+    'json': ('application/json', 'json'),
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+    'csv': ('text/csv', 'csv'),
+}
+
+# Value column headers of single-series CSV exports, as the trends page used to write them
+CSV_METRIC_LABELS = {
+    'temperature': 'Temperature (°C)',
+    'pH': 'pH Level',
+    'TDS': 'TDS (ppm)',
+    'EC': 'EC (μS/cm)',
+    'distance': 'Distance (m)',
+    'ORP': 'ORP (mV)',
+}
+
+def iter_export_rows(blocks, export_format):
+    """
+    Flatten VM export blocks into (timestamp, datetime, metric, device, value)
+    rows, skipping NaN. The rows are added to dashboard_export_rows_total
+    once the stream ends, including when the client disconnects early.
+    """
+    count = 0
+    try:
+        for block in blocks:
+            labels = block.get('metric', {})
+            metric_name = labels.get('__name__', '')
+            device = labels.get('device', '')
+            
+            for timestamp_ms, value in zip(block.get('timestamps', []), block.get('values', [])):
+                try:
+                    value = float(value)
+                except (ValueError, TypeError):
+                    # Skip invalid values
+                    continue
+                if value != value:  # NaN
+                    continue
+                
+                timestamp = int(timestamp_ms) // 1000
+                count += 1
+                yield (
+                    timestamp,
+                    datetime.fromtimestamp(timestamp).strftime('%Y-%m-%d %H:%M:%S'),
+                    metric_name,
+                    device,
+                    value
+                )
+    finally:
+        metrics_registry.inc('dashboard_export_rows_total', {"format": export_format}, count)
+
 @app.route('/api/export')
 def export_data():
-    """Export full resolution data without step size for a given metric"""
+    """
+    Stream full resolution data for one or more metrics and devices.
+    CSV exports of one metric for one device keep the two-column layout
+    (Timestamp,<metric label>); anything wider gets one row per sample with
+    timestamp, datetime, metric, device and value columns.
+    """
     try:
-        # Get parameters
-        metric = request.args.get('metric', 'temperature')
-        device_id = request.args.get('device', '')
+        # Get parameters ('metrics'/'devices' take comma separated lists)
+        metric_param = request.args.get('metrics') or request.args.get('metric', 'temperature')
+        device_param = request.args.get('devices') or request.args.get('device', '')
+        metrics_list = [m.strip() for m in metric_param.split(',') if m.strip()]
+        devices_list = [d.strip() for d in device_param.split(',') if d.strip()]
+        
+        export_format = request.args.get('format', 'json')
+        if export_format not in EXPORT_FORMATS:
+            return jsonify({"status": "error", "message": f"Unsupported format: {export_format}"}), 400
         
         # Parse time range parameters (default to last 24 hours)
-        minutes = int(request.args.get('minutes', 1440))
+        try:
+            minutes = int(request.args.get('minutes', 1440))
+        except ValueError:
+            return jsonify({"status": "error", "message": "minutes must be an integer"}), 400
+        if minutes <= 0:
+            return jsonify({"status": "error", "message": "minutes must be positive"}), 400
         
         # Calculate time range
         now = int(time.time())
         start = now - (minutes * 60)
         
-        # Construct device filter if provided
-        device_filter = f',device="{device_id}"' if device_id else ''
+        # Raw samples come from /api/v1/export, so there is no step sampling
+        selector = series_selector(metrics_list, devices_list)
+        app.logger.info(f"Export Query: {selector} (full resolution, {export_format})")
         
-        # Construct query - we don't use step size for export to get all data points
-        query = f'{metric}{{{device_filter}}}'
+        try:
+            blocks = vm_client.iter_export(selector, start, now)
+        except Overloaded:
+            raise
+        except Exception as e:
+            app.logger.error(f"Export query failed: {str(e)}")
+            return jsonify({"status": "error", "message": "No data available"}), 404
         
-        params = {
-            'query': query,
-            'start': start,
-            'end': now
-        }
+        rows = iter_export_rows(blocks, export_format)
         
-        app.logger.info(f"Export Query: {query} (full resolution)")
+        def generate_json():
+            header = {"status": "success", "metric": metric_param, "device": device_param}
+            yield json.dumps(header)[:-1] + ', "data": ['
+            separator = ''
+            for timestamp, dt, metric_name, device, value in rows:
+                yield separator + json.dumps({
+                    "timestamp": timestamp,
+                    "datetime": dt,
+                    "metric": metric_name,
+                    "device": device,
+                    "value": value
+                })
+                separator = ', '
+            yield ']}'
         
-        # Increase timeout for export queries as they might be larger
-        response = requests.get(f"{VICTORIA_URL}/api/v1/query_range", params=params, timeout=20)
+        def generate_ndjson():
+            for timestamp, dt, metric_name, device, value in rows:
+                yield json.dumps({
+                    "timestamp": timestamp,
+                    "datetime": dt,
+                    "metric": metric_name,
+                    "device": device,
+                    "value": value
+                }) + '\n'
         
-        if response.status_code == 200:
-            data = response.json()
-            
-            # Process data for export
-            result = {
-                "status": "success",
-                "metric": metric,
-                "device": device_id,
-                "data": []
-            }
-            
-            if data.get('data', {}).get('result') and len(data['data']['result']) > 0:
-                values = data['data']['result'][0].get('values', [])
-                
-                for timestamp, value in values:
-                    try:
-                        if value != "NaN" and value != "nan":
-                            result["data"].append({
-                                "timestamp": int(timestamp),
-                                "datetime": datetime.fromtimestamp(int(timestamp)).strftime('%Y-%m-%d %H:%M:%S'),
-                                "value": float(value)
-                            })
-                    except (ValueError, TypeError):
-                        # Skip invalid values
-                        pass
-            
-            return jsonify(result)
+        def generate_csv():
+            # csv quotes label values containing commas, quotes or newlines
+            buffer = io.StringIO()
+            writer = csv.writer(buffer, lineterminator='\n')
+            single_series = len(metrics_list) == 1 and len(devices_list) == 1
+            if single_series:
+                writer.writerow(['Timestamp', CSV_METRIC_LABELS.get(metrics_list[0], metrics_list[0])])
+            else:
+                writer.writerow(['timestamp', 'datetime', 'metric', 'device', 'value'])
+            for timestamp, dt, metric_name, device, value in rows:
+                if single_series:
+                    writer.writerow([dt, value])
+                else:
+                    writer.writerow([timestamp, dt, metric_name, device, value])
+                if buffer.tell() >= 65536:
+                    yield buffer.getvalue()
+                    buffer.seek(0)
+                    buffer.truncate()
+            yield buffer.getvalue()
+        
+        def batched(lines, batch_size=500):
+            # Group small lines into larger chunks to keep per-chunk overhead down
+            buffer = []
+            for line in lines:
+                buffer.append(line)
+                if len(buffer) >= batch_size:
+                    yield ''.join(buffer)
+                    buffer = []
+            if buffer:
+                yield ''.join(buffer)
+        
+        generators = {'json': generate_json, 'ndjson': generate_ndjson, 'csv': generate_csv}
+        mimetype, extension = EXPORT_FORMATS[export_format]
+        
+        headers = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+        if export_format != 'json':
+            filename = f"{'_'.join(metrics_list)}_data.{extension}"
+            headers['Content-Disposition'] = f'attachment; filename="{filename}"'
         
-        return jsonify({"status": "error", "message": "No data available"}), 404
+        return Response(stream_with_context(batched(generators[export_format]())),
+                        mimetype=mimetype,
+                        headers=headers)
+    except Overloaded:
+        raise
     except Exception as e:
         app.logger.error(f"Error exporting data: {str(e)}", exc_info=True)
         return jsonify({"status": "error", "message": str(e)}), 500
@@ -0,0 +1,139 @@
+"""
+In-process response cache for the time-series endpoints.
+
+Entries are serialized response bodies keyed on a normalized query. Each entry
+has its own TTL, the cache is bounded by total body size with LRU eviction,
+and concurrent misses for the same key are coalesced so only one request goes
+upstream while the others wait for its result. Compressed variants of a body
+(one per Content-Encoding) are kept with its entry and count towards the cap.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+
+class _Flight:
+    """A computation in progress that other callers can wait on"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.body = None
+        self.error = None
+
+
+class ResponseCache:
+    """TTL + LRU cache with single-flight deduplication"""
+
+    def __init__(self, max_bytes, max_ttl):
+        self.max_bytes = max_bytes
+        self.max_ttl = max_ttl
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (expires_at, body, {encoding: encoded body})
+        self._inflight = {}
+        self._size = 0
+        self._stats = {"hits": 0, "misses": 0, "coalesced": 0, "evictions": 0}
+
+    def _evict(self, key):
+        _, body, variants = self._entries.pop(key)
+        self._size -= len(body) + sum(len(encoded) for encoded in variants.values())
+
+    def _trim(self):
+        # Drop least recently used entries until we're back under the cap
+        while self._size > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._evict(oldest)
+            self._stats["evictions"] += 1
+
+    def _store(self, key, body, ttl):
+        # Oversized bodies are served but never cached
+        if len(body) > self.max_bytes:
+            return
+
+        if key in self._entries:
+            self._evict(key)
+
+        self._entries[key] = (time.time() + min(ttl, self.max_ttl), body, {})
+        self._size += len(body)
+        self._trim()
+
+    def get_or_compute(self, key, ttl, compute):
+        """
+        Return (body, cache_status) for key, calling compute() on a miss.
+        compute() must return (body_bytes, cacheable); bodies are only stored
+        when cacheable is true, so partial or failed results are never reused.
+        cache_status is "HIT", "MISS" or "COALESCED".
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, body, _ = entry
+                if expires_at > time.time():
+                    self._entries.move_to_end(key)
+                    self._stats["hits"] += 1
+                    return body, "HIT"
+                self._evict(key)
+
+            flight = self._inflight.get(key)
+            if flight is not None:
+                self._stats["coalesced"] += 1
+                leader = False
+            else:
+                flight = _Flight()
+                self._inflight[key] = flight
+                self._stats["misses"] += 1
+                leader = True
+
+        if not leader:
+            # Another request is already fetching this key; share its result
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.body, "COALESCED"
+
+        try:
+            body, cacheable = compute()
+            flight.body = body
+            with self._lock:
+                if cacheable:
+                    self._store(key, body, ttl)
+            return body, "MISS"
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            flight.done.set()
+
+    def encoded(self, key, body, encoding, encode):
+        """
+        Return encode(body), kept with the entry for key under encoding so
+        later hits aren't compressed again. The variant is only stored while
+        key still caches this exact body.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] is body and encoding in entry[2]:
+                return entry[2][encoding]
+
+        encoded = encode(body)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] is body and encoding not in entry[2]:
+                entry[2][encoding] = encoded
+                self._size += len(encoded)
+                self._trim()
+        return encoded
+
+    def stats(self):
+        """Return hit/miss counters and current memory use"""
+        with self._lock:
+            stats = dict(self._stats)
+            lookups = stats["hits"] + stats["misses"] + stats["coalesced"]
+            stats["hit_ratio"] = (stats["hits"] + stats["coalesced"]) / lookups if lookups else 0.0
+            stats["entries"] = len(self._entries)
+            stats["bytes"] = self._size
+            stats["max_bytes"] = self.max_bytes
+            return stats
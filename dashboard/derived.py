@@ -0,0 +1,56 @@
+"""
+Derived metrics computed from stored series.
+
+A derived metric names the stored metrics it is computed from and a
+vectorized formula over their value arrays. The trend endpoints fetch the
+sources through the normal paths (hot tier, rollups, VM) and apply the
+formula to the whole range at once, so a derived series costs the same as
+its sources.
+"""
+
+import numpy as np
+
+
+def water_level(distance, tank):
+    """Water level in percent from sensor-to-surface distance (shorter distance, fuller tank)"""
+    distance = np.asarray(distance, dtype=np.float64)
+    max_distance = tank["maxDistance"]
+    min_distance = tank["minDistance"]
+
+    # Invalid configurations report the midpoint
+    if max_distance <= min_distance:
+        return np.where(np.isnan(distance), np.nan, 50.0)
+
+    level = (max_distance - distance) / (max_distance - min_distance) * 100
+    return np.clip(level, 0, 100)
+
+
+class DerivedMetric:
+    """A metric computed as formula(*source_values, tank)"""
+
+    def __init__(self, sources, formula):
+        self.sources = tuple(sources)
+        self.formula = formula
+
+    def compute(self, series, tank):
+        """
+        Apply the formula to {source: (timestamps, values)}. Sources are
+        aligned on their common timestamps first.
+        """
+        timestamps = series[self.sources[0]][0]
+        for source in self.sources[1:]:
+            timestamps = np.intersect1d(timestamps, series[source][0])
+
+        values = []
+        for source in self.sources:
+            source_timestamps, source_values = series[source]
+            if len(self.sources) > 1:
+                source_values = source_values[np.isin(source_timestamps, timestamps)]
+            values.append(source_values)
+        return timestamps, self.formula(*values, tank)
+
+
+# Metrics the trend endpoints compute instead of querying
+DERIVED_METRICS = {
+    "waterLevel": DerivedMetric(("distance",), water_level),
+}
@@ -0,0 +1,144 @@
+"""
+Cached registry of known devices.
+
+Devices are discovered from the VictoriaMetrics series index across all
+dashboard metrics (so a probe without a temperature sensor still shows up)
+and refreshed in the background once the entry is older than the TTL.
+A device's first_seen is the time of its oldest sample within the lookback
+window (tfirst_over_time), fetched with each refresh. Readings seen by the
+dashboard (VM snapshots, MQTT live updates) update the last seen time, so
+lookups never need a query.
+"""
+
+import threading
+import time
+
+from vm_client import series_selector
+
+
+class DeviceRegistry:
+    """In-memory device list with per-device metadata"""
+
+    def __init__(self, vm_client, metrics, ttl=300, lookback=7 * 86400, fallback=None, logger=None):
+        self.vm_client = vm_client
+        self.metrics = list(metrics)
+        self.ttl = ttl
+        self.lookback = lookback
+        self.fallback = list(fallback or [])
+        self.logger = logger
+
+        self._lock = threading.Lock()
+        self._devices = {}  # device -> {"first_seen", "last_seen", "metrics": set}
+        self._loaded_at = None
+        self._refreshing = False
+
+    def _first_seen(self, now):
+        """Time of each device's oldest sample within the lookback window"""
+        query = f'min(tfirst_over_time({series_selector(self.metrics)}[{self.lookback}s])) by (device)'
+        response = self.vm_client.query(query, now, query_type="devices")
+        response.raise_for_status()
+        first_seen = {}
+        for result in response.json().get('data', {}).get('result', []):
+            device = result.get('metric', {}).get('device')
+            if device:
+                first_seen[device] = int(float(result['value'][1]))
+        return first_seen
+
+    def refresh(self):
+        """Reload the device index from VM's series API"""
+        now = int(time.time())
+        params = {
+            'match[]': series_selector(self.metrics),
+            'start': now - self.lookback,
+            'end': now
+        }
+        response = self.vm_client.get("/api/v1/series", params=params, query_type="devices")
+        response.raise_for_status()
+
+        discovered = {}
+        for labels in response.json().get('data', []):
+            device = labels.get('device')
+            if device:
+                discovered.setdefault(device, set()).add(labels.get('__name__'))
+
+        # The device list is still worth having without first-seen times
+        try:
+            first_seen = self._first_seen(now)
+        except Exception as e:
+            if self.logger:
+                self.logger.error(f"Error getting device first-seen times: {str(e)}")
+            first_seen = {}
+
+        with self._lock:
+            for device, metric_names in discovered.items():
+                entry = self._devices.setdefault(device, {"first_seen": None, "last_seen": None, "metrics": set()})
+                entry["metrics"] = metric_names | entry["metrics"]
+                if device in first_seen:
+                    entry["first_seen"] = min(entry["first_seen"] or first_seen[device], first_seen[device])
+            # Devices with no series and no reading in the lookback window are dropped
+            for device, entry in list(self._devices.items()):
+                if device not in discovered and (entry["last_seen"] or 0) < now - self.lookback:
+                    del self._devices[device]
+            self._loaded_at = time.time()
+
+    def _refresh_in_background(self):
+        try:
+            self.refresh()
+        except Exception as e:
+            if self.logger:
+                self.logger.error(f"Error refreshing device registry: {str(e)}")
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def _ensure_fresh(self):
+        with self._lock:
+            loaded_at = self._loaded_at
+            if loaded_at is not None and time.time() - loaded_at < self.ttl:
+                return
+            if loaded_at is not None:
+                # Serve the current list while a single refresh runs behind it
+                if not self._refreshing:
+                    self._refreshing = True
+                    threading.Thread(target=self._refresh_in_background, name="device-registry", daemon=True).start()
+                return
+
+        # Nothing loaded yet: the first caller has to wait for the index
+        try:
+            self.refresh()
+        except Exception as e:
+            if self.logger:
+                self.logger.error(f"Error getting device list: {str(e)}")
+            # Retry in the background in a little while instead of on every call
+            with self._lock:
+                if self._loaded_at is None:
+                    self._loaded_at = time.time() - self.ttl + min(30, self.ttl)
+
+    def observe(self, device, timestamp, metric_names=()):
+        """Record that a reading for device was seen at timestamp"""
+        with self._lock:
+            entry = self._devices.setdefault(device, {"first_seen": timestamp, "last_seen": None, "metrics": set()})
+            entry["first_seen"] = timestamp if entry["first_seen"] is None else min(entry["first_seen"], timestamp)
+            entry["last_seen"] = timestamp if entry["last_seen"] is None else max(entry["last_seen"], timestamp)
+            entry["metrics"].update(metric_names)
+
+    def devices(self):
+        """Known device ids in name order (fallback list if none are known)"""
+        self._ensure_fresh()
+        with self._lock:
+            if not self._devices:
+                return list(self.fallback)
+            return sorted(self._devices)
+
+    def details(self):
+        """Per-device metadata: first_seen, last_seen and the metrics it reports"""
+        self._ensure_fresh()
+        with self._lock:
+            return {
+                device: {
+                    "first_seen": entry["first_seen"],
+                    "last_seen": entry["last_seen"],
+                    "metrics": sorted(entry["metrics"])
+                }
+                for device, entry in self._devices.items()
+            }
@@ -0,0 +1,107 @@
+"""
+Shape-preserving downsampling for time series.
+
+Series are fetched at native resolution and reduced here to at most
+`max_points` points before they are sent to the browser. All functions take
+and return NumPy arrays of timestamps (seconds) and values; NaN samples are
+dropped before reduction.
+"""
+
+import numpy as np
+
+# Reduction modes accepted by the `downsample` query parameter
+MODES = ("lttb", "minmax", "avg")
+
+
+def _bucket_index(t, buckets):
+    """Assign each sample to one of `buckets` equal-width time buckets"""
+    edges = np.linspace(t[0], t[-1], buckets + 1)
+    return np.clip(np.searchsorted(edges, t, side='right') - 1, 0, buckets - 1)
+
+
+def lttb(t, v, max_points):
+    """Largest-Triangle-Three-Buckets: keeps the points that best preserve the visual shape"""
+    size = len(t)
+    if max_points >= size or max_points < 3:
+        return t, v
+
+    # Interior points are split into max_points - 2 buckets; first and last are always kept
+    every = (size - 2) / (max_points - 2)
+    edges = (np.floor(np.arange(max_points - 1) * every) + 1).astype(np.int64)
+    edges[-1] = size - 1
+    bounds = np.append(edges, size)
+
+    # Average of every bucket (and of the final point), computed in one pass
+    t_sum = np.concatenate(([0.0], np.cumsum(t)))
+    v_sum = np.concatenate(([0.0], np.cumsum(v)))
+    counts = bounds[1:] - bounds[:-1]
+    avg_t = (t_sum[bounds[1:]] - t_sum[bounds[:-1]]) / counts
+    avg_v = (v_sum[bounds[1:]] - v_sum[bounds[:-1]]) / counts
+
+    selected = np.empty(max_points, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = size - 1
+
+    # Each pick depends on the previous one, so buckets are walked in order;
+    # the triangle areas within a bucket are computed vectorized
+    a = 0
+    for i in range(max_points - 2):
+        lo, hi = edges[i], edges[i + 1]
+        area = np.abs(
+            (t[a] - avg_t[i + 1]) * (v[lo:hi] - v[a])
+            - (t[a] - t[lo:hi]) * (avg_v[i + 1] - v[a])
+        )
+        a = lo + int(np.argmax(area))
+        selected[i + 1] = a
+
+    return t[selected], v[selected]
+
+
+def minmax(t, v, max_points):
+    """Keep the minimum and maximum sample of each time bucket, so spikes always survive"""
+    if len(t) <= max_points:
+        return t, v
+
+    buckets = max(1, max_points // 2)
+    bucket = _bucket_index(t, buckets)
+
+    # Sort by (bucket, value): the first entry of a bucket is its min, the last its max
+    order = np.lexsort((v, bucket))
+    sorted_buckets = bucket[order]
+    starts = np.flatnonzero(np.r_[True, sorted_buckets[1:] != sorted_buckets[:-1]])
+    ends = np.r_[starts[1:], len(order)] - 1
+
+    selected = np.unique(np.concatenate((order[starts], order[ends])))
+    return t[selected], v[selected]
+
+
+def bucket_avg(t, v, max_points):
+    """Average samples into equal-width time buckets"""
+    if len(t) <= max_points:
+        return t, v
+
+    bucket = _bucket_index(t, max_points)
+    counts = np.bincount(bucket, minlength=max_points)
+    t_sum = np.bincount(bucket, weights=t, minlength=max_points)
+    v_sum = np.bincount(bucket, weights=v, minlength=max_points)
+
+    filled = counts > 0
+    return t_sum[filled] / counts[filled], v_sum[filled] / counts[filled]
+
+
+def downsample(t, v, max_points, mode="lttb"):
+    """Drop NaN samples and reduce a series to at most max_points points"""
+    t = np.asarray(t, dtype=np.float64)
+    v = np.asarray(v, dtype=np.float64)
+
+    valid = ~np.isnan(v)
+    t, v = t[valid], v[valid]
+    if len(t) == 0:
+        return t, v
+
+    if mode == "minmax":
+        return minmax(t, v, max_points)
+    if mode == "avg":
+        return bucket_avg(t, v, max_points)
+    return lttb(t, v, max_points)
+
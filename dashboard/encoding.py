@@ -0,0 +1,139 @@
+"""
+Payload encodings for the time-series endpoints.
+
+Series are held as NumPy arrays (timestamps in seconds, values with NaN for
+missing points) and encoded for the wire in one of three formats:
+
+- points:   [[timestamp, value], ...] (the original format)
+- columnar: {"start", "step" or "dt", "v"}: regular grids only send start/step,
+            irregular series send delta-encoded timestamps
+- binary:   little-endian buffers readable as JS typed arrays (see encode_binary)
+"""
+
+import json
+import struct
+
+import numpy as np
+
+FORMATS = ("points", "columnar", "binary")
+
+BINARY_MAGIC = b"PLTB"
+BINARY_VERSION = 1
+BINARY_MIMETYPE = "application/vnd.plantomio.series"
+
+
+def parse_vm_values(values):
+    """Convert VictoriaMetrics [[timestamp, "value"], ...] pairs to (timestamps, values) arrays"""
+    if not values:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+
+    timestamps = np.array([point[0] for point in values], dtype=np.float64).astype(np.int64)
+    raw = [point[1] for point in values]
+    try:
+        # NumPy parses "NaN"/"nan" and numeric strings itself
+        parsed = np.array(raw, dtype=np.float64)
+    except (ValueError, TypeError):
+        # Fall back to a per-point parse, turning bad values into NaN
+        parsed = np.array([_to_float(value) for value in raw], dtype=np.float64)
+    return timestamps, parsed
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (ValueError, TypeError):
+        return float('nan')
+
+
+def _nullable(values):
+    """List of floats with NaN replaced by None for JSON"""
+    return [None if value != value else value for value in values.tolist()]
+
+
+def to_point_list(timestamps, values):
+    """[[timestamp, value], ...] with null for NaN"""
+    timestamps = np.rint(np.asarray(timestamps, dtype=np.float64)).astype(np.int64)
+    return [list(point) for point in zip(timestamps.tolist(), _nullable(values))]
+
+
+def regular_step(timestamps):
+    """Return the step if timestamps form a regular grid, else None"""
+    if len(timestamps) < 2:
+        return None
+    deltas = np.diff(timestamps)
+    return int(deltas[0]) if deltas[0] > 0 and np.all(deltas == deltas[0]) else None
+
+
+def to_columnar(timestamps, values):
+    """Columnar encoding of one series"""
+    timestamps = np.rint(np.asarray(timestamps, dtype=np.float64)).astype(np.int64)
+    series = {"count": len(timestamps), "v": _nullable(values)}
+    if len(timestamps) == 0:
+        return series
+
+    series["start"] = int(timestamps[0])
+    step = regular_step(timestamps)
+    if step is not None:
+        series["step"] = step
+    elif len(timestamps) > 1:
+        # Irregular series: deltas from the previous timestamp
+        series["dt"] = np.diff(timestamps).tolist()
+    return series
+
+
+def _align(offset, alignment=8):
+    return (offset + alignment - 1) // alignment * alignment
+
+
+def encode_binary(series, value_type="f64", meta=None):
+    """
+    Encode {name: (timestamps, values)} as one binary payload. Keys in meta
+    (e.g. the incremental update cursor) are added to the JSON header.
+
+    Layout (all little-endian):
+      bytes 0-3   magic "PLTB"
+      bytes 4-7   uint32 length of the JSON header
+      bytes 8-    JSON header {"version", "series": [{"name", "count", "start",
+                  "step" | "t_offset", "v_offset", "v_type"}]}
+      data        starts at the next multiple of 8 after the header; holds
+                  8-byte aligned buffers of Float64 timestamps (irregular
+                  series only) and Float32/Float64 values, NaN for missing.
+                  t_offset/v_offset are relative to the start of this section.
+    """
+    dtype = np.dtype("<f4") if value_type == "f32" else np.dtype("<f8")
+
+    entries = []
+    buffers = []
+    offset = 0
+    for name, (timestamps, values) in series.items():
+        timestamps = np.asarray(timestamps, dtype=np.float64)
+        entry = {"name": name, "count": len(timestamps), "v_type": "f32" if dtype.itemsize == 4 else "f64"}
+        if len(timestamps):
+            entry["start"] = float(timestamps[0])
+
+        step = regular_step(timestamps)
+        if step is not None:
+            entry["step"] = step
+        elif len(timestamps):
+            entry["t_offset"] = offset
+            buffers.append((offset, timestamps.astype("<f8").tobytes()))
+            offset = _align(offset + timestamps.nbytes)
+
+        entry["v_offset"] = offset
+        data = np.asarray(values, dtype=np.float64).astype(dtype).tobytes()
+        buffers.append((offset, data))
+        offset = _align(offset + len(data))
+        entries.append(entry)
+
+    header = {"version": BINARY_VERSION, "series": entries}
+    header.update(meta or {})
+    header_bytes = json.dumps(header, separators=(',', ':')).encode('utf-8')
+    data_start = _align(8 + len(header_bytes))
+
+    payload = bytearray(data_start + offset)
+    payload[0:8] = BINARY_MAGIC + struct.pack("<I", len(header_bytes))
+    payload[8:8 + len(header_bytes)] = header_bytes
+    for relative_offset, data in buffers:
+        start = data_start + relative_offset
+        payload[start:start + len(data)] = data
+    return bytes(payload)
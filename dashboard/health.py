@@ -0,0 +1,113 @@
+"""
+Background health probing for /health.
+
+Each service has a probe with its own interval and timeout. One thread per
+worker runs the probes that are due and records status, latency and the
+time of the last status change, so /health answers from memory instead of
+waiting on sockets, HTTP calls and subprocesses.
+"""
+
+import os
+import socket
+import subprocess
+import threading
+import time
+
+
+def tcp_probe(host, port):
+    """Probe that reports "ok" if a TCP connection can be opened"""
+    def probe(timeout):
+        try:
+            with socket.create_connection((host, port), timeout=timeout):
+                return "ok"
+        except OSError:
+            return "error"
+    return probe
+
+
+def http_probe(vm_client, path="/health"):
+    """Probe that reports "ok" if VictoriaMetrics answers path with HTTP 200"""
+    def probe(timeout):
+        try:
+            response = vm_client.get(path, query_type="health", timeout=timeout)
+            return "ok" if response.status_code == 200 else "error"
+        except Exception:
+            return "error"
+    return probe
+
+
+def ap_mode_probe(timeout):
+    """Report "ok" if a wireless interface is in access point (Master) mode"""
+    try:
+        result = subprocess.run(["iwconfig"], capture_output=True, text=True, timeout=timeout)
+    except (OSError, subprocess.TimeoutExpired):
+        # No iwconfig or it hung; we can't tell
+        return "unknown"
+    return "ok" if "Mode:Master" in result.stdout else "inactive"
+
+
+class HealthProber:
+    """Runs service probes in the background and keeps their latest results"""
+
+    def __init__(self, logger=None):
+        self.logger = logger
+
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._checks = {}
+        self._states = {}
+        self._thread = None
+        self._pid = None
+
+    def add(self, name, probe, interval=30, timeout=2):
+        """Register probe(timeout) -> status, run every interval seconds"""
+        self._checks[name] = {"probe": probe, "interval": interval, "timeout": timeout, "next_run": 0.0}
+        self._states[name] = {"status": "unknown", "latency_ms": None, "checked_at": None, "last_change": None}
+
+    def _run_check(self, name):
+        check = self._checks[name]
+        started = time.perf_counter()
+        try:
+            status = check["probe"](check["timeout"])
+        except Exception as e:
+            if self.logger:
+                self.logger.error(f"Error probing {name}: {str(e)}")
+            status = "error"
+        latency_ms = round((time.perf_counter() - started) * 1000, 1)
+
+        now = time.time()
+        with self._lock:
+            state = self._states[name]
+            if state["status"] != status:
+                state["last_change"] = now
+            state.update(status=status, latency_ms=latency_ms, checked_at=now)
+        check["next_run"] = time.monotonic() + check["interval"]
+
+    def refresh(self):
+        """Run every probe now (used for ?fresh=1)"""
+        with self._refresh_lock:
+            for name in self._checks:
+                self._run_check(name)
+
+    def start(self):
+        """Start the probe thread (once per process)"""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name="health-prober", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._refresh_lock:
+                for name, check in self._checks.items():
+                    if check["next_run"] <= time.monotonic():
+                        self._run_check(name)
+            next_run = min((check["next_run"] for check in self._checks.values()), default=time.monotonic() + 30)
+            time.sleep(max(0.5, next_run - time.monotonic()))
+
+    def states(self):
+        """Latest result per service"""
+        with self._lock:
+            return {name: dict(state) for name, state in self._states.items()}
@@ -0,0 +1,262 @@
+"""
+In-memory hot tier for recent samples.
+
+Each worker keeps the last few hours of raw samples per (device, metric) in
+fixed-size NumPy ring buffers, backfilled from VictoriaMetrics' export API
+when the worker starts and topped up with small incremental exports. Trend
+queries whose window lies inside the buffered range are answered from
+memory; anything older falls back to VM.
+"""
+
+import os
+import threading
+import time
+
+import numpy as np
+
+from vm_client import series_selector
+
+# Extra history loaded on backfill so a full `window` query still has its step lookback
+BACKFILL_MARGIN = 3600
+
+
+class SeriesRing:
+    """Fixed-capacity ring of (timestamp, value) samples in time order"""
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self._t = np.empty(capacity, dtype=np.float64)
+        self._v = np.empty(capacity, dtype=np.float64)
+        self._start = 0
+        self._count = 0
+        # Samples from covered_from onwards are all in the ring
+        self.covered_from = None
+
+    def __len__(self):
+        return self._count
+
+    @property
+    def nbytes(self):
+        return self._t.nbytes + self._v.nbytes
+
+    def last_timestamp(self):
+        return self._t[(self._start + self._count - 1) % self.capacity] if self._count else None
+
+    def load(self, timestamps, values, covered_from):
+        """Replace the contents with sorted samples (keeping the newest capacity)"""
+        timestamps = timestamps[-self.capacity:]
+        values = values[-self.capacity:]
+        count = len(timestamps)
+        self._t[:count] = timestamps
+        self._v[:count] = values
+        self._start = 0
+        self._count = count
+        self.covered_from = covered_from
+        if count == self.capacity:
+            self.covered_from = max(covered_from, float(timestamps[0]))
+
+    def extend(self, timestamps, values):
+        """Append sorted samples newer than the last one held; older ones are ignored"""
+        last = self.last_timestamp()
+        if last is not None:
+            newer = timestamps > last
+            timestamps, values = timestamps[newer], values[newer]
+        count = len(timestamps)
+        if count == 0:
+            return
+
+        if count >= self.capacity:
+            self.load(timestamps, values, self.covered_from if self.covered_from is not None else float(timestamps[0]))
+            return
+
+        index = (self._start + self._count + np.arange(count)) % self.capacity
+        self._t[index] = timestamps
+        self._v[index] = values
+        self._count += count
+
+        # Evict the oldest samples once full; coverage starts at the oldest one kept
+        if self._count > self.capacity:
+            self._start = (self._start + self._count - self.capacity) % self.capacity
+            self._count = self.capacity
+            if self.covered_from is not None:
+                self.covered_from = max(self.covered_from, float(self._t[self._start]))
+
+    def window(self, start, end):
+        """Samples with start <= timestamp <= end as (timestamps, values) copies"""
+        if self._count == 0:
+            return np.empty(0), np.empty(0)
+        index = (self._start + np.arange(self._count)) % self.capacity
+        timestamps = self._t[index]
+        lo = np.searchsorted(timestamps, start, side='left')
+        hi = np.searchsorted(timestamps, end, side='right')
+        return timestamps[lo:hi], self._v[index[lo:hi]]
+
+
+def resample(timestamps, values, start, end, step):
+    """
+    Evaluate raw samples on the start/end/step grid the way query_range does
+    for a plain selector: each point takes the last sample at or before it,
+    if that sample is within the lookback window. Points without a sample
+    are left out rather than returned as NaN.
+    """
+    grid = np.arange(start, end + 1, step, dtype=np.float64)
+    if len(timestamps) == 0 or len(grid) == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0)
+
+    index = np.searchsorted(timestamps, grid, side='right') - 1
+    valid = index >= 0
+    found = np.where(valid, index, 0)
+    valid &= grid - timestamps[found] < lookback_seconds(timestamps, step)
+    return grid[valid].astype(np.int64), values[found[valid]]
+
+
+def lookback_seconds(timestamps, step):
+    """Lookback window for resampling: the step, or twice the sample interval if that's longer"""
+    if len(timestamps) < 2:
+        return step
+    return max(step, 2 * float(np.median(np.diff(timestamps))))
+
+
+class HotTier:
+    """Ring buffers for every (device, metric), kept current from VM exports"""
+
+    def __init__(self, vm_client, metrics, capacity=10800, window=24 * 3600, overlap=60, logger=None):
+        self.vm_client = vm_client
+        self.metrics = list(metrics)
+        self.capacity = capacity
+        self.window = window
+        self.overlap = overlap
+        self.logger = logger
+
+        self._lock = threading.Lock()       # protects the rings
+        self._sync_lock = threading.Lock()  # one export at a time
+        self._rings = {}
+        self._synced_to = None
+        self._backfill_pid = None
+        self._stats = {"hits": 0, "misses": 0, "syncs": 0, "sync_errors": 0}
+
+    def _read_export(self, start, end, query_type="background"):
+        """Raw samples of all hot metrics between start and end, grouped by (device, metric)"""
+        chunks = {}
+        for block in self.vm_client.iter_export(series_selector(self.metrics), start, end, query_type=query_type):
+            labels = block.get('metric', {})
+            key = (labels.get('device'), labels.get('__name__'))
+            if key[0] is None or key[1] not in self.metrics:
+                continue
+            chunks.setdefault(key, []).append((
+                np.array(block.get('timestamps', []), dtype=np.float64) / 1000.0,
+                np.array(block.get('values', []), dtype=np.float64)
+            ))
+
+        series = {}
+        for key, parts in chunks.items():
+            timestamps = np.concatenate([part[0] for part in parts])
+            values = np.concatenate([part[1] for part in parts])
+            order = np.argsort(timestamps, kind='stable')
+            series[key] = (timestamps[order], values[order])
+        return series
+
+    def backfill(self):
+        """Load the last `window` seconds (plus a margin) for every series"""
+        with self._sync_lock:
+            end = int(time.time())
+            start = end - self.window - BACKFILL_MARGIN
+            series = self._read_export(start, end)
+            with self._lock:
+                self._rings = {}
+                for key, (timestamps, values) in series.items():
+                    ring = SeriesRing(self.capacity)
+                    ring.load(timestamps, values, float(start))
+                    self._rings[key] = ring
+                self._synced_to = end
+
+    def start_backfill(self):
+        """Backfill in a background thread (once per process); queries use VM until it's done"""
+        with self._lock:
+            if self._backfill_pid == os.getpid():
+                return
+            self._backfill_pid = os.getpid()
+        threading.Thread(target=self._backfill_in_background, name="hot-tier-backfill", daemon=True).start()
+
+    def _backfill_in_background(self):
+        try:
+            self.backfill()
+        except Exception as e:
+            if self.logger:
+                self.logger.error(f"Error backfilling hot tier: {str(e)}")
+            # Let a later request try again instead of retrying in a loop
+            time.sleep(30)
+            with self._lock:
+                self._backfill_pid = None
+
+    def sync(self, until):
+        """Fetch samples newer than the last sync, unless another request already covered until"""
+        with self._sync_lock:
+            if self._synced_to is None or self._synced_to >= until:
+                return
+            end = int(time.time())
+            # Re-read a little overlap so samples that reached VM late still arrive.
+            # Requests wait on this, so it is scheduled like a range query
+            series = self._read_export(self._synced_to - self.overlap, end, query_type="range")
+            with self._lock:
+                for key, (timestamps, values) in series.items():
+                    ring = self._rings.get(key)
+                    if ring is None:
+                        # New series: everything since the backfill window started is here
+                        ring = self._rings[key] = SeriesRing(self.capacity)
+                        ring.covered_from = float(self._synced_to - self.overlap)
+                    ring.extend(timestamps, values)
+                self._synced_to = end
+                self._stats["syncs"] += 1
+
+    def _ensure_synced(self, device_id, metric, end):
+        """True if device/metric is a hot series and the rings hold everything up to end"""
+        if not device_id or metric not in self.metrics or self._synced_to is None:
+            return False
+        if self._synced_to < end:
+            try:
+                self.sync(end)
+            except Exception as e:
+                self._stats["sync_errors"] += 1
+                if self.logger:
+                    self.logger.error(f"Error syncing hot tier: {str(e)}")
+                return False
+        return True
+
+    def _covering_ring(self, device_id, metric, start):
+        """The ring for device/metric if it holds every sample from start on, else None"""
+        ring = self._rings.get((device_id, metric))
+        if ring is None or ring.covered_from is None or ring.covered_from > start:
+            self._stats["misses"] += 1
+            return None
+        self._stats["hits"] += 1
+        return ring
+
+    def raw(self, device_id, metric, start, end):
+        """Raw (timestamps, values) for the window, or None if it isn't fully held"""
+        if not self._ensure_synced(device_id, metric, end):
+            return None
+        with self._lock:
+            ring = self._covering_ring(device_id, metric, start)
+            return ring.window(start, end) if ring is not None else None
+
+    def range(self, device_id, metric, start, end, step):
+        """query_range-style (timestamps, values) on the step grid, or None if it isn't fully held"""
+        if not self._ensure_synced(device_id, metric, end):
+            return None
+        # The first grid points look back before start
+        with self._lock:
+            ring = self._covering_ring(device_id, metric, start - 2 * step)
+            if ring is None:
+                return None
+            timestamps, values = ring.window(start - 2 * step, end)
+        return resample(timestamps, values, start, end, step)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["series"] = len(self._rings)
+            stats["samples"] = sum(len(ring) for ring in self._rings.values())
+            stats["bytes"] = sum(ring.nbytes for ring in self._rings.values())
+            stats["synced_to"] = self._synced_to
+            return stats
@@ -0,0 +1,229 @@
+"""
+Batched ingestion from MQTT into VictoriaMetrics.
+
+Runs as its own service next to the dashboard (`python ingest.py`) and
+replaces the Node-RED flow that POSTs every telemetry message to VM on its
+own. Messages are parsed like the dashboard's live updates, buffered in a
+bounded queue and written to /api/v1/import/prometheus in batches, with the
+device's own timestamp on every sample.
+
+When the buffer is full the MQTT callback blocks, which stops the client
+from acknowledging messages and lets the broker hold them back; samples are
+only dropped if the buffer stays full for longer than put_timeout.
+"""
+
+import logging
+import os
+import re
+import signal
+import threading
+import time
+from collections import deque
+
+import requests
+import yaml
+
+from mqtt_live import TelemetrySubscriber
+
+# Characters not allowed in Prometheus metric names
+INVALID_NAME_CHARS = re.compile(r'[^a-zA-Z0-9_:]')
+
+
+def metric_name(name, prefix=''):
+    """Prefix a telemetry key and make it a valid Prometheus metric name"""
+    name = INVALID_NAME_CHARS.sub('_', prefix + name)
+    return '_' + name if name[:1].isdigit() else name
+
+
+def escape_label(value):
+    """Escape a label value for the Prometheus text format"""
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_sample(device_id, timestamp, name, value, prefix=''):
+    """One Prometheus text line with the device label and a millisecond timestamp"""
+    return f'{metric_name(name, prefix)}{{device="{escape_label(device_id)}"}} {value!r} {int(round(timestamp * 1000))}'
+
+
+class SampleBuffer:
+    """Bounded FIFO of formatted samples shared by the MQTT thread and the writer"""
+
+    def __init__(self, max_samples):
+        self.max_samples = max_samples
+        self.dropped = 0
+
+        self._samples = deque()
+        self._cond = threading.Condition()
+        self._closed = False
+
+    def __len__(self):
+        with self._cond:
+            return len(self._samples)
+
+    def put(self, lines, timeout):
+        """Add one message's samples, waiting up to timeout for room; False if they were dropped"""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            # A message bigger than the whole buffer is let through on its own
+            while self._samples and len(self._samples) + len(lines) > self.max_samples and not self._closed:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.dropped += len(lines)
+                    return False
+                self._cond.wait(remaining)
+            self._samples.extend(lines)
+            self._cond.notify_all()
+            return True
+
+    def take(self, batch_size, max_wait):
+        """Wait until batch_size samples are buffered or max_wait has passed, then return up to batch_size"""
+        deadline = time.monotonic() + max_wait
+        with self._cond:
+            while len(self._samples) < batch_size and not self._closed:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            batch = [self._samples.popleft() for _ in range(min(batch_size, len(self._samples)))]
+            # Wake producers waiting for room
+            self._cond.notify_all()
+            return batch
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    @property
+    def closed(self):
+        with self._cond:
+            return self._closed
+
+
+class IngestBridge:
+    """Turns telemetry readings into samples and writes them to VM in batches"""
+
+    def __init__(self, import_url, buffer, batch_size=1000, flush_interval=1.0, prefix='',
+                 put_timeout=30.0, timeout=10, logger=None, session=None):
+        self.import_url = import_url
+        self.buffer = buffer
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.prefix = prefix
+        self.put_timeout = put_timeout
+        self.timeout = timeout
+        self.logger = logger or logging.getLogger(__name__)
+        self.session = session or requests.Session()
+
+        self._writer = None
+        self.stats = {"readings": 0, "samples": 0, "written": 0, "batches": 0, "write_errors": 0}
+
+    def on_reading(self, device_id, timestamp, values):
+        """MQTT callback: format a reading and queue it, blocking while the buffer is full"""
+        lines = [format_sample(device_id, timestamp, name, value, self.prefix) for name, value in values.items()]
+        self.stats["readings"] += 1
+        self.stats["samples"] += len(lines)
+        if not self.buffer.put(lines, self.put_timeout):
+            self.logger.warning(f"Ingest buffer full, dropped {len(lines)} samples from {device_id}")
+
+    def write(self, batch):
+        """POST one batch, retrying with backoff while VM is unavailable; True once written"""
+        body = ('\n'.join(batch) + '\n').encode('utf-8')
+        delay = 1.0
+        while True:
+            try:
+                response = self.session.post(self.import_url, data=body, timeout=self.timeout)
+                if 400 <= response.status_code < 500 and response.status_code != 429:
+                    # VM rejected the batch itself; retrying it would never succeed
+                    self.stats["write_errors"] += 1
+                    self.logger.error(f"VictoriaMetrics rejected {len(batch)} samples: HTTP {response.status_code} {response.text[:200]}")
+                    return False
+                response.raise_for_status()
+                self.stats["written"] += len(batch)
+                self.stats["batches"] += 1
+                return True
+            except requests.exceptions.RequestException as e:
+                self.stats["write_errors"] += 1
+                self.logger.error(f"Error writing {len(batch)} samples to VictoriaMetrics: {str(e)}")
+
+            # Keep the batch while VM is down; the buffer filling up pushes back on MQTT
+            if self.buffer.closed:
+                return False
+            time.sleep(delay)
+            delay = min(delay * 2, 30.0)
+
+    def run(self):
+        """Writer loop: flush whenever a batch is full or flush_interval has passed"""
+        while True:
+            batch = self.buffer.take(self.batch_size, self.flush_interval)
+            if batch:
+                self.write(batch)
+            elif self.buffer.closed:
+                return
+
+    def start(self):
+        self._writer = threading.Thread(target=self.run, name="ingest-writer", daemon=True)
+        self._writer.start()
+
+    def stop(self, timeout=10):
+        """Stop accepting samples and flush what is left"""
+        self.buffer.close()
+        if self._writer is not None:
+            self._writer.join(timeout)
+
+
+def load_config():
+    """Load config.yml, or the file SYHUB_CONFIG points at (like the dashboard)"""
+    config_path = os.environ.get('SYHUB_CONFIG') or os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'config/config.yml')
+    with open(config_path, 'r') as file:
+        return yaml.safe_load(file)
+
+
+def main():
+    config = load_config()
+    ingest_config = config.get('ingest') or {}
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+    logger = logging.getLogger('ingest')
+
+    # The dashboard queries unprefixed metric names, so the prefix is opt-in
+    prefix = (config['project'].get('metrics_prefix') or '') if ingest_config.get('apply_metrics_prefix', False) else ''
+
+    bridge = IngestBridge(
+        f"http://localhost:{config['victoria_metrics']['port']}/api/v1/import/prometheus",
+        SampleBuffer(ingest_config.get('max_buffered_samples', 50000)),
+        batch_size=ingest_config.get('batch_size', 1000),
+        flush_interval=ingest_config.get('flush_interval', 1.0),
+        prefix=prefix,
+        put_timeout=ingest_config.get('put_timeout', 30.0),
+        logger=logger
+    )
+    subscriber = TelemetrySubscriber(
+        host=ingest_config.get('host', 'localhost'),
+        port=config['mqtt']['port'],
+        topic=config['mqtt']['topic_telemetry'],
+        on_reading=bridge.on_reading,
+        username=config['mqtt'].get('username'),
+        password=config['mqtt'].get('password'),
+        client_id_base=config['mqtt'].get('client_id_base', config['project']['name']),
+        logger=logger,
+        role='ingest',
+        qos=1
+    )
+
+    stopping = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stopping.set())
+    signal.signal(signal.SIGINT, lambda signum, frame: stopping.set())
+
+    bridge.start()
+    subscriber.start()
+    logger.info(f"Ingesting {config['mqtt']['topic_telemetry']} into VictoriaMetrics")
+
+    stopping.wait()
+    subscriber.stop()
+    bridge.stop()
+    logger.info(f"Ingest stopped: {bridge.stats}, dropped {bridge.buffer.dropped} samples")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,249 @@
+"""
+Prometheus metrics for the dashboard process.
+
+Each gunicorn worker keeps its own counters, gauges and histograms in memory
+and periodically writes them to <directory>/<pid>.json. /metrics is served by
+whichever worker gets the request: it merges every live worker's file (and
+its own current values) and renders the Prometheus text format, so
+VictoriaMetrics can scrape the dashboard through any worker.
+
+Files left behind by dead workers (gunicorn's max_requests, crashes) are
+folded into <directory>/aggregate.json before they are removed: their
+counters and histograms are added to it so the totals never go down, and
+their gauges are dropped, as in prometheus_client's multiprocess mode. Values are summed across workers, except gauges
+declared with merge='max' or 'min', for state every worker holds a copy of.
+"""
+
+import fcntl
+import json
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+POINT_BUCKETS = (10, 100, 1000, 10000, 100000, 1000000)
+
+
+def _label_key(labels):
+    return tuple(sorted((labels or {}).items()))
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels, extra=None):
+    pairs = list(labels) + list(extra or ())
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Registry:
+    """Per-process metrics, shared with the other workers through files"""
+
+    def __init__(self, directory, write_interval=5.0):
+        self.directory = directory
+        self.write_interval = write_interval
+
+        self._lock = threading.Lock()
+        self._types = {}        # name -> (type, help, buckets, merge)
+        self._values = {}       # (name, label_key) -> value, or [bucket counts..., sum, count]
+        self._collectors = []
+        self._written_at = 0.0
+
+        os.makedirs(directory, exist_ok=True)
+
+    def describe(self, name, metric_type, help_text, buckets=None, merge='sum'):
+        """
+        Declare a counter, gauge or histogram (buckets are upper bounds).
+        merge says how a gauge's per-worker values are combined: 'sum' for
+        per-worker quantities, 'max' or 'min' for copies of the same state.
+        """
+        if merge not in ('sum', 'max', 'min') or (merge != 'sum' and metric_type != 'gauge'):
+            raise ValueError(f"{name}: merge={merge} is only supported for gauges as sum, max or min")
+        self._types[name] = (metric_type, help_text, tuple(buckets) if buckets else None, merge)
+
+    def add_collector(self, callback):
+        """Call callback(registry) before every snapshot, to copy in values kept elsewhere"""
+        self._collectors.append(callback)
+
+    def inc(self, name, labels=None, value=1):
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+    def set(self, name, value, labels=None):
+        """Set a gauge, or a counter that is tracked elsewhere"""
+        with self._lock:
+            self._values[(name, _label_key(labels))] = value
+
+    def observe(self, name, value, labels=None):
+        buckets = self._types[name][2]
+        key = (name, _label_key(labels))
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [0] * len(buckets) + [0.0, 0]
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    entry[i] += 1
+            entry[-2] += value
+            entry[-1] += 1
+
+    @contextmanager
+    def time(self, name, labels=None):
+        """Observe the duration of a block in a histogram"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, labels)
+
+    def snapshot(self):
+        """This worker's values as a JSON-serializable list"""
+        for callback in self._collectors:
+            callback(self)
+        with self._lock:
+            return [[name, dict(labels), value] for (name, labels), value in self._values.items()]
+
+    def _path(self, pid):
+        return os.path.join(self.directory, f"{pid}.json")
+
+    def _write_json(self, path, data):
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, prefix='.metrics.')
+        try:
+            with os.fdopen(fd, 'w') as file:
+                file.write(json.dumps(data, separators=(',', ':')))
+            os.replace(temp_path, path)
+        except Exception:
+            os.unlink(temp_path)
+            raise
+
+    def write(self):
+        """Write this worker's snapshot atomically"""
+        self._write_json(self._path(os.getpid()), self.snapshot())
+        self._written_at = time.monotonic()
+
+    def _read_aggregate(self):
+        try:
+            with open(os.path.join(self.directory, 'aggregate.json')) as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return []
+
+    def _fold_dead_worker(self, path):
+        """Add a dead worker's counters and histograms to the aggregate and remove its file"""
+        with open(os.path.join(self.directory, '.aggregate.lock'), 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            # Another worker may have folded it while we waited for the lock
+            try:
+                with open(path) as file:
+                    snapshot = json.load(file)
+            except FileNotFoundError:
+                return
+            except ValueError:
+                snapshot = []
+
+            totals = {(name, _label_key(labels)): value for name, labels, value in self._read_aggregate()}
+            for name, labels, value in snapshot:
+                metric_type = self._types.get(name, ('gauge',))[0]
+                if metric_type == 'gauge':
+                    continue
+                key = (name, _label_key(labels))
+                current = totals.get(key)
+                if current is None:
+                    totals[key] = value
+                elif isinstance(value, list):
+                    totals[key] = [a + b for a, b in zip(current, value)]
+                else:
+                    totals[key] = current + value
+
+            self._write_json(os.path.join(self.directory, 'aggregate.json'),
+                             [[name, dict(labels), value] for (name, labels), value in totals.items()])
+            os.unlink(path)
+
+    def maybe_write(self):
+        """Write the snapshot if the last write is older than write_interval"""
+        if time.monotonic() - self._written_at >= self.write_interval:
+            self.write()
+
+    def _worker_snapshots(self):
+        """Snapshots of all live workers plus the dead ones' aggregate; this worker's is taken fresh"""
+        snapshots = [self.snapshot()]
+        for filename in os.listdir(self.directory):
+            if not filename.endswith('.json'):
+                continue
+            try:
+                pid = int(filename[:-5])
+            except ValueError:
+                continue
+            if pid == os.getpid():
+                continue
+            try:
+                os.kill(pid, 0)
+            except ProcessLookupError:
+                # Left behind by a worker that exited
+                try:
+                    self._fold_dead_worker(os.path.join(self.directory, filename))
+                except (OSError, ValueError):
+                    pass
+                continue
+            except PermissionError:
+                pass
+            try:
+                with open(os.path.join(self.directory, filename)) as file:
+                    snapshots.append(json.load(file))
+            except (OSError, ValueError):
+                continue
+        try:
+            snapshots.append(self._read_aggregate())
+        except (OSError, ValueError):
+            pass
+        return snapshots
+
+    def render(self):
+        """Prometheus text exposition of all workers' metrics, merged"""
+        merged = {}
+        for snapshot in self._worker_snapshots():
+            for name, labels, value in snapshot:
+                key = (name, _label_key(labels))
+                current = merged.get(key)
+                merge = self._types[name][3] if name in self._types else 'sum'
+                if current is None:
+                    merged[key] = list(value) if isinstance(value, list) else value
+                elif isinstance(value, list):
+                    merged[key] = [a + b for a, b in zip(current, value)]
+                elif merge == 'max':
+                    merged[key] = max(current, value)
+                elif merge == 'min':
+                    merged[key] = min(current, value)
+                else:
+                    merged[key] = current + value
+
+        lines = []
+        for name, (metric_type, help_text, buckets, _) in sorted(self._types.items()):
+            series = sorted((labels, value) for (series_name, labels), value in merged.items() if series_name == name)
+            if not series:
+                continue
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            for labels, value in series:
+                if metric_type == 'histogram':
+                    for bound, count in zip(buckets, value):
+                        lines.append(f"{name}_bucket{_format_labels(labels, [('le', _format_value(float(bound)))])} {count}")
+                    lines.append(f"{name}_bucket{_format_labels(labels, [('le', '+Inf')])} {value[-1]}")
+                    lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(float(value[-2]))}")
+                    lines.append(f"{name}_count{_format_labels(labels)} {value[-1]}")
+                else:
+                    lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        return '\n'.join(lines) + '\n'
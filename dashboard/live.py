@@ -0,0 +1,139 @@
+"""
+Shared live-snapshot poller for the dashboard.
+
+One poller runs per gunicorn worker. It refreshes the latest sensor snapshot
+once per interval and wakes every SSE subscriber, so the cost of an extra open
+dashboard tab is a blocked wait instead of a full set of VictoriaMetrics queries.
+"""
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+
+class SnapshotPoller:
+    """Background poller that fans one snapshot out to many subscribers"""
+
+    def __init__(self, fetch, interval, logger=None):
+        self._fetch = fetch
+        self._interval = interval
+        self._logger = logger
+
+        self._cond = threading.Condition()
+        self._snapshot = None
+        self._version = 0
+        self._fetched_at = None
+        self._subscribers = 0
+        self._internal = 0      # Subscribers that aren't SSE clients (the alert engine)
+        self._thread = None
+        self._pid = None
+
+    def _ensure_running(self):
+        """Start the poller thread lazily (and again after a fork)"""
+        # gunicorn forks workers after import, so a thread started in the
+        # master would not exist in the worker; check the pid to be safe
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            return
+
+        self._pid = os.getpid()
+        self._thread = threading.Thread(target=self._run, name="snapshot-poller", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            # Sleep while nobody is listening so idle workers don't poll VM
+            with self._cond:
+                while self._subscribers == 0:
+                    self._cond.wait()
+
+            started = time.time()
+            try:
+                snapshot = self._fetch()
+            except Exception as e:
+                if self._logger:
+                    self._logger.error(f"Error refreshing live snapshot: {str(e)}")
+                snapshot = None
+
+            if snapshot is not None:
+                self.publish(snapshot)
+                with self._cond:
+                    self._fetched_at = time.monotonic()
+
+            # Wait out the rest of the interval
+            remaining = self._interval - (time.time() - started)
+            if remaining > 0:
+                time.sleep(remaining)
+
+    def publish(self, snapshot):
+        """Store a new snapshot and wake all waiting subscribers"""
+        with self._cond:
+            self._snapshot = snapshot
+            self._version += 1
+            self._cond.notify_all()
+
+    def latest(self):
+        """Return the most recent snapshot, or None if nothing was fetched yet"""
+        with self._cond:
+            return self._snapshot
+
+    def age(self):
+        """
+        Seconds since the poller last fetched a snapshot, or None if it never
+        did. Snapshots published in between (MQTT readings) don't count, and
+        the poller doesn't fetch while nobody is subscribed.
+        """
+        with self._cond:
+            return time.monotonic() - self._fetched_at if self._fetched_at is not None else None
+
+    @property
+    def subscriber_count(self):
+        """SSE clients currently subscribed (internal subscribers aren't counted)"""
+        with self._cond:
+            return self._subscribers - self._internal
+
+    @contextmanager
+    def subscribe(self, internal=False):
+        """
+        Register an SSE client for the lifetime of the with-block. internal
+        subscribers keep the poller running like a client but are left out
+        of subscriber_count.
+        """
+        with self._cond:
+            self._ensure_running()
+            self._subscribers += 1
+            self._internal += 1 if internal else 0
+            self._cond.notify_all()
+
+        try:
+            yield Subscription(self)
+        finally:
+            with self._cond:
+                self._subscribers -= 1
+                self._internal -= 1 if internal else 0
+
+
+class Subscription:
+    """Per-client cursor into the poller's snapshot stream"""
+
+    def __init__(self, poller):
+        self._poller = poller
+        self._seen_version = 0
+
+    def wait(self, timeout):
+        """
+        Block until a snapshot newer than the last one returned is available.
+        Returns the snapshot, or None if the timeout expired first.
+        """
+        poller = self._poller
+        deadline = time.time() + timeout
+
+        with poller._cond:
+            while poller._version <= self._seen_version:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return None
+                poller._cond.wait(remaining)
+
+            self._seen_version = poller._version
+            return poller._snapshot
@@ -0,0 +1,176 @@
+"""
+Push-based live updates from MQTT.
+
+When enabled, each dashboard worker subscribes to the telemetry topic itself
+and keeps the latest reading per device in memory, so new readings reach SSE
+clients as soon as they are published instead of after the next VM poll.
+"""
+
+import json
+import os
+import threading
+import time
+
+try:
+    import paho.mqtt.client as mqtt
+except ImportError:  # Only needed when dashboard.mqtt_live.enabled is true
+    mqtt = None
+
+
+def parse_telemetry(payload):
+    """
+    Parse a Plantomio telemetry message into (device_id, timestamp, values).
+    Mirrors the Node-RED formatter: every key except deviceID and timestamp
+    whose value parses as a finite number is a metric. The device timestamp
+    is used when present (seconds or milliseconds), otherwise arrival time;
+    it is returned as float seconds so millisecond precision survives.
+    """
+    if isinstance(payload, (bytes, bytearray)):
+        payload = payload.decode('utf-8')
+    message = json.loads(payload)
+    if not isinstance(message, dict):
+        raise ValueError("Telemetry payload must be a JSON object")
+
+    device_id = message.get('deviceID') or 'unknown'
+
+    timestamp = time.time()
+    try:
+        device_timestamp = float(message.get('timestamp'))
+        if device_timestamp > 0:
+            # Treat anything past the year 33658 in seconds as milliseconds
+            timestamp = device_timestamp / 1000.0 if device_timestamp > 1e12 else device_timestamp
+    except (TypeError, ValueError):
+        pass
+
+    values = {}
+    for key, value in message.items():
+        if key in ('deviceID', 'timestamp'):
+            continue
+        try:
+            value = float(value)
+        except (TypeError, ValueError):
+            continue
+        if value == value and value not in (float('inf'), float('-inf')):
+            values[key] = value
+
+    return device_id, timestamp, values
+
+
+class LiveState:
+    """Latest value and timestamp per device and metric"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._devices = {}
+
+    def update(self, device_id, timestamp, values, newer_only=False):
+        """
+        Record a reading and return a copy of the device's current state.
+        MQTT readings always replace the stored value (device clocks may be
+        skewed); with newer_only, values only fill gaps or replace older ones.
+        """
+        with self._lock:
+            state = self._devices.setdefault(device_id, {})
+            for metric_name, value in values.items():
+                previous = state.get(metric_name)
+                if newer_only and previous is not None and timestamp <= previous['last_updated']:
+                    continue
+                state[metric_name] = {'value': value, 'last_updated': timestamp}
+            return {name: dict(entry) for name, entry in state.items()}
+
+    def get(self, device_id):
+        """Current state for a device, or None if nothing was received for it"""
+        with self._lock:
+            state = self._devices.get(device_id)
+            if state is None:
+                return None
+            return {name: dict(entry) for name, entry in state.items()}
+
+    def devices(self):
+        with self._lock:
+            return list(self._devices)
+
+
+class TelemetrySubscriber:
+    """MQTT subscriber that feeds telemetry messages to a callback"""
+
+    def __init__(self, host, port, topic, on_reading, username=None, password=None,
+                 client_id_base='dashboard', logger=None, client_factory=None,
+                 role='dashboard', qos=0):
+        self.host = host
+        self.port = port
+        self.topic = topic
+        self.qos = qos
+        self.role = role
+        self.on_reading = on_reading
+        self.username = username
+        self.password = password
+        self.client_id_base = client_id_base
+        self.logger = logger
+        # Tests and benchmarks can pass a factory returning a fake client
+        self._client_factory = client_factory or self._paho_client
+
+        self._client = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self.stats = {"messages": 0, "errors": 0, "connected": False}
+
+    @staticmethod
+    def _paho_client(client_id):
+        if mqtt is None:
+            raise RuntimeError("paho-mqtt is not installed")
+        # paho-mqtt 2.x requires choosing a callback API version
+        if hasattr(mqtt, 'CallbackAPIVersion'):
+            return mqtt.Client(mqtt.CallbackAPIVersion.VERSION1, client_id=client_id)
+        return mqtt.Client(client_id=client_id)
+
+    def start(self):
+        """Connect in the background (once per process)"""
+        with self._lock:
+            if self._client is not None and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+
+            # Each gunicorn worker needs its own client id or the broker kicks the others
+            client = self._client_factory(f"{self.client_id_base}-{self.role}-{os.getpid()}")
+            if self.username:
+                client.username_pw_set(self.username, self.password)
+            client.on_connect = self._on_connect
+            client.on_disconnect = self._on_disconnect
+            client.on_message = self._on_message
+            client.reconnect_delay_set(min_delay=1, max_delay=30)
+            client.connect_async(self.host, self.port, keepalive=60)
+            client.loop_start()
+            self._client = client
+
+    def stop(self):
+        with self._lock:
+            if self._client is not None:
+                self._client.loop_stop()
+                self._client.disconnect()
+                self._client = None
+
+    def _on_connect(self, client, userdata, flags, rc, *args):
+        self.stats["connected"] = rc == 0
+        if rc == 0:
+            client.subscribe(self.topic, qos=self.qos)
+        elif self.logger:
+            self.logger.error(f"MQTT live connection refused: rc={rc}")
+
+    def _on_disconnect(self, client, userdata, rc, *args):
+        self.stats["connected"] = False
+
+    def _on_message(self, client, userdata, message):
+        self.handle_message(message.payload)
+
+    def handle_message(self, payload):
+        """Parse one telemetry payload and hand it to the callback"""
+        try:
+            device_id, timestamp, values = parse_telemetry(payload)
+            if values:
+                self.on_reading(device_id, timestamp, values)
+            self.stats["messages"] += 1
+        except Exception as e:
+            self.stats["errors"] += 1
+            if self.logger:
+                self.logger.error(f"Error handling MQTT telemetry: {str(e)}")
@@ -0,0 +1,329 @@
+"""
+Hourly and daily rollups for long-range trends.
+
+A background job materializes min, max, sum and count per (device, metric)
+into a local SQLite database: hourly buckets from VictoriaMetrics' raw
+export, daily buckets from the hourly ones. Each resolution has a watermark
+so a run only processes buckets completed since the last one, plus the
+trailing `overlap` seconds of hours, which are rolled up again on every run
+so samples that reach VM late (buffered devices, ingest retries) are still
+counted; days are only rolled up once none of their hours will be redone.
+Only one
+process runs the job at a time (an flock on <db>.lock); every worker can
+read the database.
+
+Run `python rollups.py` to process once from cron or by hand.
+"""
+
+import fcntl
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+from vm_client import series_selector
+
+HOUR = 3600
+DAY = 86400
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS rollups (
+    resolution INTEGER NOT NULL,
+    device TEXT NOT NULL,
+    metric TEXT NOT NULL,
+    ts INTEGER NOT NULL,
+    min REAL NOT NULL,
+    max REAL NOT NULL,
+    sum REAL NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (resolution, device, metric, ts)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS watermarks (
+    resolution INTEGER PRIMARY KEY,
+    processed_from INTEGER NOT NULL,
+    processed_to INTEGER NOT NULL
+);
+"""
+
+
+def aggregate(timestamps, values, resolution):
+    """
+    Reduce sorted raw samples to buckets of `resolution` seconds.
+    Returns (bucket_start, min, max, sum, count) arrays; NaN samples are skipped.
+    """
+    valid = ~np.isnan(values)
+    timestamps, values = timestamps[valid], values[valid]
+    if len(timestamps) == 0:
+        empty = np.empty(0)
+        return empty.astype(np.int64), empty, empty, empty, empty.astype(np.int64)
+
+    buckets = (timestamps // resolution).astype(np.int64) * resolution
+    starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+    counts = np.diff(np.r_[starts, len(values)])
+    return (buckets[starts], np.minimum.reduceat(values, starts), np.maximum.reduceat(values, starts),
+            np.add.reduceat(values, starts), counts)
+
+
+def combine(rows, start, step):
+    """
+    Merge (ts, min, max, sum, count) rows into `step`-wide buckets aligned to
+    start and return (timestamps, averages) like a range query would.
+    """
+    ts, _, _, sums, counts = rows
+    if len(ts) == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0)
+
+    buckets = start + (ts - start) // step * step
+    order = np.argsort(buckets, kind='stable')
+    buckets, sums, counts = buckets[order], sums[order], counts[order]
+    starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+    return buckets[starts], np.add.reduceat(sums, starts) / np.add.reduceat(counts, starts)
+
+
+class RollupStore:
+    """SQLite-backed hourly/daily rollups with an incremental processing job"""
+
+    def __init__(self, path, vm_client, metrics, backfill_days=365, settle=300, overlap=HOUR,
+                 chunk=DAY, max_chunks_per_run=30, logger=None):
+        self.path = path
+        self.vm_client = vm_client
+        self.metrics = list(metrics)
+        self.backfill_days = backfill_days
+        self.settle = settle
+        self.overlap = overlap
+        self.chunk = chunk
+        self.max_chunks_per_run = max_chunks_per_run
+        self.logger = logger
+
+        self._lock_file = None
+        self._thread_pid = None
+        self._thread_lock = threading.Lock()
+
+        with self._connect() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.executescript(SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        """A connection that commits on success and is always closed"""
+        db = sqlite3.connect(self.path, timeout=10)
+        try:
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    def processed_range(self, resolution):
+        """(start, end) of the processed range for a resolution (end exclusive), or None"""
+        with self._connect() as db:
+            row = db.execute("SELECT processed_from, processed_to FROM watermarks WHERE resolution = ?",
+                             (resolution,)).fetchone()
+        return tuple(row) if row else None
+
+    def watermark(self, resolution):
+        """End (exclusive) of the processed range for a resolution, or None"""
+        processed = self.processed_range(resolution)
+        return processed[1] if processed else None
+
+    def _set_watermark(self, db, resolution, processed_from, processed_to):
+        db.execute("INSERT INTO watermarks (resolution, processed_from, processed_to) VALUES (?, ?, ?) "
+                   "ON CONFLICT(resolution) DO UPDATE SET processed_to = excluded.processed_to",
+                   (resolution, processed_from, processed_to))
+
+    def _read_export(self, start, end):
+        """Raw samples of every metric in [start, end), grouped by (device, metric)"""
+        chunks = {}
+        # VM's export end is inclusive
+        for block in self.vm_client.iter_export(series_selector(self.metrics), start, f"{end - 0.001:.3f}",
+                                                query_type="background"):
+            labels = block.get('metric', {})
+            key = (labels.get('device'), labels.get('__name__'))
+            if key[0] is None or key[1] not in self.metrics:
+                continue
+            chunks.setdefault(key, []).append((
+                np.array(block.get('timestamps', []), dtype=np.float64) / 1000.0,
+                np.array(block.get('values', []), dtype=np.float64)
+            ))
+
+        for key, parts in chunks.items():
+            timestamps = np.concatenate([part[0] for part in parts])
+            values = np.concatenate([part[1] for part in parts])
+            order = np.argsort(timestamps, kind='stable')
+            yield key, timestamps[order], values[order]
+
+    def process_hourly(self, now=None):
+        """Roll up raw samples for completed hours since the hourly watermark, minus the overlap"""
+        now = int(now or time.time())
+        ready_to = (now - self.settle) // HOUR * HOUR
+        processed = self.processed_range(HOUR)
+        if processed is None:
+            origin = watermark = start = (now - self.backfill_days * DAY) // DAY * DAY
+        else:
+            origin, watermark = processed
+            start = max(origin, (watermark - self.overlap) // HOUR * HOUR)
+
+        for _ in range(self.max_chunks_per_run):
+            if start >= ready_to:
+                break
+            end = min(start + self.chunk, ready_to)
+            rows = []
+            for (device, metric), timestamps, values in self._read_export(start, end):
+                buckets = aggregate(timestamps, values, HOUR)
+                rows.extend((HOUR, device, metric, *row) for row in zip(*(column.tolist() for column in buckets)))
+
+            with self._connect() as db:
+                db.executemany("INSERT OR REPLACE INTO rollups VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+                self._set_watermark(db, HOUR, origin, max(end, watermark))
+            start = end
+
+    def process_daily(self):
+        """Roll up hourly buckets into days completed since the daily watermark"""
+        hourly_to = self.watermark(HOUR)
+        if hourly_to is None:
+            return
+        # Hours inside the overlap may still change
+        ready_to = (hourly_to - self.overlap) // DAY * DAY
+        start = self.watermark(DAY)
+        if start is None:
+            # Hourly processing always starts on a day boundary
+            start = self.processed_range(HOUR)[0]
+        if start >= ready_to:
+            return
+
+        with self._connect() as db:
+            db.execute(
+                "INSERT OR REPLACE INTO rollups "
+                "SELECT ?, device, metric, ts / ? * ?, MIN(min), MAX(max), SUM(sum), SUM(count) "
+                "FROM rollups WHERE resolution = ? AND ts >= ? AND ts < ? "
+                "GROUP BY device, metric, ts / ?",
+                (DAY, DAY, DAY, HOUR, start, ready_to, DAY)
+            )
+            self._set_watermark(db, DAY, start, ready_to)
+
+    def _acquire(self):
+        """Take the job lock without blocking; True if this process holds it"""
+        if self._lock_file is not None:
+            return True
+        lock_file = open(self.path + '.lock', 'w')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        return True
+
+    def run_once(self):
+        """Process new data if no other process holds the job lock; True if it ran"""
+        if not self._acquire():
+            return False
+        self.process_hourly()
+        self.process_daily()
+        return True
+
+    def start(self, interval=300):
+        """Run the job every interval seconds in a background thread (once per process)"""
+        with self._thread_lock:
+            if self._thread_pid == os.getpid():
+                return
+            self._thread_pid = os.getpid()
+        threading.Thread(target=self._run, args=(interval,), name="rollups", daemon=True).start()
+
+    def _run(self, interval):
+        while True:
+            try:
+                self.run_once()
+            except Exception as e:
+                if self.logger:
+                    self.logger.error(f"Error processing rollups: {str(e)}")
+            time.sleep(interval)
+
+    def rows(self, resolution, device_id, metric, start, end):
+        """Stored (ts, min, max, sum, count) arrays for buckets starting in [start, end)"""
+        with self._connect() as db:
+            data = db.execute(
+                "SELECT ts, min, max, sum, count FROM rollups "
+                "WHERE resolution = ? AND device = ? AND metric = ? AND ts >= ? AND ts < ? ORDER BY ts",
+                (resolution, device_id, metric, start, end)
+            ).fetchall()
+        if not data:
+            empty = np.empty(0)
+            return empty.astype(np.int64), empty, empty, empty, empty.astype(np.int64)
+        columns = np.array(data, dtype=np.float64).T
+        return columns[0].astype(np.int64), columns[1], columns[2], columns[3], columns[4].astype(np.int64)
+
+    def range_rows(self, device_id, metric, start, end, fetch_raw, use_daily=False):
+        """
+        Bucket rows covering [start, end]: daily rows where available (if
+        use_daily), hourly rows up to the hourly watermark, and the tail since
+        then aggregated from raw samples via fetch_raw(start, end).
+        Returns None if the rollups haven't caught up with the recent past.
+        """
+        # The window has to start inside the processed history, and the raw
+        # tail is only worth fetching while the job keeps up
+        hourly = self.processed_range(HOUR)
+        if hourly is None or start < hourly[0] or end - hourly[1] > 2 * HOUR + self.settle:
+            return None
+        hourly_to = hourly[1]
+
+        parts = []
+        position = start
+        if use_daily:
+            daily_to = self.watermark(DAY)
+            if daily_to is not None and daily_to > position:
+                parts.append(self.rows(DAY, device_id, metric, position, daily_to))
+                position = daily_to
+        parts.append(self.rows(HOUR, device_id, metric, position, hourly_to))
+        position = max(position, hourly_to)
+
+        if position <= end:
+            timestamps, values = fetch_raw(position, end)
+            parts.append(aggregate(np.asarray(timestamps, dtype=np.float64), np.asarray(values, dtype=np.float64), HOUR))
+
+        return tuple(np.concatenate([part[i] for part in parts]) for i in range(5))
+
+    def series(self, device_id, metric, start, end, step, fetch_raw):
+        """Average per step bucket as (timestamps, values), or None if rollups can't serve it"""
+        if metric not in self.metrics or step % HOUR:
+            return None
+        rows = self.range_rows(device_id, metric, start, end, fetch_raw, use_daily=step % DAY == 0)
+        if rows is None:
+            return None
+        return combine(rows, start, step)
+
+
+def main():
+    import logging
+    import yaml
+    from vm_client import VMClient
+
+    # Same config as the dashboard (SYHUB_CONFIG points at another file)
+    config_path = os.environ.get('SYHUB_CONFIG') or os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'config/config.yml')
+    with open(config_path, 'r') as file:
+        config = yaml.safe_load(file)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+    logger = logging.getLogger('rollups')
+
+    rollup_config = config['dashboard'].get('rollups') or {}
+    store = RollupStore(
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), rollup_config.get('path', 'rollups.db')),
+        VMClient.from_config(f"http://localhost:{config['victoria_metrics']['port']}", config['dashboard'].get('vm_client')),
+        rollup_config.get('metrics') or ["temperature", "pH", "EC", "TDS", "distance", "ORP"],
+        backfill_days=rollup_config.get('backfill_days', 365),
+        settle=rollup_config.get('settle', 300),
+        overlap=rollup_config.get('overlap', 3600),
+        max_chunks_per_run=rollup_config.get('max_days_per_run', 30),
+        logger=logger
+    )
+    if store.run_once():
+        logger.info(f"Rollups processed up to {store.watermark(HOUR)} (hourly), {store.watermark(DAY)} (daily)")
+    else:
+        logger.info("Another process is running the rollup job")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,220 @@
+"""
+Admission control for VictoriaMetrics queries.
+
+Every VM request a worker makes first takes a slot from its QueryScheduler.
+Query types map to four classes (live, range, export, background), each with
+its own concurrency limit and queue timeout, under a shared limit for all
+classes. When slots are scarce, waiting live queries go first, then range
+queries, then exports, then background jobs (hot tier backfill, rollups), so
+a long export can't hold up the 2s snapshot queries and a rollup run can't
+take the slot of a user's download. A request that gets no slot within its
+class's queue timeout fails fast with Overloaded, which the dashboard
+answers with 503 and Retry-After.
+
+Classes marked shared (export and background by default) also take one of
+their `concurrency` slots across all workers, an flock on
+<lock_directory>/<class>.<n>.lock, so VM sees that many of them however many
+gunicorn workers there are.
+
+RateLimiter is a per-client token bucket for the expensive endpoints.
+"""
+
+import fcntl
+import math
+import os
+import threading
+import time
+import weakref
+from collections import OrderedDict
+
+# Query type -> scheduling class
+QUERY_CLASSES = {
+    "instant": "live",
+    "devices": "live",
+    "health": "live",
+    "range": "range",
+    "export": "export",
+    "background": "background",
+}
+
+# Classes in priority order
+PRIORITY = ("live", "range", "export", "background")
+
+DEFAULT_LIMITS = {
+    "live": {"concurrency": 4, "queue_timeout": 1.0, "shared": False},
+    "range": {"concurrency": 3, "queue_timeout": 5.0, "shared": False},
+    "export": {"concurrency": 1, "queue_timeout": 2.0, "shared": True},
+    "background": {"concurrency": 1, "queue_timeout": 60.0, "shared": True},
+}
+
+# How often a request waiting for a shared slot retries the locks
+SHARED_POLL_SECONDS = 0.05
+
+
+class Overloaded(Exception):
+    """No query slot became free within the queue timeout"""
+
+    def __init__(self, query_class, retry_after):
+        super().__init__(f"VictoriaMetrics is busy with {query_class} queries, retry in {retry_after}s")
+        self.query_class = query_class
+        self.retry_after = retry_after
+
+
+class QueryScheduler:
+    """Per-worker concurrency limits and priorities for VM requests"""
+
+    def __init__(self, max_concurrent=6, limits=None, lock_directory=None):
+        self.max_concurrent = max_concurrent
+        self.lock_directory = lock_directory
+        self.limits = {}
+        for name in PRIORITY:
+            self.limits[name] = dict(DEFAULT_LIMITS[name])
+            self.limits[name].update((limits or {}).get(name) or {})
+
+        self._condition = threading.Condition()
+        self._running = {name: 0 for name in PRIORITY}
+        self._waiting = {name: 0 for name in PRIORITY}
+        self._stats = {name: {"admitted": 0, "rejected": 0, "wait_seconds": 0.0} for name in PRIORITY}
+
+        if lock_directory:
+            os.makedirs(lock_directory, exist_ok=True)
+
+    @classmethod
+    def from_config(cls, options, lock_directory=None):
+        """Build a scheduler from the dashboard.query_scheduler section of config.yml"""
+        options = options or {}
+        return cls(
+            max_concurrent=options.get('max_concurrent', 6),
+            limits={name: options.get(name) for name in PRIORITY},
+            lock_directory=options.get('lock_directory') or lock_directory,
+        )
+
+    def _can_run(self, query_class):
+        if sum(self._running.values()) >= self.max_concurrent:
+            return False
+        if self._running[query_class] >= self.limits[query_class]["concurrency"]:
+            return False
+        # Waiting queries of a higher class take a free slot first, as long as their class has room
+        for name in PRIORITY[:PRIORITY.index(query_class)]:
+            if self._waiting[name] and self._running[name] < self.limits[name]["concurrency"]:
+                return False
+        return True
+
+    def _acquire_shared(self, query_class, deadline):
+        """Take one of the class's slots shared by all workers; the locked file, or None on timeout"""
+        while True:
+            for index in range(self.limits[query_class]["concurrency"]):
+                lock_file = open(os.path.join(self.lock_directory, f"{query_class}.{index}.lock"), 'w')
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    return lock_file
+                except OSError:
+                    lock_file.close()
+            if time.monotonic() >= deadline:
+                return None
+            time.sleep(SHARED_POLL_SECONDS)
+
+    def acquire(self, query_type):
+        """
+        Wait for a slot for a query type. Returns a release function (safe
+        to call more than once); raises Overloaded after the queue timeout.
+        """
+        query_class = QUERY_CLASSES.get(query_type, "range")
+        queue_timeout = self.limits[query_class]["queue_timeout"]
+        started = time.monotonic()
+
+        with self._condition:
+            self._waiting[query_class] += 1
+            try:
+                while not self._can_run(query_class):
+                    remaining = started + queue_timeout - time.monotonic()
+                    if remaining <= 0:
+                        self._stats[query_class]["rejected"] += 1
+                        # Lower classes may have been waiting on this query
+                        self._condition.notify_all()
+                        raise Overloaded(query_class, max(1, math.ceil(queue_timeout)))
+                    self._condition.wait(remaining)
+            finally:
+                self._waiting[query_class] -= 1
+            self._running[query_class] += 1
+
+        # Then the slot shared with the other workers, holding this worker's meanwhile
+        lock_file = None
+        if self.limits[query_class]["shared"] and self.lock_directory:
+            lock_file = self._acquire_shared(query_class, started + queue_timeout)
+            if lock_file is None:
+                with self._condition:
+                    self._running[query_class] -= 1
+                    self._stats[query_class]["rejected"] += 1
+                    self._condition.notify_all()
+                raise Overloaded(query_class, max(1, math.ceil(queue_timeout)))
+
+        with self._condition:
+            self._stats[query_class]["admitted"] += 1
+            self._stats[query_class]["wait_seconds"] += time.monotonic() - started
+
+        released = []
+
+        def release():
+            with self._condition:
+                if released:
+                    return
+                released.append(True)
+                self._running[query_class] -= 1
+                self._condition.notify_all()
+            if lock_file is not None:
+                lock_file.close()
+        return release
+
+    def hold_until_closed(self, response, release):
+        """Keep a streamed response's slot until it is closed (or garbage collected)"""
+        close = response.close
+
+        def close_and_release():
+            try:
+                close()
+            finally:
+                release()
+
+        response.close = close_and_release
+        weakref.finalize(response, release)
+
+    def stats(self):
+        """Admitted, rejected, running and waiting queries per class"""
+        with self._condition:
+            return {
+                name: dict(self._stats[name], running=self._running[name], waiting=self._waiting[name])
+                for name in PRIORITY
+            }
+
+
+class RateLimiter:
+    """Token bucket per client: `per_minute` requests, in bursts of up to `burst`"""
+
+    def __init__(self, per_minute, burst, max_clients=1024):
+        self.rate = per_minute / 60.0
+        self.burst = burst
+        self.max_clients = max_clients
+
+        self._lock = threading.Lock()
+        self._buckets = OrderedDict()  # client -> (tokens, updated)
+        self.rejected = 0
+
+    def check(self, client):
+        """Take a token for client; returns 0 if allowed, else seconds until one is available"""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(client, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            if tokens >= 1:
+                tokens -= 1
+                wait = 0
+            else:
+                wait = max(1, math.ceil((1 - tokens) / self.rate))
+                self.rejected += 1
+            self._buckets[client] = (tokens, now)
+
+            # Forget the least recently seen clients
+            while len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+        return wait
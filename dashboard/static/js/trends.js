@@ -106,22 +106,16 @@ document.addEventListener('DOMContentLoaded', function() {
                 minutes = parseInt(timeDropdown.value) || 60;
             }
             
-            // Get chart data and export (using full resolution export endpoint)
-            fetch(`/api/export?metric=${metric}&device=${deviceId}&minutes=${minutes}`)
-                .then(response => response.json())
-                .then(data => {
-                    if (!data.status || data.status !== 'success' || !data.data || data.data.length === 0) {
+            // Download the CSV streamed by the full resolution export endpoint
+            fetch(`/api/export?metric=${metric}&device=${deviceId}&minutes=${minutes}&format=csv`)
+                .then(response => {
+                    if (!response.ok) {
                         throw new Error('No data available');
                     }
-                    
-                    // Create CSV content
-                    let csv = 'Timestamp,' + getMetricLabel(metric) + '\n';
-                    data.data.forEach(point => {
-                        csv += point.datetime + ',' + (point.value !== null ? point.value : '') + '\n';
-                    });
-                    
+                    return response.blob();
+                })
+                .then(blob => {
                     // Create download
-                    const blob = new Blob([csv], { type: 'text/csv' });
                     const url = URL.createObjectURL(blob);
                     const a = document.createElement('a');
                     a.href = url;
@@ -143,6 +137,12 @@ document.addEventListener('DOMContentLoaded', function() {
     });
 });
 
+// Charts currently shown, with the cursor for incremental refreshes
+let trendsView = null;
+
+// Refresh the charts every minute with only the points since the last response
+setInterval(refreshAllCharts, 60000);
+
 // Load all charts
 function loadAllCharts(minutes, deviceId) {
     // Get list of metrics to load
@@ -182,22 +182,30 @@ function loadAllCharts(minutes, deviceId) {
         }
     });
     
-    // Fetch data for all metrics at once to reduce API calls
-    fetch(`/api/trends?metrics=${metrics.join(',')}&device=${deviceId}&minutes=${minutes}&step=${stepSize}`)
+    // Fetch data for all metrics at once to reduce API calls, as compact typed arrays
+    fetch(`/api/trends?metrics=${metrics.join(',')}&device=${deviceId}&minutes=${minutes}&step=${stepSize}&format=binary`)
         .then(response => {
             if (!response.ok) {
                 throw new Error(`HTTP error: ${response.status}`);
             }
-            return response.json();
+            return response.arrayBuffer();
         })
-        .then(result => {
-            if (result.status !== 'success' || !result.data) {
-                throw new Error('Invalid API response');
-            }
+        .then(buffer => {
+            const payload = decodeBinarySeries(buffer);
+            
+            // Remember the window so refreshes can ask for new points only
+            trendsView = {
+                metrics: metrics,
+                minutes: minutes,
+                deviceId: deviceId,
+                stepSize: stepSize,
+                cursor: payload.cursor,
+                series: payload.series
+            };
             
             // Process each metric
             metrics.forEach(metric => {
-                updateChart(metric, result.data[metric] || [], deviceId);
+                updateChart(metric, payload.series[metric] || [], deviceId);
             });
         })
         .catch(error => {
@@ -222,6 +230,79 @@ function loadAllCharts(minutes, deviceId) {
         });
 }
 
+// Fetch the points added since the last response and merge them into the charts
+function refreshAllCharts() {
+    const view = trendsView;
+    if (!view || !view.cursor || document.hidden) {
+        return;
+    }
+    
+    fetch(`/api/trends?metrics=${view.metrics.join(',')}&device=${view.deviceId}&minutes=${view.minutes}&step=${view.stepSize}&format=binary&cursor=${encodeURIComponent(view.cursor)}`)
+        .then(response => {
+            if (!response.ok) {
+                throw new Error(`HTTP error: ${response.status}`);
+            }
+            return response.arrayBuffer();
+        })
+        .then(buffer => {
+            // Ignore responses for a window the user has since left
+            if (trendsView !== view) {
+                return;
+            }
+            
+            const payload = decodeBinarySeries(buffer);
+            const cutoff = Date.now() / 1000 - view.minutes * 60;
+            view.metrics.forEach(metric => {
+                const fresh = payload.series[metric] || [];
+                if (payload.reset) {
+                    view.series[metric] = fresh;
+                } else {
+                    // New points replace any we already have from the same time on
+                    const from = fresh.length ? fresh[0][0] : Infinity;
+                    const kept = (view.series[metric] || []).filter(point => point[0] >= cutoff && point[0] < from);
+                    view.series[metric] = kept.concat(fresh);
+                }
+                updateChart(metric, view.series[metric], view.deviceId);
+            });
+            view.cursor = payload.cursor;
+        })
+        .catch(error => {
+            console.error('Error refreshing charts:', error);
+        });
+}
+
+// Decode a format=binary /api/trends payload into
+// {series: {metric: [[timestamp, value], ...]}, cursor, reset}
+function decodeBinarySeries(buffer) {
+    const view = new DataView(buffer);
+    const magic = String.fromCharCode(view.getUint8(0), view.getUint8(1), view.getUint8(2), view.getUint8(3));
+    if (magic !== 'PLTB') {
+        throw new Error('Invalid API response');
+    }
+    
+    // JSON header, then 8-byte aligned little-endian buffers
+    const headerLength = view.getUint32(4, true);
+    const header = JSON.parse(new TextDecoder().decode(new Uint8Array(buffer, 8, headerLength)));
+    const dataStart = Math.ceil((8 + headerLength) / 8) * 8;
+    
+    const result = {};
+    header.series.forEach(entry => {
+        const ValueArray = entry.v_type === 'f32' ? Float32Array : Float64Array;
+        const values = new ValueArray(buffer, dataStart + entry.v_offset, entry.count);
+        const timestamps = entry.t_offset !== undefined
+            ? new Float64Array(buffer, dataStart + entry.t_offset, entry.count)
+            : null;
+        
+        const points = new Array(entry.count);
+        for (let i = 0; i < entry.count; i++) {
+            const timestamp = timestamps ? timestamps[i] : entry.start + i * entry.step;
+            points[i] = [timestamp, Number.isNaN(values[i]) ? null : values[i]];
+        }
+        result[entry.name] = points;
+    });
+    return {series: result, cursor: header.cursor, reset: header.reset};
+}
+
 // Update a specific chart
 function updateChart(metric, data, deviceId) {
     // Get chart elements
@@ -396,19 +477,6 @@ function getChartConfig(metric) {
     }
 }
 
-// Get metric label
-function getMetricLabel(metric) {
-    switch (metric) {
-        case 'temperature': return 'Temperature (°C)';
-        case 'pH': return 'pH Level';
-        case 'TDS': return 'TDS (ppm)';
-        case 'EC': return 'EC (μS/cm)';
-        case 'distance': return 'Distance (m)';
-        case 'ORP': return 'ORP (mV)';
-        default: return metric;
-    }
-}
-
 // Update service status if the function exists
 if (typeof updateServiceStatus === 'function') {
     // Initial update
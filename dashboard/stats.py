@@ -0,0 +1,97 @@
+"""
+Aggregates over time windows for /api/stats.
+
+Stored metrics are reduced inside VictoriaMetrics with its rollup functions
+(min_over_time, quantile_over_time, ...), so only the aggregates cross the
+wire. Derived metrics don't exist in VM; their sources are fetched and
+reduced here with NumPy instead, using the same window semantics: a bucket
+ending at t covers samples in (t - group, t]. NaN samples are skipped.
+"""
+
+import re
+
+import numpy as np
+
+# Stat name -> VictoriaMetrics rollup function; pNN stats use quantile_over_time
+ROLLUP_FUNCTIONS = {
+    "min": "min_over_time",
+    "max": "max_over_time",
+    "mean": "avg_over_time",
+    "sum": "sum_over_time",
+    "count": "count_over_time",
+    "stddev": "stddev_over_time",
+}
+
+DEFAULT_STATS = ("min", "max", "mean", "count")
+
+QUANTILE_PATTERN = re.compile(r'^p(\d{1,2}(?:\.\d+)?)$')
+
+
+def quantile_of(stat):
+    """The quantile (0-1) of a pNN stat such as p95 or p99.9, or None"""
+    match = QUANTILE_PATTERN.match(stat)
+    return float(match.group(1)) / 100 if match else None
+
+
+def parse_stats(value):
+    """Validate a comma separated list of stats, keeping the requested order"""
+    if not value:
+        return list(DEFAULT_STATS)
+
+    stats = []
+    for stat in value.split(','):
+        stat = stat.strip()
+        if not stat or stat in stats:
+            continue
+        if stat not in ROLLUP_FUNCTIONS and quantile_of(stat) is None:
+            raise ValueError(f"Unsupported stat: {stat}")
+        stats.append(stat)
+    return stats
+
+
+def rollup_query(stat, selector, window):
+    """PromQL computing one stat over the trailing window (seconds) of every series matching selector"""
+    quantile = quantile_of(stat)
+    if quantile is not None:
+        return f"quantile_over_time({quantile:g}, {selector}[{window}s]) keep_metric_names"
+    return f"{ROLLUP_FUNCTIONS[stat]}({selector}[{window}s]) keep_metric_names"
+
+
+def reduce(timestamps, values, stats, start, end, group):
+    """
+    Compute stats over samples in (start, end] in buckets of group seconds.
+    Returns (bucket_starts, {stat: values}); buckets without samples are left out.
+    """
+    timestamps = np.asarray(timestamps, dtype=np.float64)
+    values = np.asarray(values, dtype=np.float64)
+    keep = ~np.isnan(values) & (timestamps > start) & (timestamps <= end)
+    timestamps, values = timestamps[keep], values[keep]
+    if len(timestamps) == 0:
+        return np.empty(0, dtype=np.int64), {stat: np.empty(0) for stat in stats}
+
+    buckets = start + (np.ceil((timestamps - start) / group).astype(np.int64) - 1) * group
+    starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+    counts = np.diff(np.r_[starts, len(values)])
+    sums = np.add.reduceat(values, starts)
+    means = sums / counts
+
+    results = {}
+    for stat in stats:
+        if stat == "min":
+            results[stat] = np.minimum.reduceat(values, starts)
+        elif stat == "max":
+            results[stat] = np.maximum.reduceat(values, starts)
+        elif stat == "mean":
+            results[stat] = means
+        elif stat == "sum":
+            results[stat] = sums
+        elif stat == "count":
+            results[stat] = counts.astype(np.float64)
+        elif stat == "stddev":
+            # Population standard deviation, like stddev_over_time
+            squares = np.add.reduceat(values * values, starts)
+            results[stat] = np.sqrt(np.maximum(squares / counts - means * means, 0))
+        else:
+            quantile = quantile_of(stat)
+            results[stat] = np.array([np.quantile(part, quantile) for part in np.split(values, starts[1:])])
+    return buckets[starts].astype(np.int64), results
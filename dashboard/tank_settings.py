@@ -0,0 +1,128 @@
+"""
+Tank configuration shared by all dashboard workers.
+
+Settings live in a small JSON file. Updates are written atomically (temp
+file + rename) under an flock, and every worker notices changes made by the
+others through the file's mtime, so a POST to /api/tank-settings reaches all
+workers and survives restarts. Listeners are called whenever the settings
+change.
+"""
+
+import fcntl
+import json
+import os
+import tempfile
+import threading
+import time
+
+
+class TankSettings:
+    """File-backed settings with change notification"""
+
+    def __init__(self, path, defaults, check_interval=1.0, logger=None):
+        self.path = path
+        self.defaults = dict(defaults)
+        self.check_interval = check_interval
+        self.logger = logger
+
+        self._lock = threading.Lock()
+        self._settings = dict(defaults)
+        self._mtime = None
+        self._checked_at = 0.0
+        self._listeners = []
+
+        self._reload()
+
+    def add_listener(self, callback):
+        """Call callback(settings) whenever the settings change"""
+        self._listeners.append(callback)
+
+    def _notify(self, settings):
+        for callback in self._listeners:
+            try:
+                callback(dict(settings))
+            except Exception as e:
+                if self.logger:
+                    self.logger.error(f"Error in tank settings listener: {str(e)}")
+
+    def _read_file(self):
+        with open(self.path, 'r') as file:
+            stored = json.load(file)
+        settings = dict(self.defaults)
+        settings.update({key: value for key, value in stored.items() if key in self.defaults})
+        return settings
+
+    def _reload(self):
+        """Re-read the file if its mtime changed; True if the settings changed"""
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return False
+        if mtime == self._mtime:
+            return False
+
+        try:
+            settings = self._read_file()
+        except (OSError, ValueError) as e:
+            if self.logger:
+                self.logger.error(f"Error reading tank settings: {str(e)}")
+            return False
+
+        changed = settings != self._settings
+        self._settings = settings
+        self._mtime = mtime
+        return changed
+
+    def get(self):
+        """Current settings, picking up changes made by other workers"""
+        with self._lock:
+            changed = False
+            now = time.monotonic()
+            if now - self._checked_at >= self.check_interval:
+                self._checked_at = now
+                changed = self._reload()
+            settings = dict(self._settings)
+        if changed:
+            self._notify(settings)
+        return settings
+
+    @property
+    def version(self):
+        """Changes whenever the settings do; used in cache keys of derived series"""
+        self.get()
+        with self._lock:
+            return self._mtime
+
+    def update(self, changes):
+        """Apply changes, write the file atomically and return the new settings"""
+        lock_file = open(self.path + '.lock', 'w')
+        try:
+            # Serialize read-modify-write across workers
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            with self._lock:
+                self._checked_at = time.monotonic()
+                self._reload()
+                settings = dict(self._settings)
+                settings.update(changes)
+
+                directory = os.path.dirname(os.path.abspath(self.path))
+                fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.tank_settings.')
+                try:
+                    with os.fdopen(fd, 'w') as file:
+                        json.dump(settings, file, indent=2)
+                        file.flush()
+                        os.fsync(file.fileno())
+                    os.replace(temp_path, self.path)
+                except Exception:
+                    os.unlink(temp_path)
+                    raise
+
+                changed = settings != self._settings
+                self._settings = settings
+                self._mtime = os.stat(self.path).st_mtime_ns
+        finally:
+            lock_file.close()
+
+        if changed:
+            self._notify(settings)
+        return dict(settings)
@@ -0,0 +1,203 @@
+"""
+Pooled HTTP client for VictoriaMetrics.
+
+All dashboard traffic to VictoriaMetrics goes through a single VMClient per
+worker. It keeps connections alive in a requests.Session, retries idempotent
+GETs on connection errors and 502/503/504 responses, and records request
+counts, errors and latency per query type. With a QueryScheduler, each
+request waits for a slot of its query type's class first.
+"""
+
+import json
+import os
+import re
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Timeouts in seconds per query type, used when config.yml doesn't set one
+DEFAULT_TIMEOUTS = {
+    "instant": 2,
+    "devices": 3,
+    "range": 10,
+    "export": 20,
+    "background": 60,
+    "health": 2,
+}
+
+
+def quote_label(value):
+    """Quote a string for use as a PromQL label value"""
+    return '"' + str(value).replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+
+def series_selector(metrics, devices=None):
+    """Build a {__name__=~"a|b",device=~"x|y"} selector matching any of the given metrics and devices"""
+    matchers = [f'__name__=~{quote_label("|".join(re.escape(m) for m in metrics))}']
+    if devices:
+        matchers.append(f'device=~{quote_label("|".join(re.escape(d) for d in devices))}')
+    return '{' + ','.join(matchers) + '}'
+
+
+class VMClient:
+    """Keep-alive client for the VictoriaMetrics HTTP API"""
+
+    def __init__(self, base_url, pool_size=8, retries=2, backoff=0.2, timeouts=None, scheduler=None):
+        self.base_url = base_url.rstrip('/')
+        self.scheduler = scheduler
+        self.pool_size = pool_size
+        self.retries = retries
+        self.backoff = backoff
+        self.timeouts = dict(DEFAULT_TIMEOUTS)
+        self.timeouts.update(timeouts or {})
+
+        self._lock = threading.Lock()
+        self._session = None
+        self._pid = None
+        self._stats = {}
+        self._observers = []
+
+    @classmethod
+    def from_config(cls, base_url, options, scheduler=None):
+        """Build a client from the dashboard.vm_client section of config.yml"""
+        options = options or {}
+        return cls(
+            base_url,
+            pool_size=options.get('pool_size', 8),
+            retries=options.get('retries', 2),
+            backoff=options.get('backoff', 0.2),
+            timeouts=options.get('timeouts'),
+            scheduler=scheduler,
+        )
+
+    def _get_session(self):
+        """Return this process's session, creating it after a fork if needed"""
+        with self._lock:
+            if self._session is None or self._pid != os.getpid():
+                # Only connection failures and gateway errors are retried; a
+                # read timeout means VM is busy and retrying would only pile on
+                retry = Retry(
+                    total=self.retries,
+                    connect=self.retries,
+                    read=0,
+                    status=self.retries,
+                    backoff_factor=self.backoff,
+                    status_forcelist=(502, 503, 504),
+                    allowed_methods=frozenset(["GET"]),
+                    raise_on_status=False,
+                )
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size, max_retries=retry)
+
+                session = requests.Session()
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+
+                self._session = session
+                self._pid = os.getpid()
+            return self._session
+
+    def add_observer(self, callback):
+        """Call callback(query_type, elapsed, error) after every request"""
+        self._observers.append(callback)
+
+    def _record(self, query_type, elapsed, error):
+        for callback in self._observers:
+            callback(query_type, elapsed, error)
+        with self._lock:
+            entry = self._stats.setdefault(query_type, {
+                "requests": 0,
+                "errors": 0,
+                "total_seconds": 0.0,
+                "max_seconds": 0.0,
+            })
+            entry["requests"] += 1
+            entry["total_seconds"] += elapsed
+            entry["max_seconds"] = max(entry["max_seconds"], elapsed)
+            if error:
+                entry["errors"] += 1
+
+    def get(self, path, params=None, query_type="instant", timeout=None, stream=False):
+        """
+        Send a GET to VictoriaMetrics and return the response.
+        Non-2xx responses are returned (and counted as errors); connection
+        failures and timeouts raise requests exceptions as before. With a
+        scheduler, raises scheduler.Overloaded if no slot frees up in time;
+        streamed responses hold their slot until they are closed.
+        """
+        if timeout is None:
+            timeout = self.timeouts.get(query_type, DEFAULT_TIMEOUTS["range"])
+
+        release = self.scheduler.acquire(query_type) if self.scheduler is not None else None
+
+        started = time.perf_counter()
+        try:
+            response = self._get_session().get(
+                f"{self.base_url}{path}", params=params, timeout=timeout, stream=stream
+            )
+        except Exception:
+            self._record(query_type, time.perf_counter() - started, True)
+            if release is not None:
+                release()
+            raise
+
+        self._record(query_type, time.perf_counter() - started, response.status_code >= 400)
+        if release is not None:
+            if stream:
+                self.scheduler.hold_until_closed(response, release)
+            else:
+                release()
+        return response
+
+    def query(self, query, time_=None, query_type="instant"):
+        """Instant query via /api/v1/query"""
+        params = {'query': query}
+        if time_ is not None:
+            params['time'] = time_
+        return self.get("/api/v1/query", params=params, query_type=query_type)
+
+    def query_range(self, query, start, end, step=None, query_type="range"):
+        """Range query via /api/v1/query_range"""
+        params = {'query': query, 'start': start, 'end': end}
+        if step:
+            params['step'] = step
+        return self.get("/api/v1/query_range", params=params, query_type=query_type)
+
+    def iter_export(self, selector, start, end, query_type="export"):
+        """
+        Stream raw samples from /api/v1/export. Yields one dict per exported
+        block ({"metric": labels, "values": [...], "timestamps": [ms, ...]}),
+        so memory use is bounded by VM's block size rather than the time range.
+        Raises requests.HTTPError before yielding anything if VM rejects the query.
+        """
+        params = {'match[]': selector, 'start': start, 'end': end}
+        response = self.get("/api/v1/export", params=params, query_type=query_type, stream=True)
+        try:
+            response.raise_for_status()
+        except Exception:
+            response.close()
+            raise
+
+        return self._iter_lines(response)
+
+    @staticmethod
+    def _iter_lines(response):
+        try:
+            for line in response.iter_lines():
+                if line:
+                    yield json.loads(line)
+        finally:
+            response.close()
+
+    def stats(self):
+        """Return a copy of the per-query-type counters with average latency"""
+        with self._lock:
+            stats = {}
+            for query_type, entry in self._stats.items():
+                stats[query_type] = dict(entry)
+                stats[query_type]["avg_seconds"] = (
+                    entry["total_seconds"] / entry["requests"] if entry["requests"] else 0.0
+                )
+            return stats
@@ -272,6 +272,10 @@ load_config() {
     # Dashboard config
     DASHBOARD_PORT=$(yq e '.dashboard.port' "$CONFIG_FILE" 2>/dev/null)
     DASHBOARD_WORKERS=$(yq e '.dashboard.workers' "$CONFIG_FILE" 2>/dev/null)
+    DASHBOARD_WORKER_CLASS=$(yq e '.dashboard.worker_class // "sync"' "$CONFIG_FILE" 2>/dev/null)
+    DASHBOARD_WORKER_CONNECTIONS=$(yq e '.dashboard.worker_connections // 1000' "$CONFIG_FILE" 2>/dev/null)
+    DASHBOARD_MQTT_LIVE=$(yq e '.dashboard.mqtt_live.enabled // false' "$CONFIG_FILE" 2>/dev/null)
+    INGEST_ENABLED=$(yq e '.ingest.enabled // false' "$CONFIG_FILE" 2>/dev/null)
     
     # Node.js config
     NODEJS_VERSION=$(yq e '.nodejs.install_version' "$CONFIG_FILE" 2>/dev/null)
@@ -307,6 +311,10 @@ load_config() {
   NODERED_PASSWORD_HASH="${config_node_red_password_hash}"
   DASHBOARD_PORT="${config_dashboard_port}"
   DASHBOARD_WORKERS="${config_dashboard_workers}"
+  DASHBOARD_WORKER_CLASS="${config_dashboard_worker_class:-sync}"
+  DASHBOARD_WORKER_CONNECTIONS="${config_dashboard_worker_connections:-1000}"
+  DASHBOARD_MQTT_LIVE="${config_dashboard_mqtt_live_enabled:-false}"
+  INGEST_ENABLED="${config_ingest_enabled:-false}"
   NODEJS_VERSION="${config_nodejs_install_version}"
         CONFIGURE_NETWORK="${config_configure_network}"
         WIFI_AP_SSID="${config_wifi_ap_ssid}"
@@ -897,7 +905,21 @@ setup_dashboard() {
   chown -R $SYSTEM_USER:$SYSTEM_USER "$BASE_DIR/dashboard/venv"
   
   # Install Python dependencies
-  runuser -l $SYSTEM_USER -c "cd $BASE_DIR/dashboard && source venv/bin/activate && pip install flask gunicorn requests pyyaml"
+  runuser -l $SYSTEM_USER -c "cd $BASE_DIR/dashboard && source venv/bin/activate && pip install flask gunicorn requests pyyaml numpy"
+  
+  # gevent lets one worker serve many long-lived SSE streams
+  GUNICORN_WORKER_ARGS="--workers $DASHBOARD_WORKERS"
+  if [ "$DASHBOARD_WORKER_CLASS" = "gevent" ]; then
+    log_message "Installing gevent for the async dashboard worker class"
+    runuser -l $SYSTEM_USER -c "cd $BASE_DIR/dashboard && source venv/bin/activate && pip install gevent"
+    GUNICORN_WORKER_ARGS="$GUNICORN_WORKER_ARGS --worker-class gevent --worker-connections $DASHBOARD_WORKER_CONNECTIONS"
+  fi
+  
+  # MQTT client for push-based live updates and the ingestion service
+  if [ "$DASHBOARD_MQTT_LIVE" = "true" ] || [ "$INGEST_ENABLED" = "true" ]; then
+    log_message "Installing paho-mqtt for dashboard live updates / ingestion"
+    runuser -l $SYSTEM_USER -c "cd $BASE_DIR/dashboard && source venv/bin/activate && pip install paho-mqtt"
+  fi
   
   # Create static JS directory if it doesn't exist
   mkdir -p "$BASE_DIR/dashboard/static/js"
@@ -926,7 +948,7 @@ After=network.target
 User=$SYSTEM_USER
 Group=$SYSTEM_USER
 WorkingDirectory=$BASE_DIR/dashboard
-ExecStart=$BASE_DIR/dashboard/venv/bin/gunicorn --workers $DASHBOARD_WORKERS --bind 0.0.0.0:$DASHBOARD_PORT app:app
+ExecStart=$BASE_DIR/dashboard/venv/bin/gunicorn $GUNICORN_WORKER_ARGS --bind 0.0.0.0:$DASHBOARD_PORT app:app
 Restart=always
 RestartSec=5
 
@@ -939,9 +961,42 @@ EOF
   systemctl enable dashboard
   systemctl start dashboard
   
+  # Optional batched MQTT -> VictoriaMetrics ingestion
+  if [ "$INGEST_ENABLED" = "true" ]; then
+    setup_ingest
+  fi
+  
   log_message "Dashboard setup completed"
 }
 
+# Setup batched MQTT to VictoriaMetrics ingestion
+setup_ingest() {
+  log_message "Setting up MQTT ingestion service"
+  
+  cat > /etc/systemd/system/ingest.service << EOF
+[Unit]
+Description=${PROJECT_NAME} MQTT Ingestion
+After=network.target mosquitto.service victoriametrics.service
+
+[Service]
+User=$SYSTEM_USER
+Group=$SYSTEM_USER
+WorkingDirectory=$BASE_DIR/dashboard
+ExecStart=$BASE_DIR/dashboard/venv/bin/python ingest.py
+Restart=always
+RestartSec=5
+
+[Install]
+WantedBy=multi-user.target
+EOF
+
+  systemctl daemon-reload
+  systemctl enable ingest
+  systemctl start ingest
+  
+  log_message "Ingestion service started; disable the 'Send to VictoriaMetrics' node in Node-RED to avoid duplicate samples"
+}
+
 # Setup Nginx as a reverse proxy
 setup_nginx() {
   log_message "Setting up Nginx as a reverse proxy"
@@ -1257,6 +1312,14 @@ uninstall_dashboard() {
     rm -f /etc/systemd/system/dashboard.service
   fi
   
+  # The ingestion service runs from the dashboard directory too
+  if [ -f /etc/systemd/system/ingest.service ]; then
+    log_message "Removing MQTT ingestion service"
+    systemctl stop ingest || true
+    systemctl disable ingest || true
+    rm -f /etc/systemd/system/ingest.service
+  fi
+  
   # Optionally remove dashboard files on factory reset
   if [ "$FACTORY_RESET" = true ] && [ -d "$BASE_DIR/dashboard" ]; then
     log_message "Removing Dashboard files"
@@ -1745,6 +1808,9 @@ display_system_info() {
     echo "Dashboard: $DASHBOARD_STATUS"
     echo "Dashboard Port: $DASHBOARD_PORT"
     echo "Dashboard Web Access: http://$(hostname -I | awk '{print $1}'):$DASHBOARD_PORT"
+    if [ "$INGEST_ENABLED" = "true" ]; then
+      echo "MQTT Ingestion: $(systemctl is-active ingest || echo "not running")"
+    fi
   else
     echo "Dashboard: Not installed"
   fi